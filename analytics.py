@@ -0,0 +1,115 @@
+import threading
+
+### Default mark prices for PnL (diff(Buy/Sell_LastPx - MktPx))
+MARK_PRICES = {
+    'MSFT': 240,
+    'AAPL': 150,
+    'BAC': 32,
+    'IBM': 150,
+}
+
+class symbol_aggregate:
+    """
+    Running fill aggregates of one symbol
+    """
+    __slots__ = ("notional", "quantity", "buy_qty", "buy_notional", "sell_qty", "sell_notional", "short_qty", "short_notional")
+
+    def __init__(self):
+        self.notional = 0.0
+        self.quantity = 0.0
+        self.buy_qty = 0.0
+        self.buy_notional = 0.0
+        self.sell_qty = 0.0
+        self.sell_notional = 0.0
+        self.short_qty = 0.0
+        self.short_notional = 0.0
+
+    def position(self):
+        return self.buy_qty - self.sell_qty - self.short_qty
+
+    def vwap(self):
+        return self.notional / self.quantity if self.quantity else 0.0
+
+    def pnl(self, mark):
+        """
+        Sum over fills of (mark - LastPx) * LastShares for buys and (LastPx - mark) * LastShares for sells/shorts
+        """
+        return mark * self.position() - self.buy_notional + self.sell_notional + self.short_notional
+
+class live_analytics:
+    """
+    Per-symbol volume, VWAP, position and PnL updated in O(1) per fill
+    """
+    def __init__(self, marks=None):
+        self.marks = dict(MARK_PRICES if marks is None else marks)
+        self._lock = threading.Lock()
+        self._symbols = {}
+        self._orders = {}
+        self._cancels = 0
+
+    def onOrder(self, symbol, side):
+        """
+        Count a sent NewOrderSingle
+        """
+        with self._lock:
+            key = (symbol, side)
+            self._orders[key] = self._orders.get(key, 0) + 1
+
+    def onCancel(self):
+        """
+        Count a sent OrderCancelRequest
+        """
+        with self._lock:
+            self._cancels += 1
+
+    def onExecution(self, symbol, side, lastPx, lastShares):
+        """
+        Apply a non-rejected ExecutionReport (tags 55/54/31/32); reports without shares only register the symbol
+        """
+        with self._lock:
+            aggregate = self._symbols.get(symbol)
+            if aggregate is None:
+                aggregate = self._symbols[symbol] = symbol_aggregate()
+            if not lastShares:
+                return
+            value = lastPx * lastShares
+            aggregate.notional += value
+            aggregate.quantity += lastShares
+            if side == "1":
+                aggregate.buy_qty += lastShares
+                aggregate.buy_notional += value
+            elif side == "2":
+                aggregate.sell_qty += lastShares
+                aggregate.sell_notional += value
+            elif side == "3":
+                aggregate.short_qty += lastShares
+                aggregate.short_notional += value
+
+    def snapshot(self, marks=None):
+        """
+        Return current aggregates as plain dicts, PnL against marks (default: self.marks)
+        """
+        marks = self.marks if marks is None else marks
+        with self._lock:
+            symbols = {}
+            for symbol, aggregate in self._symbols.items():
+                mark = marks.get(symbol)
+                symbols[symbol] = {
+                    "volume": aggregate.notional,
+                    "quantity": aggregate.quantity,
+                    "vwap": aggregate.vwap(),
+                    "buy_qty": aggregate.buy_qty,
+                    "sell_qty": aggregate.sell_qty,
+                    "short_qty": aggregate.short_qty,
+                    "position": aggregate.position(),
+                    "mark": mark,
+                    ### No mark, no PnL, as in the pandas report
+                    "pnl": aggregate.pnl(mark) if mark is not None else 0.0,
+                }
+            return {
+                "orders": dict(self._orders),
+                "cancels": self._cancels,
+                "symbols": symbols,
+                "total_volume": sum(values["volume"] for values in symbols.values()),
+                "total_pnl": sum(values["pnl"] for values in symbols.values()),
+            }
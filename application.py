@@ -1,26 +1,170 @@
 import quickfix
+import quickfix42
 import time
 import datetime
 import random
-
-from helpers import parse_fix_message, setup_logger, log
+import threading
+import logging
+
+from helpers import fix_message_text, setup_logger, log, getSetting, copySessionID, loggerBacklog, priceRanges
+from pacing import token_bucket, in_flight_window
+from store import execution_store
+from analytics import live_analytics
+from orders import order_manager
+from extract import getMsgType, extractFields, extractEntries
+from latency import latency_recorder
+from templates import message_templates, timestamp_cache, formatNumber
+from stage import processing_stage
+from metrics import metrics_registry
+from marketdata import price_cache
+from risk import risk_cache
+
+### OrdStatus (tag 39) values after which no further ExecutionReports are expected for a ClOrdID
+TERMINAL_ORD_STATUS = {
+    quickfix.OrdStatus_FILLED,
+    quickfix.OrdStatus_DONE_FOR_DAY,
+    quickfix.OrdStatus_CANCELED,
+    quickfix.OrdStatus_REJECTED,
+    quickfix.OrdStatus_EXPIRED,
+}
+
+### Refusal reported by submit_batch/cancel_all when MAX_IN_FLIGHT stayed full (pre-trade refusals use the limit names of risk.py)
+REFUSED_IN_FLIGHT = "in_flight_window"
+### Refusal when quickfix would not send the message (e.g. the session is not logged on)
+REFUSED_SESSION = "session"
+
+### MDEntryType (tag 269) values requested by subscribeMarketData: bid, offer, trade
+MD_ENTRY_TYPES = (quickfix.MDEntryType_BID, quickfix.MDEntryType_OFFER, quickfix.MDEntryType_TRADE)
+
+### Store columns patched per send, in the order their values are passed to appendPrepared
+### Limit price range (low, high) per symbol for simulated orders, PRICE_RANGES adds or overrides symbols
+PRICE_RANGES = {
+    "MSFT": (100, 400),
+    "BAC": (0, 100),
+    "AAPL": (100, 300),
+}
+
+NEW_ORDER_TAGS = ("11", "38", "44", "60") #ClOrdID, OrderQty, Price, TransactTime
+CANCEL_TAGS = ("11", "41", "60", "37") #ClOrdID, OrigClOrdID, TransactTime, OrderID
 
 class fix_pricing(quickfix.Application):
-    def __init__(self, session, start_timestamp=datetime.datetime.utcnow()):
+    def __init__(self, session, start_timestamp=datetime.datetime.utcnow(), settings=None):
         super().__init__()
+        ### LOG_MODE=queue moves formatting and disk I/O off the QuickFIX socket thread
+        ### LOG_RAW=Y keeps messages SOH-separated, LOG_LEVEL=DEBUG adds per-order records, LOG_SAMPLE_<LEVEL> keeps a fraction of records per level
         self.logger = setup_logger(
             name="logger",
             log_file=f"Log/{start_timestamp}.log",
-            format_str='%(asctime)s %(levelname)s %(message)s'
+            format_str='%(asctime)s %(levelname)s %(message)s',
+            level=getattr(logging, getSetting(settings, "LOG_LEVEL", "INFO")),
+            queued=getSetting(settings, "LOG_MODE", "sync") == "queue",
+            sample_rates={
+                logging.DEBUG: getSetting(settings, "LOG_SAMPLE_DEBUG", 1.0, float),
+                logging.INFO: getSetting(settings, "LOG_SAMPLE_INFO", 1.0, float),
+            },
         )
+        self.message_text = str if getSetting(settings, "LOG_RAW", "N") == "Y" else fix_message_text
         self.session = session
         self.sessionID = None
         self.connected = False
+        self.logged_on = threading.Event()
+        ### perf_counter time of the last logon, see STARTUP_PROFILE in client.py
+        self.logon_time = None
+
+        ### Simulation settings, read from [DEFAULT] section of config.cfg
+        self.iterations = getSetting(settings, "ITERATIONS", 1000, int)
+        self.cancel_probability = getSetting(settings, "CANCEL_PROBABILITY", 0.05, float)
+        self.order_rate = getSetting(settings, "ORDER_RATE", 0, float)
+        self.rate_profile = getSetting(settings, "RATE_PROFILE", "steady")
+        self.burst_size = getSetting(settings, "BURST_SIZE", 1, int)
+        self.ramp_seconds = getSetting(settings, "RAMP_SECONDS", 0, float)
+        self.logon_timeout = getSetting(settings, "LOGON_TIMEOUT", 30, float)
+        self.order_timeout = getSetting(settings, "ORDER_TIMEOUT", 30000, float) / 1000
+        ### MAX_IN_FLIGHT caps orders and cancels sent but not answered yet, senders wait up to IN_FLIGHT_TIMEOUT (ms) for a slot
+        self.max_in_flight = getSetting(settings, "MAX_IN_FLIGHT", 0, int)
+        self.in_flight_timeout = getSetting(settings, "IN_FLIGHT_TIMEOUT", 30000, float) / 1000
+        ### Symbols traded and ClOrdID prefix, set per worker when sessions are scaled out (see scaleout.py)
+        self.symbols = getSetting(settings, "SYMBOLS", "MSFT,BAC,AAPL").split(",")
+        self.clordid_prefix = getSetting(settings, "CLORDID_PREFIX", "")
+        ### run() only trades symbols with a price range
+        self.price_ranges = {**PRICE_RANGES, **getSetting(settings, "PRICE_RANGES", {}, priceRanges)}
+        unpriced = [symbol for symbol in self.symbols if symbol not in self.price_ranges]
+        if unpriced:
+            log(self.logger, f"No price range for {','.join(unpriced)}, add them to PRICE_RANGES (SYMBOL:low-high); not trading them", level="ERROR", _print=True)
+            self.symbols = [symbol for symbol in self.symbols if symbol in self.price_ranges]
+        ### MARKET_DATA=Y subscribes to top of book of SYMBOLS after logon, PnL is marked to it (needs UseDataDictionary=Y to keep W/X groups in order)
+        self.market_data = getSetting(settings, "MARKET_DATA", "N") == "Y"
+        ### Pre-trade limits per symbol checked before every NewOrderSingle, 0 = off (see risk.py)
+        self.risk = risk_cache(
+            max_position=getSetting(settings, "MAX_POSITION", 0, float),
+            max_open_notional=getSetting(settings, "MAX_OPEN_NOTIONAL", 0, float),
+            max_order_rate=getSetting(settings, "MAX_ORDER_RATE", 0, float),
+        )
 
         self.order_index = 0
+        self.md_req_index = 0
+
+        self._Market_Data = execution_store()
+        self.analytics = live_analytics()
+        self.latency = latency_recorder()
+        self.prices = price_cache()
+        self._Market_Orders = order_manager()
+        ### Received messages are processed off the QuickFIX socket thread, STAGE_CAPACITY=0 processes them inline
+        self.stage = processing_stage(
+            self.processRecord,
+            capacity=getSetting(settings, "STAGE_CAPACITY", 65536, int),
+            overflow=getSetting(settings, "STAGE_OVERFLOW", "block"),
+            logger=self.logger,
+        )
+        self.stage.start()
+        ### Pre-built order messages and TransactTime formatter for the send path
+        self.templates = message_templates(self._Market_Data)
+        self.timestamps = timestamp_cache()
+
+        ### ClOrdIDs awaiting a terminal response, mapped to their send time
+        self._Outstanding = {}
+        self._Outstanding_Condition = threading.Condition()
+
+        ### Pacing shared by run(), submit_batch() and cancel_all(); ORDER_RATE <= 0 sends as fast as the loop goes
+        self.bucket = token_bucket(
+            rate=self.order_rate,
+            profile=self.rate_profile,
+            burst_size=self.burst_size,
+            ramp_seconds=self.ramp_seconds,
+        )
+        self.window = in_flight_window(self.max_in_flight)
+        ### Held by sendNewOrderSingle/sendOrderCancelRequest: reused template messages, genClOrdID and throughput counters
+        ### are not thread-safe, so senders on several threads (run, submit_batch, cancel_all) go one at a time
+        self._send_lock = threading.RLock()
+
+        ### Throughput counters (perf_counter timestamps) for send and ack rates, acks = first ExecutionReport per NewOrderSingle,
+        ### execution_reports = every ExecutionReport (acks, fills, cancel acks), refused = sends turned away by a full window,
+        ### risk_refused = NewOrderSingles over a pre-trade limit
+        self.throughput = {
+            "orders": 0, "acks": 0, "execution_reports": 0, "refused": 0, "risk_refused": 0,
+            "first_send": None, "last_send": None, "last_ack": None, "last_execution_report": None,
+        }
 
-        self._Market_Data = []
-        self._Market_Orders = {}
+        ### Live metrics (see metrics.py), served by client.py on METRICS_PORT and printed every METRICS_INTERVAL
+        self.metrics = metrics_registry()
+        self.messages = self.metrics.counter("fix_messages_total", "FIX messages by direction and MsgType", ("direction", "msg_type"))
+        self.orders_sent = self.metrics.counter("fix_orders_sent_total", "NewOrderSingles sent")
+        self.cancels_sent = self.metrics.counter("fix_cancels_sent_total", "OrderCancelRequests sent")
+        self.acks = self.metrics.counter("fix_acks_total", "NewOrderSingles answered by a first ExecutionReport")
+        self.orders_refused = self.metrics.counter("fix_orders_refused_total", "Sends refused by a full in-flight window")
+        self.risk_refused = self.metrics.counter("fix_risk_refused_total", "NewOrderSingles refused by a pre-trade limit", ("limit",))
+        self.rejects = self.metrics.counter("fix_rejects_total", "Rejected orders (ExecutionReport 39=8) and session Rejects (35=3)", ("msg_type",))
+        self.cancel_rejects = self.metrics.counter("fix_cancel_rejects_total", "OrderCancelRejects received")
+        self.metrics.gauge("fix_session_logged_on", "1 while the session is logged on", lambda: int(self.logged_on.is_set()))
+        self.metrics.gauge("fix_in_flight", "Orders and cancels sent but not answered", lambda: len(self.window))
+        self.metrics.gauge("fix_outstanding_orders", "ClOrdIDs awaiting a terminal response", lambda: len(self._Outstanding))
+        self.metrics.gauge("fix_live_orders", "Working orders without a cancel in flight", self._Market_Orders.liveCount)
+        self.metrics.gauge("fix_stage_depth", "Received messages queued for processing", self.stage.depth)
+        self.metrics.gauge("fix_stage_dropped_total", "Received messages dropped by a full processing stage", lambda: self.stage.dropped, kind="counter")
+        self.metrics.gauge("fix_log_backlog", "Log records queued but not written", lambda: loggerBacklog(self.logger))
+        self.metrics.gauge("fix_store_rows", "Rows buffered in the market data store", lambda: len(self._Market_Data))
+        self.metrics.gauge("fix_market_data_updates_total", "MarketDataSnapshotFullRefresh and IncrementalRefresh messages applied", lambda: self.prices.updates, kind="counter")
+        self.metrics.gauge("fix_pnl", "Total PnL marked to the current top of book", lambda: self.snapshot()["total_pnl"])
 
     #####################################################
     # QuickFIX Application Methods
@@ -29,15 +173,17 @@ class fix_pricing(quickfix.Application):
         """
         Called when application is initialized
         """
-        self.sessionID = sessionID
+        self.sessionID = copySessionID(sessionID)
         log(self.logger, f"[onCreate] Application created with sessionID = {sessionID}")
 
     def onLogon(self, sessionID):
         """
         Called on session logOn
         """
+        self.logon_time = time.perf_counter()
         log(self.logger, "[onLogon] Logon Successful")
         self.connected = True
+        self.logged_on.set()
 
     def onLogout(self, sessionID):
         """
@@ -45,26 +191,28 @@ class fix_pricing(quickfix.Application):
         """
         log(self.logger, "[onLogout] Logout Successful")
         self.connected = False
+        self.logged_on.clear()
 
     def onMessage(self, message, sessionID):
-        log(self.logger, f"[onMessage] Message = {parse_fix_message(message)}")
+        log(self.logger, "[onMessage] Message = %s", self.message_text(message.toString()))
 
     def toAdmin(self, message, sessionID):
         """
         Process outgoing session-level messages (logon, logout, heartbeat) before they are sent
         """
-        log(self.logger, f"[toAdmin] {parse_fix_message(message)}")
+        raw = message.toString()
+        log(self.logger, "[toAdmin] %s", self.message_text(raw))
 
-        msgType = quickfix.MsgType()
-        message.getHeader().getField(msgType)
+        msgType = getMsgType(raw)
+        self.messages.labels("out", msgType).inc()
 
-        if (msgType.getValue() == quickfix.MsgType_Logon): 
+        if (msgType == quickfix.MsgType_Logon): 
             log(self.logger, f"[toAdmin] Sending LogOn Request")
 
-        elif (msgType.getValue() == quickfix.MsgType_Logout): 
+        elif (msgType == quickfix.MsgType_Logout): 
             log(self.logger, f"[toAdmin] Sending LogOut Request")
         
-        elif (msgType.getValue() == quickfix.MsgType_Heartbeat):
+        elif (msgType == quickfix.MsgType_Heartbeat):
             log(self.logger, f"[toAdmin] Sending Heartbeat")
         
         return
@@ -73,56 +221,24 @@ class fix_pricing(quickfix.Application):
         """
         Process incoming session-level messages (logon, logout, heartbeat)
         """
-        log(self.logger, f"[fromAdmin] {parse_fix_message(message)}")
+        raw = message.toString()
+        log(self.logger, "[fromAdmin] %s", self.message_text(raw))
 
-        msgType = quickfix.MsgType()
-        message.getHeader().getField(msgType)
+        msgType = getMsgType(raw)
+        self.messages.labels("in", msgType).inc()
 
-        if (msgType.getValue() == quickfix.MsgType_Logon): 
+        if (msgType == quickfix.MsgType_Logon): 
             log(self.logger, f"[fromAdmin] Logon Successful")
 
-        elif (msgType.getValue() == quickfix.MsgType_Logout): 
+        elif (msgType == quickfix.MsgType_Logout): 
             log(self.logger, f"[fromAdmin] Logout Successful")
         
-        elif (msgType.getValue() == quickfix.MsgType_Heartbeat):
+        elif (msgType == quickfix.MsgType_Heartbeat):
             log(self.logger, f"[fromAdmin] Heartbeat Successful")
 
-        ### Process Reject messages (tag 35=3)
-        elif (msgType.getValue() == quickfix.MsgType_Reject):
-            ClOrdID = quickfix.ClOrdID() #11
-            Text = quickfix.Text() #58
-            RefSeqNum = quickfix.RefSeqNum() #45
-            RefTagID = quickfix.RefTagID() #371
-            RefMsgType = quickfix.RefMsgType() #372
-            SessionRejectReason = quickfix.SessionRejectReason() #373
-
-            ### Get SendingTime (tag 52)
-            sendingTime = quickfix.SendingTime()
-            message.getHeader().getField(sendingTime)
-            sendingTime = sendingTime.getString()
-
-            ### Get MsgSeqNum (tag 34)
-            msgSeqNum = quickfix.MsgSeqNum()
-            message.getHeader().getField(msgSeqNum)
-            msgSeqNum = msgSeqNum.getValue()
-
-            _market_data_update = {
-                'type': "receive",
-                '35': msgType,
-                '52': sendingTime,
-                '34': msgSeqNum,
-            }
-    
-            for metric in [ClOrdID, Text, RefSeqNum, RefTagID, RefMsgType, SessionRejectReason]:
-                if message.isSetField(metric):
-                    message.getField(metric)
-                    _market_data_update.update({
-                        str(metric.getField()): metric.getValue()
-                    })
-
-            self._Market_Data.append(_market_data_update)
-
-            log(self.logger, f"Received Reject for ClOrdID {ClOrdID.getValue()} with Reason {Text}", level="DEBUG")
+        ### Process Reject messages (tag 35=3) on the processing stage
+        elif (msgType == quickfix.MsgType_Reject):
+            self.stage.push((msgType, raw, None))
         
         return
     
@@ -130,226 +246,436 @@ class fix_pricing(quickfix.Application):
         """
         Process outgoing application-level messages before they are sent.
         """
-        log(self.logger, f"[toApp] {parse_fix_message(message)}")
+        raw = message.toString()
+        log(self.logger, "[toApp] %s", self.message_text(raw))
+        self.messages.labels("out", getMsgType(raw)).inc()
 
     def fromApp(self, message, sessionID):
         """
         Handle incoming application-level messages.
+        Only the raw message and its receive time are handed to the processing stage (see processRecord), so the socket thread returns fast
         """
-        log(self.logger, f"[fromApp] {parse_fix_message(message)}")
+        received_ns = time.perf_counter_ns()
+        raw = message.toString()
+        log(self.logger, "[fromApp] %s", self.message_text(raw))
 
         ### Get MsgType (tag 35)
-        msgType = quickfix.MsgType()
-        message.getHeader().getField(msgType)
-        msgType = msgType.getValue()
-        
-        ### Get SendingTime (tag 52)
-        sendingTime = quickfix.SendingTime()
-        message.getHeader().getField(sendingTime)
-        sendingTime = sendingTime.getString()
-
-        ### Get MsgSeqNum (tag 34)
-        msgSeqNum = quickfix.MsgSeqNum()
-        message.getHeader().getField(msgSeqNum)
-        msgSeqNum = msgSeqNum.getValue()
+        msgType = getMsgType(raw)
+        self.messages.labels("in", msgType).inc()
 
-        # Process ExecutionReport messages (tag 35=8)
         if msgType == quickfix.MsgType_ExecutionReport:
-            ClOrdID = quickfix.ClOrdID() #11
-            OrdStatus = quickfix.OrdStatus() #39
-            ExecType = quickfix.ExecType() #150
-            OrderID = quickfix.OrderID() #37
-            Side = quickfix.Side() #54
-            Symbol = quickfix.Symbol() #55
-            OrdType = quickfix.OrdType() #40
-            Text = quickfix.Text() #58
-
-            OrderQty = quickfix.OrderQty() #38
-            Price = quickfix.Price() #44
-            LastPx = quickfix.LastPx() #31
-            LastShares = quickfix.LastShares() #32
-
-            _market_data_update = {
-                'type': "receive",
-                '35': msgType,
-                '52': sendingTime,
-                '34': msgSeqNum,
-            }
-    
-            for metric in [ClOrdID, OrdStatus, ExecType, OrderID, Side, Symbol, OrdType, Text, OrderQty, Price, LastPx, LastShares]:
-                if message.isSetField(metric):
-                    message.getField(metric)
-                    _market_data_update.update({
-                        str(metric.getField()): metric.getValue()
-                    })
+            self.throughput["execution_reports"] += 1
+            self.throughput["last_execution_report"] = time.perf_counter()
+            self.stage.push((msgType, raw, received_ns))
+
+        elif msgType == quickfix.MsgType_OrderCancelReject:
+            self.stage.push((msgType, raw, received_ns))
+
+        elif msgType in (quickfix.MsgType_MarketDataSnapshotFullRefresh, quickfix.MsgType_MarketDataIncrementalRefresh):
+            self.stage.push((msgType, raw, received_ns))
+
+        elif msgType == quickfix.MsgType_MarketDataRequestReject:
+            log(self.logger, "[fromApp] MarketDataRequest rejected, PnL stays marked to fallback prices", level="WARNING", _print=True)
+        
+        return
 
-            self._Market_Data.append(_market_data_update)
+    #####################################################
+    # Processing stage, runs on the stage's consumer thread
 
-            if (ClOrdID.getValue() in self._Market_Orders):
-                if ('37' not in self._Market_Orders[ClOrdID.getValue()]):
-                    self._Market_Orders[ClOrdID.getValue()].update({'37': OrderID.getValue()})
+    def processRecord(self, record):
+        """
+        Apply one (msgType, raw, received_ns) record pushed by fromApp/fromAdmin
+        Fields are read in one pass over the raw message (see extract.py), typed values go straight to the store
+        """
+        msgType, raw, received_ns = record
+
+        # Market data (tag 35=W/X) only updates the price cache, it is not stored with orders and executions
+        if msgType == quickfix.MsgType_MarketDataIncrementalRefresh:
+            sendingTime, entries = extractEntries(raw, msgType)
+            self.prices.onIncremental(entries, sendingTime)
+            return
+        if msgType == quickfix.MsgType_MarketDataSnapshotFullRefresh:
+            sendingTime, entries = extractEntries(raw, msgType)
+            if entries:
+                self.prices.onSnapshot(entries[0]["55"], entries, sendingTime)
+            return
+
+        _market_data_update = extractFields(raw, msgType)
+        _market_data_update['type'] = "receive"
+        self._Market_Data.append(_market_data_update)
 
-            log(self.logger, f"[fromApp] Received ExecutionReport for ClOrdID {ClOrdID.getValue()} with Order Status {OrdStatus.getValue()}", level="DEBUG")
+        # Process ExecutionReport messages (tag 35=8)
+        if msgType == quickfix.MsgType_ExecutionReport:
+            clOrdID = _market_data_update.get('11')
+            ordStatus = _market_data_update.get('39')
+            self.window.release(clOrdID)
+
+            if ordStatus == quickfix.OrdStatus_REJECTED:
+                self.rejects.labels(msgType).inc()
+            else:
+                self.analytics.onExecution(
+                    _market_data_update.get('55'),
+                    _market_data_update.get('54'),
+                    _market_data_update.get('31', 0),
+                    _market_data_update.get('32', 0),
+                )
+
+            order_ = self._Market_Orders.onExecutionReport(
+                clOrdID,
+                _market_data_update.get('41'),
+                _market_data_update.get('37'),
+                ordStatus,
+                _market_data_update.get('150'),
+            )
+            if order_ is not None:
+                self.recordLatency(order_, clOrdID, _market_data_update, received_ns)
+                ### Fills move open exposure into the position, a terminal status releases what is left open
+                lastShares = _market_data_update.get('32')
+                if lastShares:
+                    self.risk.onFill(order_.clOrdID, lastShares)
+                if ordStatus in TERMINAL_ORD_STATUS:
+                    self.risk.onDone(order_.clOrdID)
+
+            if ordStatus in TERMINAL_ORD_STATUS:
+                self.completeOrders(clOrdID, _market_data_update.get('41'))
+
+            log(self.logger, "[fromApp] Received ExecutionReport for ClOrdID %s with Order Status %s", clOrdID, ordStatus, level="DEBUG")
        
         # Process OrderCancelReject messages (tag 35=9)
-        if msgType == quickfix.MsgType_OrderCancelReject:
-            ClOrdID = quickfix.ClOrdID() #11
-            OrderID = quickfix.OrderID() #37
-            OrdStatus = quickfix.OrdStatus() #39
-            OrigClOrdID = quickfix.OrigClOrdID() #41
-            Text = quickfix.Text() #58
-
-            _market_data_update = {
-                'type': "receive",
-                '35': msgType,
-                '52': sendingTime,
-                '34': msgSeqNum,
-            }
-    
-            for metric in [ClOrdID, OrdStatus, OrderID, Text, OrigClOrdID]:
-                if message.isSetField(metric):
-                    message.getField(metric)
-                    _market_data_update.update({
-                        str(metric.getField()): metric.getValue()
-                    })
+        elif msgType == quickfix.MsgType_OrderCancelReject:
+            clOrdID = _market_data_update.get('11')
+            self.window.release(clOrdID)
+            self.cancel_rejects.inc()
+            order_ = self._Market_Orders.onCancelReject(clOrdID)
+            if order_ is not None and order_.cancel_sent_ns is not None:
+                self.latency.record(order_.symbol, "cancel_reject", received_ns - order_.cancel_sent_ns)
+            self.completeOrders(clOrdID)
+
+            log(self.logger, "[fromApp] Received OrderCancelReject for ClOrdID %s with Reason %s", clOrdID, _market_data_update.get('58'), level="DEBUG")
+
+        # Process Reject messages (tag 35=3)
+        elif msgType == quickfix.MsgType_Reject:
+            self.rejects.labels(msgType).inc()
+            log(self.logger, "Received Reject for ClOrdID %s with Reason %s", _market_data_update.get('11'), _market_data_update.get('58'), level="DEBUG")
+
+    def close(self):
+        """
+        Process every queued record and stop the processing stage
+        """
+        self.stage.close()
 
-            self._Market_Data.append(_market_data_update)
+    #####################################################
+    def recordLatency(self, order_, clOrdID, values, received_ns):
+        """
+        Record send -> first ExecutionReport (ack), send -> first fill (fill) and cancel -> cancel ack (cancel)
+        The first ExecutionReport of an order is also counted as its ack (throughput["acks"], fix_acks_total)
+        """
+        if clOrdID != order_.clOrdID:
+            ### Response to an OrderCancelRequest
+            if values.get('150') == quickfix.ExecType_CANCELED and order_.cancel_sent_ns is not None:
+                self.latency.record(order_.symbol, "cancel", received_ns - order_.cancel_sent_ns)
+            return
+        if not order_.acked:
+            order_.acked = True
+            self.throughput["acks"] += 1
+            self.throughput["last_ack"] = received_ns / 1e9
+            self.acks.inc()
+            if order_.sent_ns is not None:
+                self.latency.record(order_.symbol, "ack", received_ns - order_.sent_ns)
+        if order_.sent_ns is None:
+            return
+        if values.get('32') and not order_.filled:
+            order_.filled = True
+            self.latency.record(order_.symbol, "fill", received_ns - order_.sent_ns)
 
-            log(self.logger, f"[fromApp] Received OrderCancelReject for ClOrdID {ClOrdID.getValue()} with Reason {Text}", level="DEBUG")
-        
-        return
+    #####################################################
+    def trackOrder(self, clOrdID):
+        """
+        Mark clOrdID as awaiting a terminal response
+        """
+        with self._Outstanding_Condition:
+            self._Outstanding[clOrdID] = time.monotonic()
+
+    def completeOrders(self, *clOrdIDs):
+        """
+        Remove clOrdIDs that reached a terminal response, wake run() once nothing is outstanding
+        """
+        with self._Outstanding_Condition:
+            for clOrdID in clOrdIDs:
+                self._Outstanding.pop(clOrdID, None)
+            if not self._Outstanding:
+                self._Outstanding_Condition.notify_all()
+
+    def waitOutstanding(self):
+        """
+        Block until every outstanding ClOrdID is terminal or older than order_timeout
+        Returns number of ClOrdIDs that timed out
+        """
+        with self._Outstanding_Condition:
+            while self._Outstanding:
+                remaining = max(self._Outstanding.values()) + self.order_timeout - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._Outstanding_Condition.wait(remaining)
+            return len(self._Outstanding)
 
     #####################################################
     def genClOrdID(self):
         """
-        Generate clOrdID
+        Generate clOrdID, prefixed with CLORDID_PREFIX so workers never collide
         """
         self.order_index += 1
-        clOrdID = f"{self.order_index:08d}"
+        clOrdID = f"{self.clordid_prefix}{self.order_index:08d}"
         return clOrdID
 
     #####################################################
-    def sendNewOrderSingle(self, side, symbol, orderqty, price, ordtype, handl_inst):
+    def sendNewOrderSingle(self, side, symbol, orderqty, price, ordtype, handl_inst, clOrdID=None, block=True):
         """
         Create New Order (tag 35=D)
+        Constant fields come from a cached template (see templates.py), only ClOrdID, qty, price and TransactTime are set
+        clOrdID: use a given ClOrdID (e.g. when replaying a session) instead of generating one
+        block: wait for an in-flight slot (MAX_IN_FLIGHT), otherwise give up at once
+        Returns the ClOrdID sent, None when a pre-trade limit (see risk.py), the in-flight window or the session refused it
         """
-        message = quickfix.Message()
-        header = message.getHeader()
-
-        header.setField(quickfix.MsgType(quickfix.MsgType_NewOrderSingle))
-        
-        ClOrdID = self.genClOrdID()
-        now = datetime.datetime.utcnow().strftime("%Y%m%d-%H:%M:%S.%f")[:-3]
-        # Set unique cl0rdID for this request
-        message.setField(quickfix.ClOrdID(ClOrdID)) #11
-        message.setField(quickfix.Side(side)) #54 = 1 BUY 
-        message.setField(quickfix.Symbol(symbol)) #55 = MSFT
-        message.setField(quickfix.OrderQty(orderqty)) #38 = 1000
-        if ordtype == "2":
-            message.setField(quickfix.Price(price)) #44 only if ordtype=2, Limit Order
-        message.setField(quickfix.OrdType(ordtype)) #40=2 Limit Order 
-        message.setField(quickfix.HandlInst(handl_inst)) #21 = 3
-        message.setField(quickfix.TimeInForce('0')) #59
-        message.setField(quickfix.Text("NewOrderSingle")) #58
-        trstime = quickfix.TransactTime()
-        trstime.setString(now)
-        message.setField(trstime)
-
-        self.session.sendToTarget(message, self.sessionID)
+        return self._sendNewOrderSingle(side, symbol, orderqty, price, ordtype, handl_inst, clOrdID, block)[0]
 
-        log(self.logger, f"[sendNewOrderSingle] {ClOrdID}: New Order for {symbol}", level="DEBUG")
-
-        _new_order = {
-            "type": "send",
-            "11": ClOrdID, #ClOrdID
-            "54": side, #Side
-            "55": symbol, #Symbol
-            "38": orderqty, #OrderQty
-            "44": price, #Price
-            "40": ordtype, #OrdType
-            "58": "NewOrderSingle", #Text
-            "60": now, #TransactTime
-        }
-        self._Market_Data.append(_new_order)
-
-        self._Market_Orders[ClOrdID] = _new_order
+    def _sendNewOrderSingle(self, side, symbol, orderqty, price, ordtype, handl_inst, clOrdID=None, block=True):
+        """
+        sendNewOrderSingle, returns (ClOrdID, None) when sent, (None, refusal) otherwise:
+        a pre-trade limit (risk.MAX_POSITION, MAX_OPEN_NOTIONAL, MAX_ORDER_RATE), REFUSED_IN_FLIGHT or REFUSED_SESSION
+        A refused order gives back whatever it reserved (risk exposure and rate token, in-flight slot)
+        Runs under the send lock: templates, ClOrdID generation and throughput counters are shared by every sender
+        """
+        with self._send_lock:
+            template = self.templates.newOrderSingle(symbol, side, ordtype, handl_inst)
+            message = template.message
+
+            ClOrdID = clOrdID or self.genClOrdID()
+            ### Market orders are booked at the current mark
+            limit = self.risk.reserve(ClOrdID, symbol, side, orderqty, price if ordtype == "2" else self.prices.mark(symbol) or price)
+            if limit is not None:
+                self.throughput["risk_refused"] += 1
+                self.risk_refused.labels(limit).inc()
+                log(self.logger, "[sendNewOrderSingle] %s: New Order for %s refused by %s", ClOrdID, symbol, limit, level="DEBUG")
+                return None, limit
+            if not self.acquireSlot(ClOrdID, block):
+                self.risk.release(ClOrdID)
+                return None, REFUSED_IN_FLIGHT
+            now = self.timestamps.now()
+            # Set unique cl0rdID for this request
+            message.setField(11, ClOrdID) #11
+            message.setField(38, formatNumber(orderqty)) #38 = 1000
+            if ordtype == "2":
+                message.setField(44, formatNumber(price)) #44 only if ordtype=2, Limit Order
+            message.setField(60, now) #60
+
+            self.trackOrder(ClOrdID)
+            self._Market_Orders.add(ClOrdID, symbol, side, orderqty, price, ordtype, now, sent_ns=time.perf_counter_ns())
+            if not self.session.sendToTarget(message, self.sessionID):
+                ### Nothing went out: undo the slot, tracking and pre-trade reservation
+                self.window.release(ClOrdID)
+                self.completeOrders(ClOrdID)
+                self._Market_Orders.discard(ClOrdID)
+                self.risk.release(ClOrdID)
+                log(self.logger, "[sendNewOrderSingle] %s: New Order for %s not sent, session refused it", ClOrdID, symbol, level="WARNING")
+                return None, REFUSED_SESSION
+
+            log(self.logger, "[sendNewOrderSingle] %s: New Order for %s", ClOrdID, symbol, level="DEBUG")
+
+            ### type, Side, Symbol, OrdType and Text are interned in the template
+            self._Market_Data.appendPrepared(template.record, NEW_ORDER_TAGS, (ClOrdID, orderqty, price, now))
+
+            self.analytics.onOrder(symbol, side)
+            self.orders_sent.inc()
+
+            self.throughput["orders"] += 1
+            self.throughput["last_send"] = time.perf_counter()
+            if self.throughput["first_send"] is None:
+                self.throughput["first_send"] = self.throughput["last_send"]
+            return ClOrdID, None
 
     #####################################################
-    def sendOrderCancelRequest(self, origClOrdID):
+    def sendOrderCancelRequest(self, origClOrdID, clOrdID=None, block=True):
         """
         Cancel Order (tag 35=F)
+        clOrdID: use a given ClOrdID (e.g. when replaying a session) instead of generating one
+        block: wait for an in-flight slot (MAX_IN_FLIGHT), otherwise give up at once
+        Returns the ClOrdID sent, None when the in-flight window or the session refused it
         """
-        message = quickfix.Message()
-        header = message.getHeader()
+        return self._sendOrderCancelRequest(origClOrdID, clOrdID, block)[0]
 
-        header.setField(quickfix.MsgType(quickfix.MsgType_OrderCancelRequest))
-        
-        order_details = self._Market_Orders[origClOrdID]
-        side = order_details['54']
-        symbol = order_details['55']
-        trstime = order_details['60']
-        orderID = order_details['37'] if '37' in order_details else None
-
-        ClOrdID = self.genClOrdID()
-        # Set unique cl0rdID for this request
-        message.setField(quickfix.ClOrdID(ClOrdID)) #11
-        message.setField(quickfix.OrigClOrdID(origClOrdID)) #41
-        message.setField(quickfix.Side(side)) #54 = 1 BUY 
-        message.setField(quickfix.Symbol(symbol)) #55 = MSFT
-        _trstime = quickfix.TransactTime()
-        _trstime.setString(trstime)
-        message.setField(_trstime) #60
-        message.setField(quickfix.Text("OrderCancelRequest")) # 58
-        if orderID:
-            message.setField(quickfix.OrderID(orderID)) #37
+    def _sendOrderCancelRequest(self, origClOrdID, clOrdID=None, block=True):
+        """
+        sendOrderCancelRequest, returns (ClOrdID, None) when sent, (None, REFUSED_IN_FLIGHT or REFUSED_SESSION) otherwise
+        Runs under the send lock, like _sendNewOrderSingle; a refused cancel leaves the original order live again
+        """
+        with self._send_lock:
+            order_details = self._Market_Orders.get(origClOrdID)
+            side = order_details.side
+            symbol = order_details.symbol
+            trstime = order_details.transactTime
+            orderID = order_details.orderID
+
+            template = self.templates.orderCancelRequest(symbol, side)
+            message = template.message
+
+            ClOrdID = clOrdID or self.genClOrdID()
+            if not self.acquireSlot(ClOrdID, block):
+                return None, REFUSED_IN_FLIGHT
+            # Set unique cl0rdID for this request
+            message.setField(11, ClOrdID) #11
+            message.setField(41, origClOrdID) #41
+            message.setField(60, trstime) #60
+            if orderID:
+                message.setField(37, orderID) #37
+            else:
+                message.removeField(37)
+
+            self.trackOrder(ClOrdID)
+            self._Market_Orders.onCancelSent(ClOrdID, origClOrdID, sent_ns=time.perf_counter_ns())
+            if not self.session.sendToTarget(message, self.sessionID):
+                ### Nothing went out: undo the slot and tracking, the original order is live again as after a cancel reject
+                self.window.release(ClOrdID)
+                self.completeOrders(ClOrdID)
+                self._Market_Orders.onCancelReject(ClOrdID)
+                log(self.logger, "[sendOrderCancelRequest] %s: Cancel Order for %s not sent, session refused it", ClOrdID, origClOrdID, level="WARNING")
+                return None, REFUSED_SESSION
+
+            log(self.logger, "[sendOrderCancelRequest] %s: Cancel Order for %s", ClOrdID, origClOrdID, level="DEBUG")
+
+            self._Market_Data.appendPrepared(template.record, CANCEL_TAGS, (ClOrdID, origClOrdID, trstime, orderID))
+            self.analytics.onCancel()
+            self.cancels_sent.inc()
+            return ClOrdID, None
+
+    #####################################################
+    def subscribeMarketData(self, symbols=None, subscribe=True):
+        """
+        MarketDataRequest (tag 35=V) for top of book (bid, offer, trade) of symbols (default SYMBOLS), snapshot plus incremental updates
+        subscribe=False sends the matching unsubscribe
+        Returns the MDReqID
+        """
+        self.md_req_index += 1
+        mdReqID = f"{self.clordid_prefix}MD{self.md_req_index:04d}"
+
+        message = quickfix42.MarketDataRequest()
+        message.setField(quickfix.MDReqID(mdReqID)) #262
+        message.setField(quickfix.SubscriptionRequestType(quickfix.SubscriptionRequestType_SNAPSHOT_PLUS_UPDATES if subscribe else quickfix.SubscriptionRequestType_DISABLE_PREVIOUS_SNAPSHOT_PLUS_UPDATE_REQUEST)) #263
+        message.setField(quickfix.MarketDepth(1)) #264 top of book
+        message.setField(quickfix.MDUpdateType(quickfix.MDUpdateType_INCREMENTAL_REFRESH)) #265
+        for entryType in MD_ENTRY_TYPES:
+            group = quickfix42.MarketDataRequest.NoMDEntryTypes()
+            group.setField(quickfix.MDEntryType(entryType)) #269
+            message.addGroup(group)
+        for symbol in symbols or self.symbols:
+            group = quickfix42.MarketDataRequest.NoRelatedSym()
+            group.setField(quickfix.Symbol(symbol)) #55
+            message.addGroup(group)
 
         self.session.sendToTarget(message, self.sessionID)
+        log(self.logger, "[subscribeMarketData] %s: %s market data for %s", mdReqID, "Subscribe" if subscribe else "Unsubscribe", ",".join(symbols or self.symbols))
+        return mdReqID
 
-        log(self.logger, f"[sendOrderCancelRequest] {ClOrdID}: Cancel Order for {origClOrdID}", level="DEBUG")
+    #####################################################
+    def acquireSlot(self, clOrdID, block=True):
+        """
+        Take an in-flight slot for clOrdID, counting the send as refused when the window stays full
+        """
+        if self.window.acquire(clOrdID, self.in_flight_timeout if block else 0):
+            return True
+        self.throughput["refused"] += 1
+        self.orders_refused.inc()
+        log(self.logger, "In-flight window full (%s), %s not sent", self.max_in_flight, clOrdID, level="DEBUG")
+        return False
+
+    def inFlight(self):
+        """
+        Number of orders and cancels sent but not answered yet
+        """
+        return len(self.window)
 
-        _cancel_order = {
-            "type": "send",
-            "11": ClOrdID, #ClOrdID
-            "54": side, #Side
-            "55": symbol, #Symbol
-            "41": origClOrdID, #OrigClOrdID
-            "58": "OrderCancelRequest", #Text
-            "60": trstime, #TransactTime
-        }
-        if orderID:
-            _cancel_order.update({
-                "37": orderID, #OrderID
-            })
-        self._Market_Data.append(_cancel_order)
+    def submit_batch(self, orders, block=True):
+        """
+        Send NewOrderSingles paced by ORDER_RATE and capped by MAX_IN_FLIGHT
+        orders: iterable of sendNewOrderSingle keyword arguments (side, symbol, orderqty, price, ordtype, handl_inst)
+        Safe to call from several threads: sends are serialized by the send lock and share one ORDER_RATE
+        Returns (ClOrdIDs sent in order, refusal); stops at the first refused order, refusal then says why:
+        REFUSED_IN_FLIGHT (back off until inFlight() drops) or a pre-trade limit of risk.py (max_order_rate: retry later,
+        max_position/max_open_notional: wait for fills or cancels) or REFUSED_SESSION (not logged on); refusal is None when every order was sent
+        """
+        sent = []
+        for order_ in orders:
+            self.bucket.acquire()
+            clOrdID, refusal = self._sendNewOrderSingle(**order_, block=block)
+            if clOrdID is None:
+                return sent, refusal
+            sent.append(clOrdID)
+        return sent, None
+
+    def cancel_all(self, symbol=None, block=True):
+        """
+        Cancel every live order (optionally of one symbol), paced and capped like submit_batch, thread-safe like it
+        Returns (ClOrdIDs of the cancels sent, refusal); refusal is REFUSED_IN_FLIGHT or REFUSED_SESSION when one stopped it, else None
+        """
+        sent = []
+        for origClOrdID in self._Market_Orders.liveOrders(symbol):
+            ### Skip orders that filled or got a cancel in flight since the snapshot
+            if not self._Market_Orders.isLive(origClOrdID):
+                continue
+            self.bucket.acquire()
+            clOrdID, refusal = self._sendOrderCancelRequest(origClOrdID, block=block)
+            if clOrdID is None:
+                return sent, refusal
+            sent.append(clOrdID)
+        return sent, None
+
+    #####################################################
+    def snapshot(self, marks=None):
+        """
+        Live per-symbol volume, VWAP, position and PnL (see analytics.live_analytics.snapshot)
+        PnL is marked to the current top of book (self.prices) unless marks are given, e.g. self.prices.marksAt(time)
+        """
+        return self.analytics.snapshot(self.prices.marks() if marks is None else marks)
+
+    def exposure(self):
+        """
+        Per-symbol position and open exposure held by the pre-trade risk cache
+        """
+        return self.risk.snapshot()
 
     #####################################################
     def run(self):
         """
         Execute simulation
-        Run 1000 new order requests and cancel some orders subsequently
+        Run new order requests (ITERATIONS, default: 1000) paced at ORDER_RATE and cancel some orders subsequently
         """
-        time.sleep(2) ### buffer 2sec for login
-
         ### Declare new order options for randomization
         side_options = ["1", "2", "3"]
         side_options_weights = [0.4, 0.3, 0.3]
-        symbols = ["MSFT", "BAC", "AAPL"]
+        symbols = self.symbols
         range_orderqty = (1, 10000)
-        range_price = {
-            "MSFT": (100, 400),
-            "BAC": (0, 100),
-            "AAPL": (100, 300)
-        }
+        range_price = self.price_ranges
         ordtypes = ["1", "2"]
         handl_insts = ["1", "2"]
 
-        ### Set number of iterations (default: 1000) and cancel_probability (default: 0.05) to determine odds of sending cancel order
-        iterations = 1000 #1000
-        cancel_probability = 0.05 #0.05
-        
+        ### Build every order template while the logon handshake is in flight, so the first orders go out as fast as the rest
+        self.templates.prewarm(symbols, side_options, ordtypes, handl_insts)
+
+        if not symbols:
+            log(self.logger, "No symbols to trade, aborting simulation", level="ERROR", _print=True)
+            return
+
+        ### Wait for logon instead of a fixed buffer
+        if not self.logged_on.wait(self.logon_timeout):
+            log(self.logger, f"Logon not received within {self.logon_timeout}s, aborting simulation", level="ERROR", _print=True)
+            return
+        if self.market_data:
+            self.subscribeMarketData()
+
         ### Begin Simulation
         start_time = time.time()
-        for _ in range(0, iterations):
+        for _ in range(0, self.iterations):
+            self.bucket.acquire()
             ### Send New Orders
             symbol_choice = random.choice(symbols)
             range_price_choice = range_price[symbol_choice]
@@ -361,13 +687,16 @@ class fix_pricing(quickfix.Application):
                 ordtype=random.choice(ordtypes), # 1=quickfix.OrdType_MARKET, 2=quickfix.OrdType_LIMIT
                 handl_inst=random.choice(handl_insts) # 1=quickfix.HandlInst_AUTOMATED_EXECUTION_ORDER_PRIVATE_NO_BROKER_INTERVENTION, 2=quickfix.HandlInst_AUTOMATED_EXECUTION_ORDER_PUBLIC_BROKER_INTERVENTION_OK, 3=quickfix.HandlInst_MANUAL_ORDER_BEST_EXECUTION
             )
-            ### Send Cancel Orders if P < cancel_probability
-            if (len(self._Market_Orders) > 0) and (random.random() <= cancel_probability):
-                order_choice = random.choice(list(self._Market_Orders.keys()))
-                self.sendOrderCancelRequest(origClOrdID=order_choice)
+            ### Send Cancel Orders if P < cancel_probability, picking among live orders only
+            if random.random() <= self.cancel_probability:
+                order_choice = self._Market_Orders.sampleLive()
+                if order_choice is not None:
+                    self.sendOrderCancelRequest(origClOrdID=order_choice)
         
-        ### End Simulation
-        time.sleep(10) ### buffer 10sec for remaining transactions
+        ### End Simulation once every order is terminal or timed out (ORDER_TIMEOUT)
+        timed_out = self.waitOutstanding()
+        if timed_out:
+            log(self.logger, f"{timed_out} orders without terminal response after {self.order_timeout}s", _print=True)
         
         ### Summarize runtime
         end_time = time.time()
@@ -0,0 +1,79 @@
+import os
+import sys
+import json
+import argparse
+import datetime
+
+### Checked-in results of the reference run, compared against when compare gets a single file
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+def save(results, filepath):
+    with open(filepath, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Benchmark results written to {filepath}")
+
+def load(filepath):
+    with open(filepath) as file:
+        return json.load(file)
+
+def compare(baseline, current, threshold=0.1):
+    """
+    Print baseline vs current per benchmark, returns names that regressed by more than threshold
+    Every value is a cost (time per op or per run), larger is worse
+    """
+    regressions = []
+    print(f"{'benchmark':34} {'baseline':>14} {'current':>14} {'change':>9}")
+    for name in sorted(set(baseline["results"]) | set(current["results"])):
+        before = baseline["results"].get(name)
+        after = current["results"].get(name)
+        if before is None or after is None:
+            print(f"{name:34} {'-' if before is None else format(before['value'], '14,.3f'):>14} {'-' if after is None else format(after['value'], '14,.3f'):>14}")
+            continue
+        if before["unit"] != after["unit"]:
+            print(f"{name:34} unit changed {before['unit']} -> {after['unit']}, skipped")
+            continue
+        change = after["value"] / before["value"] - 1 if before["value"] else 0.0
+        flag = ""
+        if change > threshold:
+            flag = " REGRESSION"
+            regressions.append(name)
+        print(f"{name:34} {before['value']:14,.3f} {after['value']:14,.3f} {change:+9.1%} {after['unit']}{flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Network-free benchmark suite")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the suite and write results as JSON")
+    run_parser.add_argument("--output", help="JSON file, default Results/benchmark_<timestamp>.json")
+    run_parser.add_argument("--groups", nargs="+", help="Benchmark groups to run, default all")
+    run_parser.add_argument("--rows", nargs="+", type=int, help="processData sizes, default 1000 100000 10000000")
+    run_parser.add_argument("--save-rows", type=int, default=100000, help="saveData rows")
+    run_parser.add_argument("--number", type=int, default=20000, help="Calls per per-message benchmark")
+
+    compare_parser = commands.add_parser("compare", help="Compare results against a stored baseline")
+    compare_parser.add_argument("results", nargs="+", metavar="[baseline] current", help="run outputs, baseline defaults to benchmarks/baseline.json")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="Relative slowdown flagged as a regression")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        from benchmarks.suite import run, GROUPS
+        for group in args.groups or []:
+            if group not in GROUPS:
+                parser.error(f"Unknown group {group}, expected one of {', '.join(GROUPS)}")
+        results = run(number=args.number, process_data_rows=args.rows, save_data_rows=args.save_rows, groups=args.groups)
+        save(results, args.output or f"Results/benchmark_{datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')}.json")
+        return 0
+
+    if len(args.results) > 2:
+        parser.error("compare takes a baseline and a current result at most")
+    baseline, current = ([BASELINE] + args.results)[-2:]
+    regressions = compare(load(baseline), load(current), args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+import timeit
+import quickfix
+
+from extract import extractFields
+
+SOH = "\x01"
+
+EXECUTION_REPORT = SOH.join([
+    "8=FIX.4.2", "9=0", "35=8", "34=498", "49=SIMULATOR", "52=20231022-11:07:46.104", "56=CLIENT",
+    "6=0", "11=00000258", "14=0", "17=EXE00000500", "20=0", "31=151.25", "32=2500", "37=SIM00000248",
+    "38=7450", "39=1", "40=2", "44=139", "54=1", "55=AAPL", "58=Fill", "150=1", "151=4950", "10=000",
+]) + SOH
+
+ORDER_CANCEL_REJECT = SOH.join([
+    "8=FIX.4.2", "9=0", "35=9", "34=499", "49=SIMULATOR", "52=20231022-11:07:46.105", "56=CLIENT",
+    "11=00000301", "37=NONE", "39=8", "41=00000120", "58=Too late to cancel", "102=0", "434=1", "10=000",
+]) + SOH
+
+def fieldObjects(message):
+    """
+    Previous fromApp extraction: one quickfix field object per tag, isSetField/getField each
+    """
+    msgType = quickfix.MsgType()
+    message.getHeader().getField(msgType)
+    msgType = msgType.getValue()
+    sendingTime = quickfix.SendingTime()
+    message.getHeader().getField(sendingTime)
+    msgSeqNum = quickfix.MsgSeqNum()
+    message.getHeader().getField(msgSeqNum)
+
+    values = {'type': "receive", '35': msgType, '52': sendingTime.getString(), '34': msgSeqNum.getValue()}
+    if msgType == quickfix.MsgType_ExecutionReport:
+        fields = [quickfix.ClOrdID(), quickfix.OrdStatus(), quickfix.ExecType(), quickfix.OrderID(), quickfix.OrigClOrdID(), quickfix.Side(), quickfix.Symbol(),
+                  quickfix.OrdType(), quickfix.Text(), quickfix.OrderQty(), quickfix.Price(), quickfix.LastPx(), quickfix.LastShares()]
+    else:
+        fields = [quickfix.ClOrdID(), quickfix.OrdStatus(), quickfix.OrderID(), quickfix.Text(), quickfix.OrigClOrdID()]
+    for metric in fields:
+        if message.isSetField(metric):
+            message.getField(metric)
+            values[str(metric.getField())] = metric.getValue()
+    return values
+
+def rawExtract(message):
+    """
+    Current fromApp extraction: message.toString() (shared with logging) and one pass over the buffer
+    """
+    values = extractFields(message.toString())
+    values['type'] = "receive"
+    return values
+
+def measure(function, message, number):
+    return min(timeit.repeat(lambda: function(message), number=number, repeat=5)) / number * 1e6
+
+def main(number=20000):
+    results = {}
+    for name, raw in [("ExecutionReport", EXECUTION_REPORT), ("OrderCancelReject", ORDER_CANCEL_REJECT)]:
+        message = quickfix.Message(raw, False)
+        assert fieldObjects(message) == rawExtract(message), name
+        before = measure(fieldObjects, message, number)
+        after = measure(rawExtract, message, number)
+        results[name] = {"before_us": before, "after_us": after}
+        print(f"{name:18}: before {before:8.2f} us/msg, after {after:8.2f} us/msg ({before / after:.1f}x)")
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import time
+import random
+import datetime
+import quickfix
+
+from application import fix_pricing
+
+class null_session:
+    """
+    Stands in for quickfix.Session: serializes the message as sendToTarget would, sends nothing
+    """
+    def __init__(self):
+        self.last = None
+
+    def sendToTarget(self, message, sessionID):
+        self.last = message.toString()
+        return True
+
+def freshSend(application, side, symbol, orderqty, price, ordtype, handl_inst):
+    """
+    Previous sendNewOrderSingle: new message and field objects per order, strftime TransactTime, dict per store row
+    """
+    message = quickfix.Message()
+    header = message.getHeader()
+    header.setField(quickfix.MsgType(quickfix.MsgType_NewOrderSingle))
+
+    ClOrdID = application.genClOrdID()
+    now = datetime.datetime.utcnow().strftime("%Y%m%d-%H:%M:%S.%f")[:-3]
+    message.setField(quickfix.ClOrdID(ClOrdID))
+    message.setField(quickfix.Side(side))
+    message.setField(quickfix.Symbol(symbol))
+    message.setField(quickfix.OrderQty(orderqty))
+    if ordtype == "2":
+        message.setField(quickfix.Price(price))
+    message.setField(quickfix.OrdType(ordtype))
+    message.setField(quickfix.HandlInst(handl_inst))
+    message.setField(quickfix.TimeInForce('0'))
+    message.setField(quickfix.Text("NewOrderSingle"))
+    trstime = quickfix.TransactTime()
+    trstime.setString(now)
+    message.setField(trstime)
+
+    application.trackOrder(ClOrdID)
+    application._Market_Orders.add(ClOrdID, symbol, side, orderqty, price, ordtype, now, sent_ns=time.perf_counter_ns())
+    application.session.sendToTarget(message, application.sessionID)
+
+    application._Market_Data.append({
+        "type": "send",
+        "11": ClOrdID,
+        "54": side,
+        "55": symbol,
+        "38": orderqty,
+        "44": price,
+        "40": ordtype,
+        "58": "NewOrderSingle",
+        "60": now,
+    })
+    application.analytics.onOrder(symbol, side)
+
+def templateSend(application, side, symbol, orderqty, price, ordtype, handl_inst):
+    """
+    Current sendNewOrderSingle: cached template, cached timestamp, prepared store row
+    """
+    application.sendNewOrderSingle(side, symbol, orderqty, price, ordtype, handl_inst)
+
+def makeOrders(number, seed=0):
+    generator = random.Random(seed)
+    return [
+        (generator.choice("123"), generator.choice(["MSFT", "BAC", "AAPL"]), generator.randint(1, 10000),
+         generator.randint(1, 400), generator.choice("12"), generator.choice("12"))
+        for _ in range(number)
+    ]
+
+def measure(function, orders, repeat=5):
+    """
+    Best of repeat runs, microseconds per order; each run uses a fresh fix_pricing
+    """
+    best = None
+    for _ in range(repeat):
+        application = fix_pricing(null_session(), start_timestamp="bench_send")
+        application.onCreate(quickfix.SessionID("FIX.4.2", "BENCH", "COUNTERPARTY"))
+        start = time.perf_counter()
+        for order in orders:
+            function(application, *order)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(orders) * 1e6
+
+def body(raw):
+    """
+    Body fields of a serialized message, without header, trailer and TransactTime
+    """
+    return [field for field in raw.split("\x01") if field and field.split("=")[0] not in ("8", "9", "10", "60")]
+
+def main(number=20000):
+    orders = makeOrders(number)
+
+    ### Same fields on the wire both ways
+    before_app = fix_pricing(null_session(), start_timestamp="bench_send")
+    after_app = fix_pricing(null_session(), start_timestamp="bench_send")
+    for order in orders[:100]:
+        freshSend(before_app, *order)
+        templateSend(after_app, *order)
+        assert body(before_app.session.last) == body(after_app.session.last), (before_app.session.last, after_app.session.last)
+
+    before = measure(freshSend, orders)
+    after = measure(templateSend, orders)
+    print(f"{'NewOrderSingle':18}: before {before:8.2f} us/order, after {after:8.2f} us/order ({before / after:.1f}x)")
+    return {"NewOrderSingle": {"before_us": before, "after_us": after}}
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+import os
+import sys
+import platform
+import datetime
+import subprocess
+import quickfix
+
+def environment(**versions):
+    """
+    Where a benchmark or capacity run happened: commit, python, platform, cpus, quickfix version
+    versions: extra library versions to record, e.g. pandas=pd.__version__
+    Kept free of pandas/numpy so capacity.py can use it without loading them
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S'),
+        "commit": commit or None,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+        "quickfix": getattr(quickfix, "__version__", None),
+        **versions,
+    }
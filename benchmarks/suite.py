@@ -0,0 +1,218 @@
+import os
+import timeit
+import itertools
+import numpy as np
+import pandas as pd
+import quickfix
+
+from application import fix_pricing
+from helpers import parse_fix_message, fix_message_text, setup_logger, stop_logger, log, saveData, ensureDirectories
+from store import execution_store
+from report import processData
+from risk import risk_cache
+from benchmarks.bench_send import null_session, makeOrders
+from benchmarks.bench_extract import EXECUTION_REPORT, ORDER_CANCEL_REJECT
+from benchmarks.environment import environment
+
+PROCESS_DATA_ROWS = [1000, 100000, 10000000]
+
+def measure(function, number, repeat=5):
+    """
+    Best of repeat runs of number calls, microseconds per call
+    """
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number * 1e6
+
+def result(value, unit="us/op", **extra):
+    return dict({"value": value, "unit": unit}, **extra)
+
+def benchSettings(**values):
+    """
+    SessionSettings with [DEFAULT] values only, e.g. STAGE_CAPACITY=0 to process received messages inline
+    """
+    dictionary = quickfix.Dictionary()
+    for key, value in values.items():
+        dictionary.setString(key, str(value))
+    settings = quickfix.SessionSettings()
+    settings.set(dictionary)
+    return settings
+
+def benchApplication(**settings):
+    application = fix_pricing(null_session(), start_timestamp="bench_suite", settings=benchSettings(**settings))
+    application.onCreate(quickfix.SessionID("FIX.4.2", "BENCH", "COUNTERPARTY"))
+    return application
+
+def closeApplication(application):
+    application.close()
+    stop_logger(application.logger)
+
+#####################################################
+def benchSend(number):
+    """
+    sendNewOrderSingle / sendOrderCancelRequest per call, message construction through store append, no network
+    """
+    orders = makeOrders(number)
+    results = {}
+
+    application = benchApplication()
+    cycle = itertools.cycle(orders)
+    results["send_new_order_single"] = result(measure(lambda: application.sendNewOrderSingle(*next(cycle)), number))
+
+    ### Cancel live orders, each at most once
+    targets = iter(application._Market_Orders.liveOrders() * 2)
+    results["send_order_cancel_request"] = result(measure(lambda: application.sendOrderCancelRequest(next(targets)), number // 10, repeat=1))
+    closeApplication(application)
+    return results
+
+def benchRisk(number):
+    """
+    Pre-trade risk per order: reserve (limit checks and booking) and fill/done updates, and sendNewOrderSingle with every limit on
+    Limits are set high enough that no order is refused, so every check runs to the end
+    """
+    orders = makeOrders(number)
+    results = {}
+
+    risk = risk_cache(max_position=1e12, max_open_notional=1e15, max_order_rate=1e9)
+    ids = itertools.count()
+    cycle = itertools.cycle(orders)
+    def reserve():
+        side, symbol, orderqty, price = next(cycle)[:4]
+        risk.reserve(next(ids), symbol, side, orderqty, price)
+    results["risk_reserve"] = result(measure(reserve, number))
+    done = itertools.count()
+    def fillDone():
+        clOrdID = next(done)
+        risk.onFill(clOrdID, 100)
+        risk.onDone(clOrdID)
+    results["risk_fill_done"] = result(measure(fillDone, number, repeat=1))
+
+    application = benchApplication(MAX_POSITION="1e12", MAX_OPEN_NOTIONAL="1e15", MAX_ORDER_RATE="1e9")
+    cycle = itertools.cycle(orders)
+    results["send_new_order_single_risk"] = result(measure(lambda: application.sendNewOrderSingle(*next(cycle)), number))
+    closeApplication(application)
+    return results
+
+def benchFromApp(number):
+    """
+    fromApp per message with received messages processed inline (parse, store, order state, analytics)
+    """
+    results = {}
+    for name, raw in [("from_app_execution_report", EXECUTION_REPORT), ("from_app_order_cancel_reject", ORDER_CANCEL_REJECT)]:
+        application = benchApplication(STAGE_CAPACITY=0)
+        message = quickfix.Message(raw, False)
+        results[name] = result(measure(lambda: application.fromApp(message, application.sessionID), number))
+        closeApplication(application)
+    return results
+
+def benchLogging(number):
+    """
+    parse_fix_message and FIX message logging per message, synchronous and queued
+    """
+    message = quickfix.Message(EXECUTION_REPORT, False)
+    results = {"parse_fix_message": result(measure(lambda: parse_fix_message(message), number))}
+
+    for name, queued in [("log_parse_fix_message_sync", False), ("log_parse_fix_message_queued", True)]:
+        logger = setup_logger(name=name, log_file=f"Log/{name}.log", format_str='%(asctime)s %(levelname)s %(message)s', queued=queued)
+        results[name] = result(measure(lambda: log(logger, f"[fromApp] {parse_fix_message(message)}"), number))
+        stop_logger(logger)
+
+    logger = setup_logger(name="log_deferred", log_file="Log/log_deferred.log", format_str='%(asctime)s %(levelname)s %(message)s', queued=True)
+    results["log_deferred_queued"] = result(measure(lambda: log(logger, "[fromApp] %s", fix_message_text(message.toString())), number))
+    stop_logger(logger)
+    return results
+
+def benchSaveData(rows):
+    """
+    saveData of an execution_store holding rows sends and receives
+    """
+    store = execution_store()
+    for record in syntheticFrame(rows).to_dict("records"):
+        store.append({tag: value for tag, value in record.items() if not (isinstance(value, float) and np.isnan(value))})
+    seconds = min(timeit.repeat(lambda: saveData(store, "Results/bench_save_data.csv"), number=1, repeat=3))
+    return {f"save_data_{rows}": result(seconds, "s", rows=rows, rows_per_sec=rows / seconds)}
+
+def benchProcessData(rows_list, chunk_rows=1000000):
+    """
+    processData over a synthetic market data CSV of each size, written in chunks so 10M rows fit in memory
+    """
+    results = {}
+    for rows in rows_list:
+        filepath = f"Results/bench_market_data_{rows}.csv"
+        writeSynthetic(filepath, rows, chunk_rows)
+        repeat = 3 if rows <= 100000 else 1
+        seconds = min(timeit.repeat(lambda: processData(filepath, sessionid="BENCH", start_timestamp=f"bench_{rows}"), number=1, repeat=repeat))
+        results[f"process_data_{rows}"] = result(seconds, "s", rows=rows, rows_per_sec=rows / seconds)
+        os.remove(filepath)
+    return results
+
+#####################################################
+def syntheticFrame(rows, seed=0, start=0):
+    """
+    Market data shaped like sample/market_data_20231022110744.csv: ~26% NewOrderSingles, ~1.4% OrderCancelRequests
+    and ~72% ExecutionReports (new, partial fill, fill, ~4% rejects)
+    """
+    generator = np.random.default_rng(seed + start)
+    symbols = np.array(["MSFT", "BAC", "AAPL"])
+    marks = np.array([240.0, 32.0, 150.0])
+
+    kind = generator.choice(3, size=rows, p=[0.26, 0.014, 0.726]) #send new, send cancel, receive
+    symbol_index = generator.integers(0, 3, rows)
+    side = generator.choice(np.array(["1", "2", "3"]), size=rows, p=[0.4, 0.3, 0.3])
+    ordtype = generator.choice(np.array(["1", "2"]), size=rows)
+    clOrdID = np.char.zfill((np.arange(rows) + start + 1).astype(str), 8)
+    quantity = generator.integers(1, 10000, rows).astype(float)
+    price = generator.integers(1, 400, rows).astype(float)
+    status = generator.choice(np.array(["0", "1", "2", "8"]), size=rows, p=[0.33, 0.30, 0.33, 0.04])
+
+    new = kind == 0
+    cancel = kind == 1
+    receive = kind == 2
+    filled = receive & ((status == "1") | (status == "2"))
+    return pd.DataFrame({
+        "type": np.where(receive, "receive", "send"),
+        "11": clOrdID,
+        "54": side,
+        "55": symbols[symbol_index],
+        "38": np.where(cancel, np.nan, quantity),
+        "44": np.where(cancel, np.nan, price),
+        "40": np.where(cancel, None, ordtype),
+        "58": np.where(new, "NewOrderSingle", np.where(cancel, "OrderCancelRequest", np.where(status == "8", "Unlucky", None))),
+        "60": np.where(receive, None, "20231022-11:07:46.104"),
+        "37": np.where(cancel, None, np.char.add("3", clOrdID)),
+        "35": np.where(receive, "8", None),
+        "52": np.where(receive, "20231022-11:07:46.360", None),
+        "34": np.where(receive, np.arange(rows) + 2.0, np.nan),
+        "39": np.where(receive, status, None),
+        "150": np.where(receive, status, None),
+        "41": np.where(cancel, clOrdID, None),
+        "31": np.where(filled, np.round(marks[symbol_index] * generator.uniform(0.98, 1.02, rows), 2), np.nan),
+        "32": np.where(filled, np.floor(quantity / 2), np.nan),
+    })
+
+def writeSynthetic(filepath, rows, chunk_rows=1000000):
+    with open(filepath, "w", newline="") as file:
+        for start in range(0, rows, chunk_rows):
+            syntheticFrame(min(chunk_rows, rows - start), start=start).to_csv(file, index=False, header=start == 0)
+
+#####################################################
+### Benchmark groups, in run order
+GROUPS = ["send", "risk", "from_app", "logging", "save_data", "process_data"]
+
+def run(number=20000, process_data_rows=None, save_data_rows=100000, groups=None):
+    """
+    Run benchmark groups (default all), returns {"environment", "results"}
+    """
+    ensureDirectories()
+    benchmarks = {
+        "send": lambda: benchSend(number),
+        "risk": lambda: benchRisk(number),
+        "from_app": lambda: benchFromApp(number),
+        "logging": lambda: benchLogging(number),
+        "save_data": lambda: benchSaveData(save_data_rows),
+        "process_data": lambda: benchProcessData(process_data_rows or PROCESS_DATA_ROWS),
+    }
+    results = {}
+    for group in groups or GROUPS:
+        for name, value in benchmarks[group]().items():
+            results[name] = value
+            print(f"{name:34}: {value['value']:12,.3f} {value['unit']}")
+    return {"environment": environment(pandas=pd.__version__, numpy=np.__version__), "results": results}
@@ -0,0 +1,202 @@
+import sys
+import json
+import math
+import argparse
+import datetime
+
+import client
+from helpers import log, ensureDirectories, setup_logger, stop_logger
+from latency import latency_histogram
+from scaleout import splitConfig, writeWorkerConfig
+from benchmarks.environment import environment
+
+### Latency kinds reported per step, see latency.latency_recorder
+LATENCY_KINDS = ("ack", "fill")
+### A step fails when the client sends below SEND_EFFICIENCY of the offered rate, or acks arrive below ACK_EFFICIENCY of the send rate
+SEND_EFFICIENCY = 0.95
+ACK_EFFICIENCY = 0.9
+
+def mergeLatency(recorder, kind):
+    """
+    One histogram of kind over every symbol
+    """
+    merged = latency_histogram()
+    for (symbol, histogram_kind), histogram in list(recorder.histograms.items()):
+        if histogram_kind == kind:
+            merged.merge(histogram)
+    return merged
+
+def stepResult(fix_session, rate):
+    """
+    Measurements of one step from the fix_pricing session that ran it
+    acks: orders with at least one ExecutionReport (the first one per ClOrdID), so ack_rate is orders acked per second
+    timed_out: orders never acked before the session closed (after waiting ORDER_TIMEOUT); acked orders still resting are not counted
+    """
+    stats = fix_session.throughput
+    result = {
+        "offered_rate": rate,
+        "orders": stats["orders"],
+        "acks": stats["acks"],
+        "refused": stats["refused"],
+        "risk_refused": stats["risk_refused"],
+        "rejects": fix_session.metrics.total("fix_rejects_total"),
+        "cancel_rejects": fix_session.metrics.total("fix_cancel_rejects_total"),
+        "timed_out": stats["orders"] - stats["acks"],
+        "send_rate": 0.0,
+        "ack_rate": 0.0,
+    }
+    if stats["first_send"] is not None:
+        result["send_rate"] = stats["orders"] / max(stats["last_send"] - stats["first_send"], 1e-9)
+        result["ack_rate"] = stats["acks"] / max((stats["last_ack"] or stats["first_send"]) - stats["first_send"], 1e-9)
+    for kind in LATENCY_KINDS:
+        histogram = mergeLatency(fix_session.latency, kind)
+        result[f"{kind}_latency_us"] = {
+            "count": histogram.count,
+            **{f"p{percentile:g}": None if histogram.count == 0 else histogram.percentile(percentile) / 1000 for percentile in (50, 90, 99, 99.9)},
+            "max": None if histogram.max is None else histogram.max / 1000,
+        }
+    return result
+
+def checkSLO(result, slo):
+    """
+    Names of the SLOs a step breached, empty when it passed
+    slo: {"p99_ms": ack p99 limit, "error_rate": max (rejects + cancel rejects + timed out) / orders}
+    """
+    breaches = []
+    if result["orders"] == 0:
+        return ["no orders sent"]
+    if result["send_rate"] < result["offered_rate"] * SEND_EFFICIENCY:
+        breaches.append(f"send rate {result['send_rate']:,.1f} < {SEND_EFFICIENCY:.0%} of offered")
+    if result["ack_rate"] < result["send_rate"] * ACK_EFFICIENCY:
+        breaches.append(f"ack rate {result['ack_rate']:,.1f} < {ACK_EFFICIENCY:.0%} of send rate")
+    p99 = result["ack_latency_us"]["p99"]
+    if p99 is None or p99 / 1000 > slo["p99_ms"]:
+        breaches.append(f"ack p99 {'-' if p99 is None else format(p99 / 1000, ',.2f')}ms > {slo['p99_ms']}ms")
+    error_rate = (result["rejects"] + result["cancel_rejects"] + result["timed_out"]) / result["orders"]
+    if error_rate > slo["error_rate"]:
+        breaches.append(f"error rate {error_rate:.2%} > {slo['error_rate']:.2%}")
+    return breaches
+
+class capacity_search:
+    """
+    Find the highest order rate (orders/sec per session) that meets the SLOs
+    Each step is a full client session (logon, fix_pricing.run at ORDER_RATE for ITERATIONS = rate * step_seconds, logout)
+    - step: start, start + step, ... until a step breaches an SLO or max_rate is passed
+    - binary: start, 2 * start, ... until a step breaches, then bisect between the last pass and the first breach
+      until they are within resolution (relative)
+    """
+    def __init__(self, config_file, timestamp, slo, step_seconds=10, min_orders=100):
+        self.timestamp = timestamp
+        self.slo = slo
+        self.step_seconds = step_seconds
+        self.min_orders = min_orders
+        self.default_block, session_blocks = splitConfig(config_file)
+        if len(session_blocks) != 1:
+            raise ValueError(f"{config_file} must have exactly one [SESSION], the rate searched is per session")
+        self.session_block = session_blocks[0]
+        self.steps = []
+
+    def runStep(self, rate):
+        index = len(self.steps)
+        config_file = writeWorkerConfig(
+            self.default_block,
+            self.session_block,
+            f"Files/capacity_{self.timestamp}_{index}.cfg",
+            ORDER_RATE=f"{rate:g}",
+            RATE_PROFILE="steady",
+            ITERATIONS=max(math.ceil(rate * self.step_seconds), self.min_orders),
+        )
+        log(None, f"Capacity step {index}: {rate:,.1f} orders/sec", _print=True)
+        fix_session = client.main(config_file=config_file, start_timestamp=f"{self.timestamp}_c{index}")
+        result = stepResult(fix_session, rate)
+        result["step"] = index
+        result["breaches"] = checkSLO(result, self.slo)
+        result["passed"] = not result["breaches"]
+        self.steps.append(result)
+        log(None, f"{' ':5}sent {result['send_rate']:,.1f}/s, acked {result['ack_rate']:,.1f}/s, ack p99 {result['ack_latency_us']['p99'] or 0:,.0f}us: {'pass' if result['passed'] else '; '.join(result['breaches'])}", _print=True)
+        return result["passed"]
+
+    def run(self, start, max_rate, mode="binary", step=None, resolution=0.05):
+        """
+        Returns the highest rate that passed, None when the first step already failed
+        """
+        passed = None
+        failed = None
+        rate = start
+        while rate <= max_rate:
+            if not self.runStep(rate):
+                failed = rate
+                break
+            passed = rate
+            rate = rate + (step or start) if mode == "step" else rate * 2
+        if mode == "binary" and passed is not None and failed is not None:
+            while (failed - passed) / passed > resolution:
+                rate = (passed + failed) / 2
+                if self.runStep(rate):
+                    passed = rate
+                else:
+                    failed = rate
+        return passed
+
+def writeReport(search, capacity, settings, filepath):
+    """
+    Capacity report as JSON (filepath.json) and a summary table (filepath.log)
+    """
+    report = {
+        "timestamp": search.timestamp,
+        "environment": environment(),
+        "settings": settings,
+        "slo": search.slo,
+        "capacity": capacity,
+        "steps": search.steps,
+    }
+    with open(f"{filepath}.json", "w") as file:
+        json.dump(report, file, indent=2)
+
+    logger = setup_logger(name="capacity", log_file=f"{filepath}.log", format_str='%(message)s')
+    log(logger, f"Capacity Search - {search.timestamp}", _print=True)
+    log(logger, f"{' ':5}SLO: ack p99 <= {search.slo['p99_ms']}ms, errors <= {search.slo['error_rate']:.2%}, send >= {SEND_EFFICIENCY:.0%} of offered, acks >= {ACK_EFFICIENCY:.0%} of sent", _print=True)
+    log(logger, f"{' ':5}{'step':>4} {'offered/s':>10} {'sent/s':>10} {'acked/s':>10} {'orders':>8} {'rejects':>7} {'cxl rej':>7} {'timeout':>7} {'ack p50us':>10} {'ack p99us':>10} {'ack p99.9us':>11}  result", _print=True)
+    for step in search.steps:
+        latency = step["ack_latency_us"]
+        percentiles = [format(latency[key], ",.0f") if latency[key] is not None else "-" for key in ("p50", "p99", "p99.9")]
+        log(logger, f"{' ':5}{step['step']:>4} {step['offered_rate']:>10,.1f} {step['send_rate']:>10,.1f} {step['ack_rate']:>10,.1f} {step['orders']:>8,} {step['rejects']:>7,} {step['cancel_rejects']:>7,} {step['timed_out']:>7,} {percentiles[0]:>10} {percentiles[1]:>10} {percentiles[2]:>11}  {'pass' if step['passed'] else 'FAIL'}", _print=True)
+    log(logger, f"{' ':5}Max sustainable rate: {'none (first step failed)' if capacity is None else f'{capacity:,.1f} orders/sec'}", _print=True)
+    stop_logger(logger)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find the highest order rate per session that meets latency and error SLOs")
+    parser.add_argument("config", nargs="?", default="loopback.cfg", help="initiator config with one [SESSION]")
+    parser.add_argument("--simulator", default=None, help="also run the local simulator with this config, e.g. simulator.cfg")
+    parser.add_argument("--mode", choices=("binary", "step"), default="binary", help="double then bisect, or add --step per step")
+    parser.add_argument("--start", type=float, default=100, help="first offered rate, orders/sec")
+    parser.add_argument("--step", type=float, default=None, help="rate added per step in step mode, default --start")
+    parser.add_argument("--max-rate", type=float, default=100000, help="highest rate tried")
+    parser.add_argument("--resolution", type=float, default=0.05, help="binary mode stops when pass and fail rates are this close (relative)")
+    parser.add_argument("--step-seconds", type=float, default=10, help="seconds of orders per step")
+    parser.add_argument("--p99-ms", type=float, default=50, help="SLO: ack latency p99 in ms")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="SLO: (rejects + cancel rejects + timed out) / orders")
+    args = parser.parse_args(argv)
+
+    now = datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    ensureDirectories()
+    search = capacity_search(args.config, now, {"p99_ms": args.p99_ms, "error_rate": args.error_rate}, step_seconds=args.step_seconds)
+
+    acceptor = None
+    if args.simulator:
+        from simulator import start_acceptor
+        acceptor, application = start_acceptor(args.simulator, start_timestamp=now)
+    try:
+        capacity = search.run(args.start, args.max_rate, mode=args.mode, step=args.step, resolution=args.resolution)
+    finally:
+        if acceptor is not None:
+            acceptor.stop()
+            application.scheduler.stop()
+
+    settings = {key: value for key, value in vars(args).items() if key != "config"}
+    settings["config"] = args.config
+    writeReport(search, capacity, settings, f"Results/capacity_{now}")
+    return 0 if capacity is not None else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
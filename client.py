@@ -1,21 +1,45 @@
+### Imported first so STARTUP_PROFILE=Y can report the import time of what follows
+from startup import profile, sessionProfile
 import os
-import quickfix
 import datetime
+import quickfix
+profile.mark("import quickfix")
 from application import fix_pricing
-from helpers import log, saveData, ensureDirectories
-from report import processData
+from helpers import log, saveData, ensureDirectories, stop_logger, getSetting, loadSettings
+from persistence import segment_writer
+from metrics import metrics_server, stats_reporter
+profile.mark("import application")
+### report defers pandas to its aggregation functions, the trading path never loads it (numpy is already in via store.py)
+from report import processData, summarizeSnapshot
+profile.mark("import report")
 
-def main():
-    now = datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')
+def main(config_file="config.cfg", start_timestamp=None, on_complete=None):
+    """
+    Run one session: logon, fix_pricing.run, logout, then summary and market data to Results
+    on_complete: called with the fix_pricing once the session is over and every received message is processed,
+    while its logger is still open (e.g. loopback.reportThroughput)
+    """
+    now = start_timestamp or datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    startup = sessionProfile()
+    startup.mark("until main")
     ensureDirectories()
-    config_file = "config.cfg"
     data_filepath = f"Results/market_data_{now}.csv"
+    writer = None
+    cross_check = False
+    server = None
+    reporter = None
+
+    ### Invalid settings fail here, before any thread or socket is started
+    fix_settings = loadSettings(config_file)
+    startup.mark("settings")
 
     try:
-        fix_session = fix_pricing(quickfix.Session, start_timestamp=now)
-        fix_settings = quickfix.SessionSettings(config_file)
+        fix_session = fix_pricing(quickfix.Session, start_timestamp=now, settings=fix_settings)
+        startup.mark("fix_pricing")
         store_factory = quickfix.FileStoreFactory(fix_settings)
         log_factory = quickfix.ScreenLogFactory(fix_settings)
+        ### Summary comes from live analytics, REPORT_CROSS_CHECK=Y also runs the pandas report (summary_<timestamp>_pandas.log)
+        cross_check = getSetting(fix_settings, "REPORT_CROSS_CHECK", "N") == "Y"
 
         initiator = quickfix.SocketInitiator(
             fix_session,
@@ -23,16 +47,73 @@ def main():
             fix_settings,
             log_factory,
         )
+        startup.mark("initiator")
 
+        ### Logon goes out first, the rest of the setup overlaps with the handshake
         initiator.start()
+        startup.mark("initiator start")
+
+        ### Stream market data to Results during the session, PERSIST_FORMAT=none keeps it in memory until the end
+        persist_format = getSetting(fix_settings, "PERSIST_FORMAT", "csv")
+        if persist_format != "none":
+            writer = segment_writer(
+                fix_session._Market_Data,
+                basepath=f"Results/market_data_{now}",
+                file_format=persist_format,
+                batch_rows=getSetting(fix_settings, "PERSIST_BATCH_ROWS", 10000, int),
+                flush_interval=getSetting(fix_settings, "PERSIST_FLUSH_INTERVAL", 1.0, float),
+                rotate_bytes=int(getSetting(fix_settings, "PERSIST_ROTATE_MB", 0, float) * 1024 * 1024),
+            )
+            writer.start()
+            fix_session.metrics.gauge("fix_persist_backlog", "Rows buffered but not yet written to Results", lambda: writer.backlog)
+            startup.mark("segment writer")
+
+        ### METRICS_PORT serves Prometheus text on http://127.0.0.1:<port>/metrics, METRICS_INTERVAL prints a stats line every N seconds
+        metrics_port = getSetting(fix_settings, "METRICS_PORT", 0, int)
+        if metrics_port > 0:
+            server = metrics_server(fix_session.metrics, metrics_port)
+            server.start()
+        metrics_interval = getSetting(fix_settings, "METRICS_INTERVAL", 0, float)
+        if metrics_interval > 0:
+            reporter = stats_reporter(fix_session.metrics, metrics_interval)
+            reporter.start()
+        startup.mark("metrics")
+
         fix_session.run()
+        if getSetting(fix_settings, "STARTUP_PROFILE", "N") == "Y":
+            if fix_session.logon_time is not None:
+                startup.event("logon", fix_session.logon_time)
+            for line in startup.lines():
+                log(fix_session.logger, line, _print=True)
     except (quickfix.ConfigError, quickfix.RuntimeError, KeyboardInterrupt) as ex:
         log(fix_session.logger, ex, level="ERROR", _print=True)
     finally:
-        saveData(data=fix_session._Market_Data, filepath=data_filepath)
         initiator.stop()
-        if os.path.exists(data_filepath):
-            processData(filepath=data_filepath, sessionid=fix_session.sessionID, start_timestamp=now)
+        fix_session.close()
+        if on_complete is not None:
+            on_complete(fix_session)
+        if reporter is not None:
+            reporter.close()
+        if server is not None:
+            server.close()
+        stop_logger(fix_session.logger)
+        summarizeSnapshot(fix_session.snapshot(), sessionid=fix_session.sessionID, start_timestamp=now, latency=fix_session.latency.summary())
+        fix_session.latency.export(f"Results/latency_{now}.json")
+        ### Marks recorded from market data, for report.py --marks to mark PnL at any point of the session
+        if len(fix_session.prices):
+            fix_session.prices.export(f"Results/marks_{now}.csv")
+        marks = fix_session.prices.marks()
+        if writer is not None:
+            writer.close()
+            if cross_check and writer.segments:
+                processData(filepath=writer.segments, sessionid=fix_session.sessionID, start_timestamp=f"{now}_pandas", marks=marks)
+        else:
+            market_data = fix_session._Market_Data.to_dataframe()
+            saveData(data=market_data, filepath=data_filepath)
+            if cross_check and os.path.exists(data_filepath):
+                processData(filepath=data_filepath, sessionid=fix_session.sessionID, start_timestamp=f"{now}_pandas", data=market_data, marks=marks)
+
+    return fix_session
 
 if __name__ == "__main__":
     main()
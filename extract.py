@@ -0,0 +1,125 @@
+import re
+
+SOH = "\x01"
+
+### Header tags kept for every message
+HEADER_FIELDS = {
+    "35": str, #MsgType
+    "52": str, #SendingTime
+    "34": int, #MsgSeqNum
+}
+
+### Body tags kept per MsgType (tag 35), with the type they are converted to
+MESSAGE_FIELDS = {
+    "8": { #ExecutionReport
+        "11": str, #ClOrdID
+        "39": str, #OrdStatus
+        "150": str, #ExecType
+        "37": str, #OrderID
+        "41": str, #OrigClOrdID
+        "54": str, #Side
+        "55": str, #Symbol
+        "40": str, #OrdType
+        "58": str, #Text
+        "38": float, #OrderQty
+        "44": float, #Price
+        "31": float, #LastPx
+        "32": float, #LastShares
+    },
+    "9": { #OrderCancelReject
+        "11": str, #ClOrdID
+        "39": str, #OrdStatus
+        "37": str, #OrderID
+        "58": str, #Text
+        "41": str, #OrigClOrdID
+    },
+    "3": { #Reject
+        "11": str, #ClOrdID
+        "58": str, #Text
+        "45": int, #RefSeqNum
+        "371": int, #RefTagID
+        "372": str, #RefMsgType
+        "373": int, #SessionRejectReason
+    },
+}
+
+class field_extractor:
+    """
+    Precompiled extractor of a fixed set of tags from a raw SOH-separated FIX message
+    One regex pass over the buffer, only the wanted tags are converted
+    """
+    def __init__(self, fields):
+        self.fields = dict(HEADER_FIELDS, **fields)
+        self.pattern = re.compile(f"{SOH}({'|'.join(self.fields)})=([^{SOH}]*)")
+        self.converted = [(tag, converter) for tag, converter in self.fields.items() if converter is not str]
+
+    def extract(self, raw):
+        """
+        Return {tag: typed value} for wanted tags present in raw
+        """
+        values = dict(self.pattern.findall(raw))
+        for tag, converter in self.converted:
+            value = values.get(tag)
+            if value is not None:
+                values[tag] = converter(value)
+        return values
+
+EXTRACTORS = {msgType: field_extractor(fields) for msgType, fields in MESSAGE_FIELDS.items()}
+
+def getMsgType(raw):
+    """
+    Return MsgType (tag 35) of a raw message without parsing the rest
+    """
+    start = raw.find(f"{SOH}35=")
+    if start < 0:
+        return None
+    start += 4
+    return raw[start:raw.find(SOH, start)]
+
+def extractFields(raw, msgType=None):
+    """
+    Return {tag: typed value} of the fields kept for this message's MsgType, None for other types
+    """
+    extractor = EXTRACTORS.get(msgType or getMsgType(raw))
+    if extractor is None:
+        return None
+    return extractor.extract(raw)
+
+### MarketDataSnapshotFullRefresh (35=W) / MarketDataIncrementalRefresh (35=X) repeating group fields
+MD_ENTRY_FIELDS = {
+    "279": str, #MDUpdateAction
+    "269": str, #MDEntryType
+    "55": str, #Symbol
+    "270": float, #MDEntryPx
+    "271": float, #MDEntrySize
+}
+### First field of a NoMDEntries (tag 268) entry per MsgType
+MD_ENTRY_START = {
+    "W": "269",
+    "X": "279",
+}
+MD_ENTRY_PATTERN = re.compile(f"{SOH}(52|{'|'.join(MD_ENTRY_FIELDS)})=([^{SOH}]*)")
+
+def extractEntries(raw, msgType=None):
+    """
+    Return (SendingTime, [{tag: typed value}, ...]) of the NoMDEntries group of a W or X message, in one pass
+    Entries carry Symbol (tag 55), taken from the message for W and from the previous entry when an X entry omits it
+    Group order must be intact, i.e. the message was parsed with a DataDictionary (UseDataDictionary=Y)
+    """
+    start = MD_ENTRY_START[msgType or getMsgType(raw)]
+    sendingTime = None
+    symbol = None
+    entry = None
+    entries = []
+    for tag, value in MD_ENTRY_PATTERN.findall(raw):
+        if tag == "52":
+            sendingTime = value
+            continue
+        if tag == start:
+            entry = {"55": symbol}
+            entries.append(entry)
+        if tag == "55":
+            symbol = value
+        if entry is not None:
+            entry[tag] = MD_ENTRY_FIELDS[tag](value)
+    return sendingTime, entries
@@ -1,6 +1,62 @@
 import os
+import queue
 import logging
-import pandas as pd
+import logging.handlers
+import quickfix
+
+### QueueListeners of queued loggers, keyed by logger name
+_listeners = {}
+### Parsed SessionSettings and DataDictionaries, keyed by (path, mtime)
+_settings = {}
+_dictionaries = {}
+
+def priceRanges(value):
+    """
+    Parse PRICE_RANGES, e.g. "MSFT:100-400,IBM:120-180" -> {"MSFT": (100, 400), "IBM": (120, 180)}
+    """
+    ranges = {}
+    for item in value.split(","):
+        symbol, _, bounds = item.partition(":")
+        low, _, high = bounds.partition("-")
+        low, high = int(low), int(high)
+        if not symbol.strip() or low > high:
+            raise ValueError(item)
+        ranges[symbol.strip()] = (low, high)
+    return ranges
+
+### fix_pricing keys of the [DEFAULT] section, checked once by loadSettings: a cast, or the allowed values
+SETTINGS = {
+    "ITERATIONS": int,
+    "CANCEL_PROBABILITY": float,
+    "ORDER_RATE": float,
+    "RATE_PROFILE": ("steady", "burst", "ramp"),
+    "BURST_SIZE": int,
+    "RAMP_SECONDS": float,
+    "LOGON_TIMEOUT": float,
+    "ORDER_TIMEOUT": float,
+    "MAX_IN_FLIGHT": int,
+    "IN_FLIGHT_TIMEOUT": float,
+    "STAGE_CAPACITY": int,
+    "STAGE_OVERFLOW": ("block", "drop"),
+    "LOG_MODE": ("sync", "queue"),
+    "LOG_RAW": ("Y", "N"),
+    "LOG_LEVEL": ("DEBUG", "INFO", "WARNING", "ERROR"),
+    "LOG_SAMPLE_DEBUG": float,
+    "LOG_SAMPLE_INFO": float,
+    "PERSIST_FORMAT": ("csv", "parquet", "arrow", "none"),
+    "PERSIST_BATCH_ROWS": int,
+    "PERSIST_FLUSH_INTERVAL": float,
+    "PERSIST_ROTATE_MB": float,
+    "REPORT_CROSS_CHECK": ("Y", "N"),
+    "METRICS_PORT": int,
+    "METRICS_INTERVAL": float,
+    "MARKET_DATA": ("Y", "N"),
+    "MAX_POSITION": float,
+    "MAX_OPEN_NOTIONAL": float,
+    "MAX_ORDER_RATE": float,
+    "PRICE_RANGES": priceRanges,
+    "STARTUP_PROFILE": ("Y", "N"),
+}
 
 def parse_fix_message(message):
     """
@@ -8,9 +64,49 @@ def parse_fix_message(message):
     """
     return message.toString().replace("\x01", " ")
 
-def setup_logger(name, log_file, format_str, level=logging.INFO):
+class fix_message_text:
+    """
+    Raw FIX message captured on the callback thread, made readable only when the record is emitted
+    """
+    __slots__ = ("raw",)
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def __str__(self):
+        return self.raw.replace("\x01", " ")
+
+class sampling_filter(logging.Filter):
+    """
+    Keep a fraction of records per level, e.g. {logging.INFO: 0.1} keeps every 10th INFO record
+    """
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self.credits = {levelno: 0.0 for levelno in rates}
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno)
+        if rate is None or rate >= 1:
+            return True
+        self.credits[record.levelno] += rate
+        if self.credits[record.levelno] >= 1:
+            self.credits[record.levelno] -= 1
+            return True
+        return False
+
+class deferred_queue_handler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves message formatting to the QueueListener thread
+    """
+    def prepare(self, record):
+        return record
+
+def setup_logger(name, log_file, format_str, level=logging.INFO, queued=False, sample_rates=None):
     """
     Setup Logger
+    - queued: write through a QueueListener thread, callers only enqueue records
+    - sample_rates: fraction of records kept per level, e.g. {logging.INFO: 0.1}; no filter is installed when every rate is 1
     """
     formatter = logging.Formatter(format_str)
     handler = logging.FileHandler(log_file)
@@ -18,30 +114,154 @@ def setup_logger(name, log_file, format_str, level=logging.INFO):
 
     logger = logging.getLogger(name)
     logger.setLevel(level)
+
+    if queued:
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, handler)
+        listener.start()
+        _listeners[name] = listener
+        handler = deferred_queue_handler(log_queue)
+
+    if sample_rates and any(rate < 1 for rate in sample_rates.values()):
+        handler.addFilter(sampling_filter(sample_rates))
     logger.addHandler(handler)
 
     return logger
 
-def log(logger, message, level="INFO", _print=False):
+def stop_logger(logger):
+    """
+    Flush pending records of a queued logger and detach its handlers
+    """
+    listener = _listeners.pop(logger.name, None)
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+def loggerBacklog(logger):
+    """
+    Records queued but not yet written by a queued logger, 0 for synchronous loggers
+    """
+    listener = _listeners.get(logger.name)
+    return listener.queue.qsize() if listener is not None else 0
+
+def log(logger, message, *args, level="INFO", _print=False):
     """
     Log Messages and print
+    args are %-formatted into message only when the record is emitted
     """
     if logger is not None:
         if level == "ERROR":
-            logger.error(message)
+            logger.error(message, *args)
+        elif level == "WARNING":
+            logger.warning(message, *args)
         elif level == "DEBUG":
-            logger.debug(message)
+            logger.debug(message, *args)
         else:
-            logger.info(message)
+            logger.info(message, *args)
     
     if _print:
-        print(message)
+        print(message % args if args else message)
+
+def copySessionID(sessionID):
+    """
+    Return an owned copy of a quickfix SessionID, the one passed to callbacks belongs to the initiator/acceptor's Session
+    """
+    copy = quickfix.SessionID()
+    copy.fromString(sessionID.toString())
+    return copy
+
+def getSetting(settings, key, default=None, cast=str):
+    """
+    Read a custom key from the [DEFAULT] section of quickfix SessionSettings
+    """
+    if settings is None:
+        return default
+    dictionary = settings.get()
+    if not dictionary.has(key):
+        return default
+    return cast(dictionary.getString(key))
+
+def loadSettings(config_file):
+    """
+    Parse and validate a QuickFIX config once per process, later calls return the same SessionSettings until the file changes
+    Raises quickfix.ConfigError naming the first [DEFAULT] key of SETTINGS that does not parse, or a session
+    that cannot parse market data
+    """
+    key = (os.path.abspath(config_file), os.path.getmtime(config_file))
+    settings = _settings.get(key)
+    if settings is None:
+        settings = quickfix.SessionSettings(config_file)
+        validateSettings(settings, config_file)
+        _settings[key] = settings
+    return settings
+
+def sessionSettings(config_file, name):
+    """
+    Value of name for each [SESSION] of a QuickFIX config, falling back to [DEFAULT] (None when neither sets it)
+    """
+    default, sessions, section = None, [], None
+    with open(config_file) as file:
+        for line in file:
+            line = line.split("#", 1)[0].strip()
+            if line.startswith("["):
+                section = line.upper()
+                if section == "[SESSION]":
+                    sessions.append(None)
+                continue
+            key, _, value = line.partition("=")
+            if key.strip() != name:
+                continue
+            if section == "[SESSION]":
+                sessions[-1] = value.strip()
+            elif section == "[DEFAULT]":
+                default = value.strip()
+    return [default if value is None else value for value in sessions]
+
+def validateSettings(settings, config_file=None):
+    dictionary = settings.get()
+    for name, check in SETTINGS.items():
+        if not dictionary.has(name):
+            continue
+        value = dictionary.getString(name)
+        if isinstance(check, tuple):
+            if value not in check:
+                raise quickfix.ConfigError(f"{name}={value}, expected one of {', '.join(check)}")
+            continue
+        try:
+            check(value)
+        except ValueError:
+            raise quickfix.ConfigError(f"{name}={value} is not a valid {check.__name__}")
+
+    ### Without a DataDictionary QuickFIX does not know the MarketData repeating groups and orders their fields by tag,
+    ### extractEntries then finds no 269/270 and marks would silently stay at the fallback prices
+    if config_file is not None and dictionary.has("MARKET_DATA") and dictionary.getString("MARKET_DATA") == "Y":
+        if "N" in sessionSettings(config_file, "UseDataDictionary"):
+            raise quickfix.ConfigError("MARKET_DATA=Y needs UseDataDictionary=Y (and DataDictionary) in every session")
+
+def loadDataDictionary(path="FIX42.xml"):
+    """
+    Parse a FIX DataDictionary once per process, e.g. for replay
+    """
+    key = (os.path.abspath(path), os.path.getmtime(path))
+    dictionary = _dictionaries.get(key)
+    if dictionary is None:
+        dictionary = _dictionaries[key] = quickfix.DataDictionary(path)
+    return dictionary
 
 def saveData(data, filepath):
     """
     Save data to Results folder
+    data is an execution_store, a DataFrame or a list of dicts
     """
-    df = pd.DataFrame(data)
+    if hasattr(data, "to_dataframe"):
+        df = data.to_dataframe()
+    else:
+        import pandas as pd
+        df = pd.DataFrame(data)
     df.to_csv(filepath, index=False)
 
 def ensureDirectories():
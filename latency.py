@@ -0,0 +1,139 @@
+import json
+import threading
+from array import array
+
+PERCENTILES = [50, 90, 99, 99.9]
+
+class latency_histogram:
+    """
+    HDR-style histogram of nanosecond values in constant memory
+    Values are grouped by power of two, each split into 2**sub_bits linear sub-buckets (~3% precision for sub_bits=5)
+    """
+    def __init__(self, sub_bits=5):
+        self.sub_bits = sub_bits
+        self.sub_count = 1 << sub_bits
+        self.counts = array("Q", bytes(8 * (64 - sub_bits + 1) * self.sub_count))
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def index(self, value):
+        if value < self.sub_count:
+            return value
+        exponent = value.bit_length() - 1 - self.sub_bits
+        return (exponent + 1) * self.sub_count + (value >> exponent) - self.sub_count
+
+    def value(self, index):
+        """
+        Midpoint of the values counted at index
+        """
+        if index < self.sub_count:
+            return index
+        exponent = index // self.sub_count - 1
+        lower = (index % self.sub_count + self.sub_count) << exponent
+        return lower + ((1 << exponent) >> 1)
+
+    def record(self, value):
+        value = max(int(value), 0)
+        self.counts[self.index(value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, percentile):
+        if self.count == 0:
+            return None
+        target = max(int(self.count * percentile / 100 + 0.5), 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self.value(index), self.max)
+        return self.max
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        for attribute, pick in (("min", min), ("max", max)):
+            values = [value for value in (getattr(self, attribute), getattr(other, attribute)) if value is not None]
+            setattr(self, attribute, pick(values) if values else None)
+
+    def toDict(self):
+        return {
+            "sub_bits": self.sub_bits,
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+            "counts": {str(index): count for index, count in enumerate(self.counts) if count},
+        }
+
+    @classmethod
+    def fromDict(cls, data):
+        histogram = cls(data["sub_bits"])
+        for index, count in data["counts"].items():
+            histogram.counts[int(index)] = count
+        histogram.count = data["count"]
+        histogram.total = data["total"]
+        histogram.min = data["min"]
+        histogram.max = data["max"]
+        return histogram
+
+class latency_recorder:
+    """
+    Latency histograms keyed by (symbol, kind)
+    kinds: ack (send -> first ExecutionReport), fill (send -> first fill), cancel (cancel -> cancel ack), cancel_reject (cancel -> OrderCancelReject)
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+
+    def record(self, symbol, kind, value_ns):
+        with self._lock:
+            histogram = self.histograms.get((symbol, kind))
+            if histogram is None:
+                histogram = self.histograms[(symbol, kind)] = latency_histogram()
+            histogram.record(value_ns)
+
+    def merge(self, other):
+        with self._lock:
+            for key, histogram in other.histograms.items():
+                if key not in self.histograms:
+                    self.histograms[key] = latency_histogram(histogram.sub_bits)
+                self.histograms[key].merge(histogram)
+
+    def summary(self):
+        """
+        Return {(symbol, kind): {"count", "p50", "p90", "p99", "p99.9", "max"}} in microseconds
+        """
+        with self._lock:
+            summary = {}
+            for key, histogram in sorted(self.histograms.items()):
+                values = {"count": histogram.count}
+                for percentile in PERCENTILES:
+                    values[f"p{percentile:g}"] = histogram.percentile(percentile) / 1000
+                values["max"] = histogram.max / 1000
+                summary[key] = values
+            return summary
+
+    def export(self, filepath):
+        """
+        Write raw histograms as JSON
+        """
+        with self._lock:
+            data = [{"symbol": symbol, "kind": kind, "histogram": histogram.toDict()} for (symbol, kind), histogram in sorted(self.histograms.items())]
+        with open(filepath, "w") as file:
+            json.dump(data, file)
+
+    @classmethod
+    def load(cls, filepath):
+        recorder = cls()
+        with open(filepath) as file:
+            for entry in json.load(file):
+                recorder.histograms[(entry["symbol"], entry["kind"])] = latency_histogram.fromDict(entry["histogram"])
+        return recorder
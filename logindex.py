@@ -0,0 +1,348 @@
+import os
+import re
+import json
+import mmap
+import time
+import zlib
+import argparse
+import numpy as np
+
+from extract import SOH, field_extractor, extractFields
+from store import execution_store
+from helpers import log, saveData
+
+### FIX message lines of a fix_pricing session log ("<asctime> <LEVEL> [<callback>] 8=...")
+### or of a QuickFIX FileLogPath messages log ("<YYYYMMDD-HH:MM:SS.fff> : 8=..."); raw (SOH) or readable (space-separated)
+MESSAGE_LINE = re.compile(rb"^(?:\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3} \w+ \[(\w+)\]|\d{8}-\d\d:\d\d:\d\d(?:\.\d+)? :) (8=FIX[^\n]*)$", re.M)
+### Tags indexed: MsgType, MsgSeqNum, ClOrdID, OrigClOrdID (links cancels to their order), OrderID
+INDEX_TAGS = ("35", "34", "11", "41", "37")
+INDEX_FIELD = re.compile(rb"(?:^|[\x01 ])(35|34|11|41|37)=([^\x01 \n]*)")
+### OrderID of an OrderCancelReject for an unknown order, not a link between messages
+NO_ORDER_ID = {"", "NONE"}
+
+### Sidecar directory <log>.idx: meta.json, entries.bin (offset, length per message) and runs of keys (uint64, sorted) and positions (uint32)
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+### Runs are merged into one once there are more than this many
+MAX_RUNS = 8
+
+### Fields of sent messages kept in market data, as in templates.py (type, Side, Symbol, OrdType, Text) plus NEW_ORDER_TAGS / CANCEL_TAGS
+SEND_FIELDS = {
+    "D": {"11": str, "54": str, "55": str, "38": float, "44": float, "40": str, "58": str, "60": str}, #NewOrderSingle
+    "F": {"11": str, "41": str, "37": str, "54": str, "55": str, "58": str, "60": str}, #OrderCancelRequest
+}
+SEND_EXTRACTORS = {msgType: field_extractor(fields) for msgType, fields in SEND_FIELDS.items()}
+### Received MsgTypes stored as market data rows (see fix_pricing.processRecord)
+RECEIVE_TYPES = {"8", "9", "3"}
+
+def fieldKey(field):
+    """
+    64-bit key of a b"<tag>=<value>" field, two CRC32s; collisions are told apart by reading the line
+    """
+    return zlib.crc32(field) << 32 | zlib.crc32(field, 0x9E3779B9)
+
+class log_entry:
+    """
+    One message read back from the log: line offset and length, callback (toApp/fromApp/..., "" for QuickFIX logs),
+    indexed tags and the line itself
+    """
+    __slots__ = ("offset", "length", "direction", "msgType", "seqNum", "clOrdID", "origClOrdID", "orderID", "line")
+
+    def __init__(self, offset, line):
+        self.offset = offset
+        self.length = len(line)
+        self.line = line.decode("utf-8", "replace")
+        match = MESSAGE_LINE.match(line)
+        direction = match.group(1) if match else None
+        self.direction = direction.decode() if direction else ""
+        fields = {}
+        for tag, value in INDEX_FIELD.findall(match.group(2) if match else b""):
+            fields.setdefault(tag, value)
+        self.msgType, self.seqNum, self.clOrdID, self.origClOrdID, self.orderID = (
+            fields.get(tag.encode(), b"").decode("utf-8", "replace") for tag in INDEX_TAGS
+        )
+
+    def get(self, tag):
+        return {"35": self.msgType, "34": self.seqNum, "11": self.clOrdID, "41": self.origClOrdID, "37": self.orderID}[tag]
+
+class log_index:
+    """
+    Byte-offset index of the FIX messages of a session log, kept in a sidecar directory (<log>.idx)
+    The log is memory-mapped and scanned with one regex pass; update() only scans bytes appended since the last pass
+    (up to the last complete line) and adds one sorted run of keys, rebuilding from scratch when the log was truncated or replaced
+    Lookups by ClOrdID (11), OrigClOrdID (41), OrderID (37), MsgType (35) and MsgSeqNum (34) binary-search the memory-mapped
+    runs, so a query costs milliseconds whatever the size of the log and nothing is loaded up front
+    """
+    def __init__(self, filepath, index_path=None):
+        self.filepath = filepath
+        self.index_path = index_path or filepath + INDEX_SUFFIX
+        self.meta = {"version": INDEX_VERSION, "fingerprint": None, "end": 0, "entries": 0, "runs": []}
+        self._entries = None
+        self._runs = []
+
+    def __len__(self):
+        return self.meta["entries"]
+
+    @property
+    def end(self):
+        return self.meta["end"]
+
+    def _path(self, name):
+        return os.path.join(self.index_path, name)
+
+    def _fingerprint(self, data):
+        """
+        CRC of the log's first line, tells an appended log from a replaced one
+        """
+        first = data.find(b"\n")
+        return format(zlib.crc32(data[:first if first >= 0 else len(data)]), "08x")
+
+    #####################################################
+    def load(self):
+        """
+        Open the sidecar index (memory-mapped), returns False when there is none
+        Entries and runs written after meta.json by an interrupted pass are ignored and indexed again by update()
+        """
+        try:
+            with open(self._path("meta.json")) as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            return False
+        if meta.get("version") != INDEX_VERSION:
+            return False
+        self.meta = meta
+        self._open()
+        return True
+
+    def _open(self):
+        entries = self.meta["entries"]
+        self._entries = np.memmap(self._path("entries.bin"), dtype=np.int64, mode="r", shape=(entries, 2)) if entries else np.empty((0, 2), np.int64)
+        self._runs = [(np.load(self._path(f"keys_{run}.npy"), mmap_mode="r"), np.load(self._path(f"positions_{run}.npy"), mmap_mode="r")) for run in self.meta["runs"]]
+
+    def _commit(self):
+        path = self._path("meta.json")
+        with open(path + ".tmp", "w") as file:
+            json.dump(self.meta, file)
+        os.replace(path + ".tmp", path)
+        self._open()
+
+    def reset(self, fingerprint):
+        """
+        Drop the index and start a new one for a log with this fingerprint
+        """
+        os.makedirs(self.index_path, exist_ok=True)
+        for name in os.listdir(self.index_path):
+            os.remove(self._path(name))
+        self.meta = {"version": INDEX_VERSION, "fingerprint": fingerprint, "end": 0, "entries": 0, "runs": []}
+        self._commit()
+
+    def update(self):
+        """
+        Index messages appended to the log since the last pass, returns the number of new messages
+        """
+        if self._entries is None:
+            self.load()
+        size = os.path.getsize(self.filepath)
+        if size == 0:
+            return 0
+        with open(self.filepath, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            fingerprint = self._fingerprint(data)
+            if fingerprint != self.meta["fingerprint"] or size < self.end:
+                self.reset(fingerprint)
+            ### Only complete lines, a line being written is indexed by the next pass
+            end = data.rfind(b"\n", self.end) + 1
+            if end <= self.end:
+                return 0
+            position = self.meta["entries"]
+            spans = []
+            keys = []
+            positions = []
+            for match in MESSAGE_LINE.finditer(data, self.end, end):
+                spans.append((match.start(), match.end() - match.start()))
+                seen = set()
+                for tag, value in INDEX_FIELD.findall(match.group(2)):
+                    if tag not in seen and value:
+                        seen.add(tag)
+                        keys.append(fieldKey(tag + b"=" + value))
+                        positions.append(position)
+                position += 1
+
+        new = len(spans)
+        if new:
+            ### entries.bin past meta["entries"] is left over from an interrupted pass
+            with open(self._path("entries.bin"), "r+b" if os.path.exists(self._path("entries.bin")) else "wb") as file:
+                file.seek(self.meta["entries"] * 16)
+                file.write(np.asarray(spans, dtype=np.int64).tobytes())
+                file.truncate()
+            keys = np.asarray(keys, dtype=np.uint64)
+            positions = np.asarray(positions, dtype=np.uint32)
+            run = max(self.meta["runs"], default=-1) + 1
+            self._writeRun(run, keys, positions)
+            self.meta["runs"].append(run)
+            self.meta["entries"] += new
+        self.meta["end"] = end
+        self._commit()
+        if len(self.meta["runs"]) > MAX_RUNS:
+            self.compact()
+        return new
+
+    def _writeRun(self, run, keys, positions):
+        order = np.argsort(keys, kind="stable")
+        np.save(self._path(f"keys_{run}.npy"), keys[order])
+        np.save(self._path(f"positions_{run}.npy"), positions[order])
+
+    def compact(self):
+        """
+        Merge every run into one
+        """
+        if len(self._runs) < 2:
+            return
+        old = list(self.meta["runs"])
+        run = max(old) + 1
+        self._writeRun(run, np.concatenate([keys for keys, _ in self._runs]), np.concatenate([positions for _, positions in self._runs]))
+        self.meta["runs"] = [run]
+        self._commit()
+        for stale in old:
+            os.remove(self._path(f"keys_{stale}.npy"))
+            os.remove(self._path(f"positions_{stale}.npy"))
+
+    #####################################################
+    def _positions(self, tag, value):
+        """
+        Positions with the key of tag=value in any run, sorted; may include key collisions
+        """
+        key = np.uint64(fieldKey(f"{tag}={value}".encode()))
+        positions = [run_positions[np.searchsorted(keys, key, side="left"):np.searchsorted(keys, key, side="right")] for keys, run_positions in self._runs]
+        return np.unique(np.concatenate(positions)) if positions else np.empty(0, np.uint32)
+
+    def read(self, positions, accept=None, limit=0):
+        """
+        log_entry of each position (message number in log order)
+        accept: keep only entries it returns True for, limit: stop after that many entries kept
+        """
+        if not len(positions):
+            return []
+        with open(self.filepath, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            entries = []
+            for position in positions:
+                offset, length = self._entries[position]
+                entry = log_entry(int(offset), data[offset:offset + length])
+                if accept is None or accept(entry):
+                    entries.append(entry)
+                    if len(entries) == limit:
+                        break
+            return entries
+
+    def find(self, tag, value, limit=0):
+        """
+        Messages whose tag (35, 34, 11, 41 or 37) equals value, in log order, at most limit of them (0 = all)
+        """
+        return self.read(self._positions(tag, value), lambda entry: entry.get(tag) == value, limit)
+
+    def chain(self, clOrdID):
+        """
+        Every message of an order, in log order: its NewOrderSingle and ExecutionReports, and the OrderCancelRequests,
+        ExecutionReports and OrderCancelRejects of cancels (linked by OrigClOrdID) and of the same OrderID
+        """
+        chain = {}
+        clOrdIDs = {clOrdID}
+        orderIDs = set()
+        pending = [("11", clOrdID), ("41", clOrdID)]
+        while pending:
+            tag, value = pending.pop()
+            for entry in self.find(tag, value):
+                if entry.offset in chain:
+                    continue
+                chain[entry.offset] = entry
+                for linked, values, tags in ((entry.clOrdID, clOrdIDs, ("11", "41")), (entry.orderID, orderIDs, ("37",))):
+                    if linked not in values and linked not in NO_ORDER_ID:
+                        values.add(linked)
+                        pending.extend((linked_tag, linked) for linked_tag in tags)
+        return [chain[offset] for offset in sorted(chain)]
+
+    #####################################################
+    def marketData(self):
+        """
+        Rebuild the market data table (see store.py) from the indexed NewOrderSingles, OrderCancelRequests, ExecutionReports,
+        OrderCancelRejects and Rejects; market orders have no Price (44) since it is not sent
+        """
+        store = execution_store()
+        positions = np.unique(np.concatenate([self._positions("35", msgType) for msgType in (*SEND_EXTRACTORS, *RECEIVE_TYPES)]))
+        for entry in self.read(positions):
+            if entry.msgType in SEND_EXTRACTORS:
+                record = SEND_EXTRACTORS[entry.msgType].extract(rawMessage(entry.line))
+                ### Sent rows have no header fields (see NEW_ORDER_TAGS / CANCEL_TAGS)
+                for tag in ("35", "52", "34"):
+                    record.pop(tag, None)
+                record["type"] = "send"
+            elif entry.msgType in RECEIVE_TYPES and entry.direction not in ("toApp", "toAdmin"):
+                record = extractFields(rawMessage(entry.line), entry.msgType)
+                record["type"] = "receive"
+            else:
+                continue
+            store.append(record)
+        return store
+
+def rawMessage(line):
+    """
+    FIX message of a log line, SOH-separated whatever format it was logged in
+    """
+    message = line[line.index("8=FIX"):]
+    if SOH not in message:
+        message = re.sub(r" (?=\d+=)", SOH, message.strip())
+    if not message.endswith(SOH):
+        message += SOH
+    return message
+
+def openIndex(filepath):
+    """
+    log_index of filepath, brought up to date
+    """
+    index = log_index(filepath)
+    index.update()
+    return index
+
+def rebuildMarketData(filepath, output=None):
+    """
+    Write market_data_<timestamp>.csv from the session log Log/<timestamp>.log, e.g. when the CSV is missing
+    """
+    if output is None:
+        output = os.path.join("Results", f"market_data_{os.path.splitext(os.path.basename(filepath))[0]}.csv")
+    store = openIndex(filepath).marketData()
+    saveData(store, output)
+    return output, len(store)
+
+def main():
+    parser = argparse.ArgumentParser(description="Index a session log (Log/<timestamp>.log or a QuickFIX messages log) and query it by order")
+    parser.add_argument("log", help="session log")
+    parser.add_argument("--order", nargs="+", default=[], help="print the message chain of each ClOrdID")
+    parser.add_argument("--order-id", nargs="+", default=[], help="print messages with this OrderID (37)")
+    parser.add_argument("--msg-type", help="print messages of this MsgType (35)")
+    parser.add_argument("--seq", nargs="+", default=[], help="print messages with this MsgSeqNum (34), both directions")
+    parser.add_argument("--limit", type=int, default=0, help="print at most N messages per query, 0 = all")
+    parser.add_argument("--rebuild", nargs="?", const="", metavar="CSV", help="write the market data table rebuilt from the log, default Results/market_data_<timestamp>.csv")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = log_index(args.log)
+    new = index.update()
+    log(None, f"Index {index.index_path}: {len(index):,} messages ({new:,} new) in {(time.perf_counter() - start) * 1000:,.1f}ms", _print=True)
+
+    queries = [(f"ClOrdID {clOrdID}", lambda clOrdID=clOrdID: index.chain(clOrdID)) for clOrdID in args.order]
+    queries += [(f"OrderID {orderID}", lambda orderID=orderID: index.find("37", orderID, args.limit)) for orderID in args.order_id]
+    queries += [(f"MsgSeqNum {seqNum}", lambda seqNum=seqNum: index.find("34", seqNum, args.limit)) for seqNum in args.seq]
+    if args.msg_type:
+        queries.append((f"MsgType {args.msg_type}", lambda: index.find("35", args.msg_type, args.limit)))
+    for name, query in queries:
+        start = time.perf_counter()
+        entries = query()
+        log(None, f"{name}: {len(entries):,} messages in {(time.perf_counter() - start) * 1000:,.3f}ms", _print=True)
+        for entry in entries[:args.limit or None]:
+            print(f"{' ':5}{entry.line.replace(SOH, ' ')}")
+
+    if args.rebuild is not None:
+        output, rows = rebuildMarketData(args.log, args.rebuild or None)
+        log(None, f"Rebuilt {rows:,} market data rows into {output}", _print=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import sys
+import datetime
+
+import client
+from simulator import start_acceptor
+from helpers import log, ensureDirectories
+
+def reportThroughput(fix_session):
+    """
+    Report sustained orders/sec, acks/sec (first ExecutionReport per order) and ExecutionReports/sec measured by fix_pricing
+    Called by client.main before the session logger is stopped, so the lines also go to Log/<timestamp>.log
+    """
+    stats = fix_session.throughput
+    if stats["first_send"] is None:
+        log(fix_session.logger, "No orders sent", level="ERROR", _print=True)
+        return
+
+    send_elapsed = max(stats["last_send"] - stats["first_send"], 1e-9)
+    ack_elapsed = max((stats["last_ack"] or stats["first_send"]) - stats["first_send"], 1e-9)
+    report_elapsed = max((stats["last_execution_report"] or stats["first_send"]) - stats["first_send"], 1e-9)
+    log(fix_session.logger, f"Loopback Throughput:", _print=True)
+    log(fix_session.logger, f"{' ':5}{'Orders Sent':13}: {stats['orders']:,} in {send_elapsed:.3f}s ({stats['orders'] / send_elapsed:,.1f} orders/sec)", _print=True)
+    log(fix_session.logger, f"{' ':5}{'Acks Received':13}: {stats['acks']:,} in {ack_elapsed:.3f}s ({stats['acks'] / ack_elapsed:,.1f} acks/sec)", _print=True)
+    log(fix_session.logger, f"{' ':5}{'Exec Reports':13}: {stats['execution_reports']:,} in {report_elapsed:.3f}s ({stats['execution_reports'] / report_elapsed:,.1f} ExecutionReports/sec)", _print=True)
+    if stats['refused'] or stats['risk_refused']:
+        log(fix_session.logger, f"{' ':5}{'Refused':13}: {stats['refused']:,} by the in-flight window, {stats['risk_refused']:,} by pre-trade limits", _print=True)
+    stage = fix_session.stage.stats()
+    log(fix_session.logger, f"{' ':5}{'Stage':13}: max depth {stage['max_depth']:,}, blocked {stage['blocked']:,}, dropped {stage['dropped']:,}, errors {stage['errors']:,}", _print=True)
+
+def main(simulator_config="simulator.cfg", client_config="loopback.cfg"):
+    """
+    Start the local simulator and run the client against it on loopback
+    """
+    now = datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    ensureDirectories()
+    acceptor, application = start_acceptor(simulator_config, start_timestamp=now)
+    try:
+        client.main(config_file=client_config, on_complete=reportThroughput)
+    finally:
+        acceptor.stop()
+        application.scheduler.stop()
+
+if __name__ == "__main__":
+    main(*sys.argv[1:3])
@@ -0,0 +1,209 @@
+import csv
+import bisect
+import threading
+
+from analytics import MARK_PRICES
+
+### MDEntryType (tag 269) values kept in the top of book
+BID = "0"
+OFFER = "1"
+TRADE = "2"
+### MDUpdateAction (tag 279) removing an entry
+DELETE = "2"
+
+### Columns of marks_<timestamp>.csv
+MARK_COLUMNS = ["time", "symbol", "bid", "offer", "last", "mark"]
+
+class top_of_book:
+    """
+    Best bid/offer and last trade of one symbol
+    """
+    __slots__ = ("bid", "bid_size", "offer", "offer_size", "last", "time")
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.bid = None
+        self.bid_size = None
+        self.offer = None
+        self.offer_size = None
+        self.last = None
+        self.time = None
+
+    def apply(self, entry):
+        """
+        Apply one NoMDEntries entry (tags 279/269/270/271), returns False for entry types not kept
+        """
+        entryType = entry.get("269")
+        delete = entry.get("279") == DELETE
+        price = None if delete else entry.get("270")
+        size = None if delete else entry.get("271")
+        if entryType == BID:
+            self.bid, self.bid_size = price, size
+        elif entryType == OFFER:
+            self.offer, self.offer_size = price, size
+        elif entryType == TRADE:
+            self.last = price
+        else:
+            return False
+        return True
+
+    def mark(self):
+        """
+        Mid of bid and offer, else last trade, else the one side quoted, None when empty
+        """
+        if self.bid is not None and self.offer is not None:
+            return round((self.bid + self.offer) / 2, 6)
+        if self.last is not None:
+            return self.last
+        return self.bid if self.bid is not None else self.offer
+
+class price_cache:
+    """
+    Per-symbol top of book fed by MarketDataSnapshotFullRefresh (35=W) and MarketDataIncrementalRefresh (35=X)
+    Each entry is applied in O(1); every change of a symbol's mark is appended to its time series, keyed by SendingTime (tag 52),
+    so PnL can be marked at any point of the session (see marksAt). Symbols without market data fall back to MARK_PRICES
+    """
+    def __init__(self, fallback=None):
+        self.fallback = dict(MARK_PRICES if fallback is None else fallback)
+        self._lock = threading.Lock()
+        self._books = {}
+        ### Mark time series per symbol: times for bisect, (time, bid, offer, last, mark) rows for export
+        self._times = {}
+        self._series = {}
+        self.updates = 0
+
+    def _book(self, symbol):
+        book = self._books.get(symbol)
+        if book is None:
+            book = self._books[symbol] = top_of_book()
+            self._times[symbol] = []
+            self._series[symbol] = []
+        return book
+
+    def _record(self, symbol, book, time):
+        mark = book.mark()
+        series = self._series[symbol]
+        if mark is None or (series and series[-1][4] == mark):
+            return
+        self._times[symbol].append(time)
+        series.append((time, book.bid, book.offer, book.last, mark))
+
+    def onSnapshot(self, symbol, entries, time):
+        """
+        Replace the book of symbol with a full refresh (35=W)
+        """
+        with self._lock:
+            book = self._book(symbol)
+            book.clear()
+            for entry in entries:
+                book.apply(entry)
+            book.time = time
+            self._record(symbol, book, time)
+            self.updates += 1
+
+    def onIncremental(self, entries, time):
+        """
+        Apply an incremental refresh (35=X), entries of any number of symbols
+        """
+        with self._lock:
+            changed = {}
+            for entry in entries:
+                symbol = entry.get("55")
+                if symbol is None:
+                    continue
+                book = self._book(symbol)
+                if book.apply(entry):
+                    book.time = time
+                    changed[symbol] = book
+            for symbol, book in changed.items():
+                self._record(symbol, book, time)
+            self.updates += 1
+
+    #####################################################
+    def mark(self, symbol):
+        """
+        Current mark of symbol, fallback price when it has no market data
+        """
+        book = self._books.get(symbol)
+        mark = book.mark() if book is not None else None
+        return self.fallback.get(symbol) if mark is None else mark
+
+    def marks(self):
+        """
+        Current marks of every symbol, {symbol: price}
+        """
+        with self._lock:
+            marks = dict(self.fallback)
+            for symbol, book in self._books.items():
+                mark = book.mark()
+                if mark is not None:
+                    marks[symbol] = mark
+            return marks
+
+    def markAt(self, symbol, time):
+        """
+        Mark of symbol as of time (SendingTime, YYYYMMDD-HH:MM:SS.sss), fallback price before its first quote
+        """
+        times = self._times.get(symbol)
+        index = bisect.bisect_right(times, time) - 1 if times else -1
+        if index < 0:
+            return self.fallback.get(symbol)
+        return self._series[symbol][index][4]
+
+    def marksAt(self, time):
+        """
+        Marks of every symbol as of time, {symbol: price}; current marks when time is None
+        """
+        if time is None:
+            return self.marks()
+        with self._lock:
+            marks = dict(self.fallback)
+            for symbol in self._series:
+                mark = self.markAt(symbol, time)
+                if mark is not None:
+                    marks[symbol] = mark
+            return marks
+
+    def book(self, symbol):
+        """
+        Top of book of symbol as a dict, None when not quoted
+        """
+        book = self._books.get(symbol)
+        if book is None:
+            return None
+        return {slot: getattr(book, slot) for slot in top_of_book.__slots__}
+
+    def __len__(self):
+        """
+        Number of recorded marks over all symbols
+        """
+        return sum(len(times) for times in self._times.values())
+
+    #####################################################
+    def export(self, filepath):
+        """
+        Write the mark time series as CSV (time, symbol, bid, offer, last, mark), ordered by time
+        """
+        with self._lock:
+            rows = sorted(((row[0], symbol) + row[1:] for symbol, series in self._series.items() for row in series), key=lambda row: row[0] or "")
+        with open(filepath, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(MARK_COLUMNS)
+            writer.writerows(rows)
+
+def loadMarks(filepath, fallback=None):
+    """
+    Rebuild a price_cache's mark time series from an exported marks_<timestamp>.csv
+    """
+    cache = price_cache(fallback)
+    with open(filepath, newline="") as file:
+        for row in csv.DictReader(file):
+            price = lambda column: float(row[column]) if row[column] else None
+            book = cache._book(row["symbol"])
+            book.bid, book.offer, book.last = price("bid"), price("offer"), price("last")
+            book.time = row["time"]
+            cache._times[row["symbol"]].append(row["time"])
+            cache._series[row["symbol"]].append((row["time"], book.bid, book.offer, book.last, price("mark")))
+    return cache
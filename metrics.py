@@ -0,0 +1,178 @@
+import time
+import threading
+
+from helpers import log
+
+class counter:
+    """
+    Monotonic counter; increments are not locked, each counter is written by a single thread
+    """
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+class counter_family:
+    """
+    Counters of one metric keyed by label values, children created on first use
+    """
+    def __init__(self, name, help_text, labelnames):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.children = {}
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            child = self.children.setdefault(values, counter())
+        return child
+
+class metrics_registry:
+    """
+    Counters updated on the send/receive paths and gauges read by callback at collection time
+    Rendered in Prometheus text format (see metrics_server) and summarized by stats_reporter
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+
+    def counter(self, name, help_text, labelnames=()):
+        """
+        Return the counter_family of name, or the counter itself when it has no labels
+        """
+        with self._lock:
+            family = self._counters.get(name)
+            if family is None:
+                family = self._counters[name] = counter_family(name, help_text, tuple(labelnames))
+        return family if family.labelnames else family.labels()
+
+    def gauge(self, name, help_text, function, kind="gauge"):
+        """
+        Register function() as the value of name; kind "counter" for totals kept elsewhere
+        """
+        with self._lock:
+            self._gauges[name] = (help_text, function, kind)
+
+    def total(self, name, **labels):
+        """
+        Sum of the children of counter name matching labels, or the value of gauge name
+        """
+        family = self._counters.get(name)
+        if family is None:
+            gauge = self._gauges.get(name)
+            return gauge[1]() if gauge is not None else 0
+        total = 0
+        for values, child in list(family.children.items()):
+            if all(values[family.labelnames.index(label)] == value for label, value in labels.items()):
+                total += child.value
+        return total
+
+    def render(self):
+        """
+        Prometheus text exposition format
+        """
+        lines = []
+        with self._lock:
+            counters = list(self._counters.values())
+            gauges = list(self._gauges.items())
+        for family in counters:
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} counter")
+            for values, child in sorted(list(family.children.items())):
+                labels = ",".join(f'{label}="{value}"' for label, value in zip(family.labelnames, values))
+                lines.append(f"{family.name}{{{labels}}} {child.value}" if labels else f"{family.name} {child.value}")
+        for name, (help_text, function, kind) in gauges:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {function()}")
+        return "\n".join(lines) + "\n"
+
+class metrics_server(threading.Thread):
+    """
+    Local HTTP endpoint serving registry.render() on /metrics
+    """
+    def __init__(self, registry, port, host="127.0.0.1"):
+        super().__init__(daemon=True)
+        ### http.server is only loaded when METRICS_PORT is set
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                return
+
+        self.server = ThreadingHTTPServer((host, port), handler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+### One-line stats: (label, metric, labels, rate) - rate=True prints the per-second change since the last line
+STATS_LINE = [
+    ("orders/s", "fix_orders_sent_total", {}, True),
+    ("acks/s", "fix_acks_total", {}, True),
+    ("exec reports/s", "fix_messages_total", {"direction": "in", "msg_type": "8"}, True),
+    ("in-flight", "fix_in_flight", {}, False),
+    ("outstanding", "fix_outstanding_orders", {}, False),
+    ("rejects", "fix_rejects_total", {}, False),
+    ("cancel-rejects", "fix_cancel_rejects_total", {}, False),
+    ("stage", "fix_stage_depth", {}, False),
+    ("log backlog", "fix_log_backlog", {}, False),
+    ("persist backlog", "fix_persist_backlog", {}, False),
+]
+
+class stats_reporter(threading.Thread):
+    """
+    Print a one-line summary of registry every interval seconds
+    """
+    def __init__(self, registry, interval, logger=None, fields=None):
+        super().__init__(daemon=True)
+        self.registry = registry
+        self.interval = interval
+        self.logger = logger
+        self.fields = fields or STATS_LINE
+        self._stopped = threading.Event()
+        self._last = None
+
+    def line(self):
+        now = time.perf_counter()
+        values = {label: self.registry.total(metric, **labels) for label, metric, labels, _ in self.fields}
+        parts = []
+        for label, _, _, rate in self.fields:
+            value = values[label]
+            if rate:
+                if self._last is not None:
+                    last_time, last_values = self._last
+                    value = (value - last_values[label]) / max(now - last_time, 1e-9)
+                else:
+                    value = 0
+                parts.append(f"{label} {value:,.1f}")
+            else:
+                parts.append(f"{label} {value:,}")
+        self._last = (now, values)
+        return "[stats] " + " | ".join(parts)
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            log(self.logger, self.line(), _print=True)
+
+    def close(self):
+        self._stopped.set()
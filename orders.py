@@ -0,0 +1,228 @@
+import random
+import threading
+
+### Order lifecycle states
+PENDING_NEW = "PENDING_NEW"
+NEW = "NEW"
+PARTIAL = "PARTIAL"
+FILLED = "FILLED"
+CANCELLED = "CANCELLED"
+REJECTED = "REJECTED"
+
+TERMINAL_STATES = {FILLED, CANCELLED, REJECTED}
+
+### OrdStatus (tag 39) to lifecycle state, statuses not listed leave the state unchanged
+ORD_STATUS_STATES = {
+    "A": PENDING_NEW,
+    "0": NEW,
+    "1": PARTIAL,
+    "2": FILLED,
+    "3": CANCELLED, #Done for day
+    "4": CANCELLED,
+    "8": REJECTED,
+    "C": CANCELLED, #Expired
+}
+
+### ExecType (tag 150) overriding OrdStatus when it is more specific
+EXEC_TYPE_STATES = {
+    "4": CANCELLED,
+    "8": REJECTED,
+}
+
+class indexed_set:
+    """
+    Set with O(1) add, remove and uniform random choice
+    """
+    __slots__ = ("_items", "_positions")
+
+    def __init__(self):
+        self._items = []
+        self._positions = {}
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item):
+        return item in self._positions
+
+    def __iter__(self):
+        return iter(list(self._items))
+
+    def add(self, item):
+        if item not in self._positions:
+            self._positions[item] = len(self._items)
+            self._items.append(item)
+
+    def discard(self, item):
+        """
+        Remove item by moving the last item into its slot
+        """
+        position = self._positions.pop(item, None)
+        if position is None:
+            return
+        last = self._items.pop()
+        if position < len(self._items):
+            self._items[position] = last
+            self._positions[last] = position
+
+    def choice(self):
+        return random.choice(self._items) if self._items else None
+
+class order:
+    """
+    State of one NewOrderSingle
+    """
+    __slots__ = ("clOrdID", "orderID", "symbol", "side", "quantity", "price", "ordType", "transactTime", "state", "cancel_pending",
+                 "sent_ns", "cancel_sent_ns", "acked", "filled")
+
+    def __init__(self, clOrdID, symbol, side, quantity, price, ordType, transactTime, sent_ns=None):
+        self.clOrdID = clOrdID
+        self.orderID = None
+        self.symbol = symbol
+        self.side = side
+        self.quantity = quantity
+        self.price = price
+        self.ordType = ordType
+        self.transactTime = transactTime
+        self.state = PENDING_NEW
+        self.cancel_pending = False
+        ### perf_counter_ns of the send and of the last cancel request, for latency measurement
+        self.sent_ns = sent_ns
+        self.cancel_sent_ns = None
+        self.acked = False
+        self.filled = False
+
+class order_manager:
+    """
+    Lifecycle of sent orders keyed by ClOrdID, indexed by OrderID (37) and symbol
+    Live orders (not terminal, no cancel in flight) are kept in indexed_sets for O(1) random cancel targets
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.orders = {}
+        self.by_order_id = {}
+        self.live = indexed_set()
+        self.live_by_symbol = {}
+        ### Cancel request ClOrdID -> OrigClOrdID, while awaiting cancel ack or reject
+        self.cancels = {}
+
+    def __len__(self):
+        return len(self.orders)
+
+    def __contains__(self, clOrdID):
+        return clOrdID in self.orders
+
+    def get(self, clOrdID):
+        return self.orders.get(clOrdID)
+
+    def getByOrderID(self, orderID):
+        return self.by_order_id.get(orderID)
+
+    def liveCount(self, symbol=None):
+        with self._lock:
+            if symbol is None:
+                return len(self.live)
+            return len(self.live_by_symbol.get(symbol, ()))
+
+    def isLive(self, clOrdID):
+        with self._lock:
+            return clOrdID in self.live
+
+    def liveOrders(self, symbol=None):
+        """
+        Snapshot of live ClOrdIDs (optionally for symbol)
+        """
+        with self._lock:
+            if symbol is None:
+                return list(self.live)
+            return list(self.live_by_symbol.get(symbol, ()))
+
+    def _setLive(self, order_, live):
+        by_symbol = self.live_by_symbol.get(order_.symbol)
+        if by_symbol is None:
+            by_symbol = self.live_by_symbol[order_.symbol] = indexed_set()
+        if live:
+            self.live.add(order_.clOrdID)
+            by_symbol.add(order_.clOrdID)
+        else:
+            self.live.discard(order_.clOrdID)
+            by_symbol.discard(order_.clOrdID)
+
+    #####################################################
+    def add(self, clOrdID, symbol, side, quantity, price, ordType, transactTime, sent_ns=None):
+        """
+        Register a sent NewOrderSingle as PENDING_NEW
+        """
+        with self._lock:
+            order_ = order(clOrdID, symbol, side, quantity, price, ordType, transactTime, sent_ns)
+            self.orders[clOrdID] = order_
+            self._setLive(order_, True)
+            return order_
+
+    def discard(self, clOrdID):
+        """
+        Forget a NewOrderSingle that was registered but could not be sent
+        """
+        with self._lock:
+            order_ = self.orders.pop(clOrdID, None)
+            if order_ is not None:
+                self._setLive(order_, False)
+
+    def sampleLive(self, symbol=None):
+        """
+        Return a random live ClOrdID (optionally for symbol), None when there is none
+        """
+        with self._lock:
+            if symbol is None:
+                return self.live.choice()
+            by_symbol = self.live_by_symbol.get(symbol)
+            return by_symbol.choice() if by_symbol is not None else None
+
+    def onCancelSent(self, clOrdID, origClOrdID, sent_ns=None):
+        """
+        Take origClOrdID out of the live set while its cancel is in flight
+        """
+        with self._lock:
+            order_ = self.orders.get(origClOrdID)
+            if order_ is None:
+                return
+            self.cancels[clOrdID] = origClOrdID
+            order_.cancel_pending = True
+            order_.cancel_sent_ns = sent_ns
+            self._setLive(order_, False)
+
+    def onExecutionReport(self, clOrdID, origClOrdID, orderID, ordStatus, execType):
+        """
+        Apply an ExecutionReport (tags 11/41/37/39/150), returns the affected order or None
+        """
+        with self._lock:
+            target = self.cancels.pop(clOrdID, None) or (clOrdID if clOrdID in self.orders else origClOrdID)
+            order_ = self.orders.get(target)
+            if order_ is None:
+                return None
+
+            if orderID and order_.orderID is None:
+                order_.orderID = orderID
+                self.by_order_id[orderID] = order_
+
+            state = EXEC_TYPE_STATES.get(execType) or ORD_STATUS_STATES.get(ordStatus)
+            if state is not None and order_.state not in TERMINAL_STATES:
+                order_.state = state
+            if order_.state in TERMINAL_STATES:
+                order_.cancel_pending = False
+                self._setLive(order_, False)
+            return order_
+
+    def onCancelReject(self, clOrdID):
+        """
+        Return the original order of a rejected cancel to the live set if it is still working
+        """
+        with self._lock:
+            origClOrdID = self.cancels.pop(clOrdID, None)
+            order_ = self.orders.get(origClOrdID)
+            if order_ is None:
+                return None
+            order_.cancel_pending = False
+            if order_.state not in TERMINAL_STATES:
+                self._setLive(order_, True)
+            return order_
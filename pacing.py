@@ -0,0 +1,94 @@
+import time
+import threading
+
+### Lateness the bucket catches up on by sending back to back: the larger of CATCH_UP_INTERVALS sends and CATCH_UP_SECONDS
+### Anything later is idleness (the caller stopped asking), the schedule restarts from now instead of bursting to make it up
+CATCH_UP_INTERVALS = 16
+CATCH_UP_SECONDS = 0.01
+
+class token_bucket:
+    """
+    Token bucket pacing orders at a target rate (orders/sec)
+    - steady: one token at a time, evenly spaced sends
+    - burst: up to burst_size tokens accumulate, sent back to back
+    - ramp: rate grows linearly from 10% to rate over ramp_seconds, then steady
+    A rate <= 0 disables pacing.
+    Implemented as virtual scheduling (GCRA): each token advances a theoretical send time by 1/rate.
+    Oversleeping or a scheduler/GC stall up to the catch-up allowance is made up by sending without sleeping,
+    so it does not lower the achieved rate; a longer gap restarts the schedule (with capacity tokens available).
+    """
+    def __init__(self, rate, profile="steady", burst_size=1, ramp_seconds=0):
+        if profile not in ("steady", "burst", "ramp"):
+            raise ValueError(f"Unknown rate profile {profile}")
+        self.rate = rate
+        self.profile = profile
+        self.capacity = max(burst_size, 1) if profile == "burst" else 1
+        self.ramp_seconds = ramp_seconds if profile == "ramp" else 0
+        self.start = None
+        self.next_send = None
+        ### Senders on several threads each reserve their own send time, then sleep outside the lock
+        self._lock = threading.Lock()
+
+    def currentRate(self, now):
+        """
+        Return the refill rate at time now
+        """
+        if self.ramp_seconds <= 0:
+            return self.rate
+        progress = min((now - self.start) / self.ramp_seconds, 1.0)
+        return self.rate * (0.1 + 0.9 * progress)
+
+    def acquire(self):
+        """
+        Block until a token is available and consume it
+        """
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.perf_counter()
+            if self.start is None:
+                self.start = self.next_send = now
+
+            rate = self.currentRate(now)
+            if now - self.next_send > max(CATCH_UP_INTERVALS / rate, CATCH_UP_SECONDS):
+                ### Idle: unused tokens accumulate up to capacity
+                self.next_send = now - (self.capacity - 1) / rate
+            send_at = self.next_send
+            self.next_send += 1 / rate
+        if send_at > now:
+            time.sleep(send_at - now)
+
+class in_flight_window:
+    """
+    Caps requests sent but not yet answered (by ClOrdID)
+    acquire blocks while limit requests are in flight, release is idempotent so every response can release its ClOrdID
+    A limit <= 0 disables the cap.
+    """
+    def __init__(self, limit=0):
+        self.limit = limit
+        self._in_flight = set()
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        return len(self._in_flight)
+
+    def acquire(self, clOrdID, timeout=None):
+        """
+        Take a slot for clOrdID, waiting up to timeout seconds (None: forever, 0: don't wait)
+        Returns False when the window stayed full
+        """
+        with self._condition:
+            if self.limit > 0 and not self._condition.wait_for(lambda: len(self._in_flight) < self.limit, timeout):
+                return False
+            self._in_flight.add(clOrdID)
+            return True
+
+    def release(self, *clOrdIDs):
+        with self._condition:
+            released = False
+            for clOrdID in clOrdIDs:
+                if clOrdID in self._in_flight:
+                    self._in_flight.discard(clOrdID)
+                    released = True
+            if released:
+                self._condition.notify_all()
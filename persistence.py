@@ -0,0 +1,193 @@
+import os
+import csv
+import glob
+import threading
+
+from store import COLUMNS
+
+EXTENSIONS = {
+    "csv": "csv",
+    "parquet": "parquet",
+    "arrow": "arrow",
+}
+
+def arrowSchema():
+    """
+    Fixed Arrow schema for market data so every batch of a segment matches
+    """
+    import pyarrow as pa
+    return pa.schema([(tag, pa.float64() if kind == "float" else pa.string()) for tag, kind in COLUMNS.items()])
+
+class segment_writer(threading.Thread):
+    """
+    Background writer draining an execution_store to append-only segment files
+    - a batch is written every flush_interval seconds, or as soon as batch_rows rows are buffered
+    - file_format: csv, parquet or arrow (Arrow IPC); parquet and arrow need pyarrow
+    - rotate_bytes > 0 starts a new segment <basepath>_<n>.<ext> once a segment reaches that size
+    """
+    def __init__(self, store, basepath, file_format="csv", batch_rows=10000, flush_interval=1.0, rotate_bytes=0):
+        super().__init__(daemon=True)
+        if file_format not in EXTENSIONS:
+            raise ValueError(f"Unknown persistence format {file_format}")
+        self.store = store
+        self.basepath = basepath
+        self.file_format = file_format
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+
+        self.segments = []
+        self.rows_written = 0
+        self._file = None
+        self._writer = None
+        self._schema = arrowSchema() if file_format != "csv" else None
+
+        self._wake = threading.Event()
+        self._stopping = False
+        store.watch(batch_rows, self._wake)
+
+    @property
+    def backlog(self):
+        """
+        Rows buffered in the store and not yet written
+        """
+        return len(self.store)
+
+    def run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self.flush()
+
+    def close(self):
+        """
+        Write remaining rows and close the current segment
+        """
+        self._stopping = True
+        self._wake.set()
+        if self.is_alive():
+            self.join()
+        self.flush()
+        self._closeSegment()
+
+    #####################################################
+    def flush(self):
+        """
+        Drain buffered rows from the store and append them to the current segment
+        csv is written row by row with the csv module, so the default format never loads pandas
+        """
+        if self.file_format == "csv":
+            rows = self.store.drainRows()
+            if not rows:
+                return
+            if self._file is None:
+                self._openSegment()
+            writer = csv.writer(self._file)
+            if self._file.tell() == 0:
+                writer.writerow(COLUMNS)
+            writer.writerows(rows)
+            written = len(rows)
+        else:
+            df = self.store.drain()
+            if df.empty:
+                return
+            if self._file is None:
+                self._openSegment()
+            import pyarrow as pa
+            ### Categoricals are written as plain strings, their codes are only stable within this process
+            df = df.astype({tag: object for tag, kind in COLUMNS.items() if kind == "category"})
+            table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+            self._writer.write_table(table)
+            written = len(df)
+        self._file.flush()
+        self.rows_written += written
+
+        if self.rotate_bytes > 0 and self._file.tell() >= self.rotate_bytes:
+            self._closeSegment()
+
+    def _openSegment(self):
+        extension = EXTENSIONS[self.file_format]
+        if self.rotate_bytes > 0:
+            filepath = f"{self.basepath}_{len(self.segments) + 1:04d}.{extension}"
+        else:
+            filepath = f"{self.basepath}.{extension}"
+
+        if self.file_format == "csv":
+            self._file = open(filepath, "a", newline="")
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            self._file = pa.OSFile(filepath, "wb")
+            if self.file_format == "parquet":
+                self._writer = pq.ParquetWriter(self._file, self._schema)
+            else:
+                self._writer = pa.ipc.new_file(self._file, self._schema)
+        self.segments.append(filepath)
+
+    def _closeSegment(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def readSegments(filepaths):
+    """
+    Read csv, parquet or arrow segments into one DataFrame
+    """
+    import pandas as pd
+    if isinstance(filepaths, str):
+        filepaths = [filepaths]
+    frames = []
+    for filepath in filepaths:
+        extension = os.path.splitext(filepath)[1]
+        if extension == ".parquet":
+            frames.append(pd.read_parquet(filepath))
+        elif extension == ".arrow":
+            import pyarrow as pa
+            with pa.memory_map(filepath) as source:
+                frames.append(pa.ipc.open_file(source).read_pandas())
+        else:
+            frames.append(pd.read_csv(filepath))
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+def expandSegments(filepaths):
+    """
+    Resolve a path, glob pattern (e.g. Results/market_data_*.csv) or list of them to a sorted list of files
+    """
+    if isinstance(filepaths, str):
+        filepaths = [filepaths]
+    resolved = []
+    for filepath in filepaths:
+        if any(character in filepath for character in "*?["):
+            resolved.extend(sorted(glob.glob(filepath)))
+        else:
+            resolved.append(filepath)
+    return resolved
+
+def iterSegments(filepaths, columns, chunksize=1000000):
+    """
+    Yield DataFrames of at most chunksize rows holding only columns ({tag: dtype}) from csv, parquet or arrow segments
+    csv is read in typed chunks, parquet by row batches, arrow memory-mapped one record batch at a time
+    """
+    import pandas as pd
+    for filepath in expandSegments(filepaths):
+        extension = os.path.splitext(filepath)[1]
+        if extension == ".parquet":
+            import pyarrow.parquet as pq
+            parquet = pq.ParquetFile(filepath)
+            wanted = [tag for tag in columns if tag in parquet.schema_arrow.names]
+            for batch in parquet.iter_batches(batch_size=chunksize, columns=wanted):
+                yield batch.to_pandas().astype({tag: columns[tag] for tag in wanted})
+        elif extension == ".arrow":
+            import pyarrow as pa
+            with pa.memory_map(filepath) as source:
+                reader = pa.ipc.open_file(source)
+                wanted = [tag for tag in columns if tag in reader.schema.names]
+                for index in range(reader.num_record_batches):
+                    batch = reader.get_batch(index).select(wanted)
+                    for start in range(0, batch.num_rows, chunksize):
+                        yield batch.slice(start, chunksize).to_pandas().astype({tag: columns[tag] for tag in wanted})
+        else:
+            yield from pd.read_csv(filepath, usecols=lambda tag: tag in columns, dtype=columns, chunksize=chunksize)
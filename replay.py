@@ -0,0 +1,186 @@
+import re
+import csv
+import time
+import argparse
+import datetime
+import quickfix
+
+from application import fix_pricing
+from helpers import log, ensureDirectories, stop_logger, loadSettings, loadDataDictionary
+from extract import SOH
+
+### "<asctime> <LEVEL> [<callback>] <FIX message>" lines written by fix_pricing's logger
+LOG_LINE = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}) \w+ \[(fromApp|fromAdmin|toApp)\] (.*)$")
+### Field boundary of a readable (space-separated) message
+READABLE_SEPARATOR = re.compile(r" (?=\d+=)")
+FIELD = re.compile(f"(?:^|{SOH})(\\d+)=([^{SOH}]*)")
+
+HEADER_TAGS = {"8", "9", "35", "34", "49", "52", "56", "10"}
+INTEGER_TAGS = {"34", "39", "40", "54", "150", "45", "371", "373"}
+
+class replay_session:
+    """
+    Stands in for quickfix.Session: outgoing messages go through application.toApp instead of a socket
+    """
+    def __init__(self):
+        self.application = None
+
+    def sendToTarget(self, message, sessionID):
+        self.application.toApp(message, sessionID)
+        return True
+
+def parseTimestamp(value, format_str):
+    try:
+        return datetime.datetime.strptime(value, format_str).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+def readLog(filepath):
+    """
+    Yield (timestamp, callback, raw) from a fix_pricing session log, raw or readable format
+    """
+    with open(filepath, encoding="utf-8", errors="replace") as file:
+        for line in file:
+            match = LOG_LINE.match(line.rstrip("\n"))
+            if match is None:
+                continue
+            asctime, callback, body = match.groups()
+            if not body.startswith("8=") and not body.startswith("9="):
+                continue
+            if SOH not in body:
+                body = READABLE_SEPARATOR.sub(SOH, body.strip())
+            if not body.endswith(SOH):
+                body += SOH
+            yield parseTimestamp(asctime, "%Y-%m-%d %H:%M:%S,%f"), callback, body
+
+def readMarketData(filepath):
+    """
+    Yield (timestamp, callback, raw) rebuilt from a market_data CSV
+    """
+    last_timestamp = None
+    with open(filepath, newline="") as file:
+        for row in csv.DictReader(file):
+            fields = {tag: value for tag, value in row.items() if tag != "type" and value != ""}
+            if row["type"] == "send":
+                fields["35"] = quickfix.MsgType_OrderCancelRequest if "41" in fields else quickfix.MsgType_NewOrderSingle
+                callback = "toApp"
+                timestamp = parseTimestamp(fields.get("60"), "%Y%m%d-%H:%M:%S.%f")
+            else:
+                callback = "fromAdmin" if fields.get("35") == quickfix.MsgType_Reject else "fromApp"
+                timestamp = parseTimestamp(fields.get("52"), "%Y%m%d-%H:%M:%S.%f")
+            ### Cancels repeat the original TransactTime, keep replay time monotonic
+            if timestamp is None or (last_timestamp is not None and timestamp < last_timestamp):
+                timestamp = last_timestamp
+            last_timestamp = timestamp
+            yield timestamp, callback, buildMessage(fields).toString()
+
+def buildMessage(fields):
+    """
+    Build a quickfix.Message from {tag: value} strings
+    """
+    message = quickfix.Message()
+    header = message.getHeader()
+    header.setField(8, "FIX.4.2")
+    for tag, value in fields.items():
+        ### pandas writes integer tags of mixed rows as floats
+        if tag in INTEGER_TAGS and value.endswith(".0"):
+            value = value[:-2]
+        if tag in HEADER_TAGS:
+            header.setField(int(tag), value)
+        else:
+            message.setField(int(tag), value)
+    return message
+
+def readSource(filepath):
+    if filepath.endswith(".csv"):
+        return readMarketData(filepath)
+    return readLog(filepath)
+
+#####################################################
+def replaySend(application, fields):
+    """
+    Re-issue a recorded NewOrderSingle or OrderCancelRequest through fix_pricing's send methods
+    """
+    msgType = fields.get("35")
+    if msgType == quickfix.MsgType_NewOrderSingle:
+        application.sendNewOrderSingle(
+            side=fields.get("54"),
+            symbol=fields.get("55"),
+            orderqty=float(fields.get("38", 0)),
+            price=float(fields.get("44", 0) or 0),
+            ordtype=fields.get("40", quickfix.OrdType_MARKET),
+            handl_inst=fields.get("21", quickfix.HandlInst_AUTOMATED_EXECUTION_ORDER_PRIVATE_NO_BROKER_INTERVENTION),
+            clOrdID=fields.get("11"),
+        )
+        return True
+    if msgType == quickfix.MsgType_OrderCancelRequest and fields.get("41") in application._Market_Orders:
+        application.sendOrderCancelRequest(origClOrdID=fields.get("41"), clOrdID=fields.get("11"))
+        return True
+    return False
+
+def replay(filepath, speed=0, settings=None, data_dictionary="FIX42.xml", start_timestamp=None):
+    """
+    Feed a recorded session through fix_pricing callbacks
+    - speed <= 0: as fast as possible, otherwise recorded timing scaled by speed (2 = twice as fast)
+    Returns (application, stats)
+    """
+    start_timestamp = start_timestamp or datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    dictionary = loadDataDictionary(data_dictionary)
+    session = replay_session()
+    application = fix_pricing(session, start_timestamp=f"replay_{start_timestamp}", settings=settings)
+    session.application = application
+
+    sessionID = quickfix.SessionID("FIX.4.2", "REPLAY", "COUNTERPARTY")
+    application.onCreate(sessionID)
+    application.onLogon(sessionID)
+
+    messages = 0
+    first_recorded = None
+    start = time.perf_counter()
+    for timestamp, callback, raw in readSource(filepath):
+        if speed > 0 and timestamp is not None:
+            if first_recorded is None:
+                first_recorded = timestamp
+            delay = (timestamp - first_recorded) / speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+
+        if callback == "toApp":
+            if not replaySend(application, dict(FIELD.findall(raw))):
+                continue
+        else:
+            message = quickfix.Message(raw, dictionary, False)
+            if callback == "fromApp":
+                application.fromApp(message, sessionID)
+            else:
+                application.fromAdmin(message, sessionID)
+        messages += 1
+    application.close()
+    elapsed = max(time.perf_counter() - start, 1e-9)
+
+    stats = {"messages": messages, "elapsed": elapsed, "messages_per_sec": messages / elapsed}
+    log(application.logger, f"Replayed {messages:,} messages in {elapsed:.3f}s ({stats['messages_per_sec']:,.1f} messages/sec)", _print=True)
+    return application, stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded session (Log/<timestamp>.log or market_data CSV) through fix_pricing")
+    parser.add_argument("source", help="session log or market_data CSV")
+    parser.add_argument("--speed", type=float, default=0, help="0 = as fast as possible, N = N times recorded speed")
+    parser.add_argument("--config", default=None, help="config file for fix_pricing settings (LOG_MODE, ...)")
+    parser.add_argument("--report", action="store_true", help="also time report.processData over the replayed data")
+    args = parser.parse_args()
+
+    ensureDirectories()
+    now = datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    settings = loadSettings(args.config) if args.config else None
+    application, stats = replay(args.source, speed=args.speed, settings=settings, start_timestamp=now)
+    stop_logger(application.logger)
+
+    if args.report:
+        from report import processData
+        start = time.perf_counter()
+        processData(None, sessionid="REPLAY", start_timestamp=f"replay_{now}", data=application._Market_Data.to_dataframe())
+        log(None, f"processData over {len(application._Market_Data):,} rows in {time.perf_counter() - start:.3f}s", _print=True)
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,195 @@
+import os
+import argparse
 import datetime
-import pandas as pd
-import numpy as np
-from helpers import setup_logger, log
+from itertools import repeat
+from helpers import setup_logger, stop_logger, log, ensureDirectories
+from persistence import expandSegments, iterSegments
+from analytics import MARK_PRICES
+from marketdata import loadMarks
 
-def processData(filepath, sessionid, start_timestamp=datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')):
+ordType_map = {
+    1: "BUY",
+    2: "SELL",
+    3: "SHORT",
+}
+
+def summarizeSnapshot(snapshot, sessionid, start_timestamp=datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S'), latency=None):
     """
-    Generate summary statistics of latest simulation run
+    Generate summary of latest simulation run from a fix_pricing.snapshot(), without reading market data back
+    latency: latency_recorder.summary() appended as percentile table when given
+    """
+    logger = setup_logger(
+        name="summary",
+        log_file=f"Results/summary_{start_timestamp}.log",
+        format_str='%(message)s'
+    )
+    log(logger, f"Generating Report for Session {sessionid} - {start_timestamp}")
+
+    if not snapshot["orders"] and not snapshot["symbols"]:
+        log(logger, f"No Data Found for Session {sessionid} - {start_timestamp}", level="ERROR")
+        stop_logger(logger)
+        return
+
+    log(logger, f"Total Order Counts:")
+    for (symbol, side), value in sorted(snapshot["orders"].items()):
+        log(logger, f"{' ':5}NewOrder - {symbol:4}_{ordType_map[int(side)]:5}: {round(value,0):,}")
+    log(logger, f"{' ':5}{'Total NewOrder':18}: {round(sum(snapshot['orders'].values()),0):,}")
+    log(logger, f"{' ':5}{'Total CancelOrder':18}: {round(snapshot['cancels'],0):,}")
+
+    symbols = sorted(snapshot["symbols"].items())
+    log(logger, f"Total Trading Volume:")
+    for key, values in symbols:
+        log(logger, f"{' ':5}{key:5}: ${round(values['volume'],2):,}")
+    log(logger, f"{' ':5}Total: ${round(snapshot['total_volume'],2):,}")
+
+    log(logger, f"Profit and Loss (PNL) (diff(Buy/Sell_LastPx - MktPx)):")
+    for key, values in symbols:
+        log(logger, f"{' ':5}{key:5}: ${round(values['pnl'],2):,}")
+    log(logger, f"{' ':5}Total: ${round(snapshot['total_pnl'],2):,}")
+
+    log(logger, f"Volume Weighted Average Price (VWAP):")
+    for key, values in symbols:
+        log(logger, f"{' ':5}{key:5}: ${round(values['vwap'], 2):,}")
+
+    if latency:
+        logLatency(logger, latency)
+
+    stop_logger(logger)
+
+def logLatency(logger, latency):
+    """
+    Append latency_recorder.summary() as percentile table
+    """
+    log(logger, f"Round-trip Latency (us) p50 / p90 / p99 / p99.9 / max:")
+    for (symbol, kind), values in latency.items():
+        log(logger, f"{' ':5}{symbol:4} {kind:13}: {values['p50']:,.1f} / {values['p90']:,.1f} / {values['p99']:,.1f} / {values['p99.9']:,.1f} / {values['max']:,.1f} (n={values['count']:,})")
+
+### Columns the report reads, with the dtype they are read as; ids are never loaded, timestamps only to cut at a point in time
+REPORT_COLUMNS = {
+    "type": "category",
+    "58": "category", #Text
+    "55": "category", #Symbol
+    "54": "category", #Side
+    "39": "category", #OrdStatus
+    "31": "float64", #LastPx
+    "32": "float64", #LastShares
+}
+TIME_COLUMNS = {
+    "60": "object", #TransactTime of sends
+    "52": "object", #SendingTime of receives
+}
+
+def categoryValues(series, convert):
+    """
+    Return numpy values of a categorical series with convert applied to its categories only, NaN where missing
+    """
+    import numpy as np
+    import pandas as pd
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype("category")
+    categories = convert(series.cat.categories.to_series(index=None).astype(object))
+    return np.append(np.asarray(categories, dtype=np.float64), np.nan)[series.cat.codes.to_numpy()]
+
+class report_aggregate:
+    """
+    Partial aggregates of the summary report, updated one chunk at a time and merged across chunks, files and processes
+    - orders: {(Text, Symbol, Side): count} of sent messages
+    - symbols: {Symbol: [traded value, traded quantity, PnL against marks]} of non-rejected received messages
+    marks: {Symbol: mark price}, default MARK_PRICES; until: only rows sent/received up to this time (YYYYMMDD-HH:MM:SS.sss)
+    """
+    def __init__(self, marks=None, until=None):
+        self.marks = marks if marks is not None else MARK_PRICES
+        self.until = until
+        self.rows = 0
+        self.orders = {}
+        self.symbols = {}
+
+    def update(self, chunk):
+        """
+        Add one DataFrame chunk of market data, every metric in one vectorized pass
+        Categorical columns are converted per category, not per row
+        """
+        import numpy as np
+        import pandas as pd
+        if self.until is not None:
+            chunk = chunk[(chunk["52"].fillna(chunk["60"]).fillna("") <= self.until).to_numpy()]
+        self.rows += len(chunk)
+        numeric = lambda values: pd.to_numeric(values, errors="coerce")
+        msg = chunk["type"]
+        symbol = chunk["55"]
+        side = categoryValues(chunk["54"], numeric)
+        status = categoryValues(chunk["39"], numeric)
+
+        sends = (msg == "send").to_numpy()
+        counts = pd.DataFrame({"58": chunk["58"][sends], "55": symbol[sends], "54": side[sends]}).groupby(["58", "55", "54"], observed=True).size()
+        for key, count in counts.items():
+            self.orders[key] = self.orders.get(key, 0) + count
+
+        traded = (msg == "receive").to_numpy() & (status != 8) & symbol.notna().to_numpy()
+        side = side[traded]
+        lastPx = np.nan_to_num(chunk["31"].to_numpy(dtype=np.float64)[traded])
+        lastShares = np.nan_to_num(chunk["32"].to_numpy(dtype=np.float64)[traded])
+        mktpx = categoryValues(symbol, lambda values: values.map(self.marks))[traded]
+        pnlpx = np.where(side == 1, mktpx - lastPx, np.where((side == 2) | (side == 3), lastPx - mktpx, 0))
+        sums = pd.DataFrame({
+            "55": symbol[traded],
+            "value": lastPx * lastShares,
+            "32": lastShares,
+            "pnl": pnlpx * lastShares,
+        }).groupby("55", observed=True, sort=False).sum()
+        for key, value, quantity, pnl in sums.itertuples():
+            totals = self.symbols.setdefault(key, [0.0, 0.0, 0.0])
+            totals[0] += value
+            totals[1] += quantity
+            totals[2] += pnl
+        return self
+
+    def merge(self, other):
+        self.rows += other.rows
+        for key, count in other.orders.items():
+            self.orders[key] = self.orders.get(key, 0) + count
+        for key, values in other.symbols.items():
+            totals = self.symbols.setdefault(key, [0.0, 0.0, 0.0])
+            for index, value in enumerate(values):
+                totals[index] += value
+        return self
+
+def aggregateSegments(filepaths, chunksize=1000000, marks=None, until=None):
+    """
+    Aggregate market data files chunk by chunk, memory bounded by chunksize rows
+    """
+    aggregate = report_aggregate(marks, until)
+    columns = REPORT_COLUMNS if until is None else dict(REPORT_COLUMNS, **TIME_COLUMNS)
+    for chunk in iterSegments(filepaths, columns, chunksize=chunksize):
+        aggregate.update(chunk)
+    return aggregate
+
+def aggregateFiles(filepaths, chunksize=1000000, workers=1, marks=None, until=None):
+    """
+    Aggregate many files (segments or runs), one file per task over up to workers processes
     """
+    filepaths = expandSegments(filepaths)
+    aggregate = report_aggregate(marks, until)
+    if workers <= 1 or len(filepaths) <= 1:
+        for filepath in filepaths:
+            aggregate.merge(aggregateSegments(filepath, chunksize, marks, until))
+        return aggregate
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=min(workers, len(filepaths))) as executor:
+        for partial in executor.map(aggregateSegments, filepaths, repeat(chunksize), repeat(marks), repeat(until)):
+            aggregate.merge(partial)
+    return aggregate
 
-    ordType_map = {
-        1: "BUY",
-        2: "SELL",
-        3: "SHORT",
-    }
+def processData(filepath, sessionid, start_timestamp=datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S'), data=None, chunksize=1000000, workers=1, latency=None, marks=None, until=None):
+    """
+    Generate summary statistics of latest simulation run
+    filepath: market data file, glob pattern (e.g. Results/market_data_*.csv) or list of files, csv/parquet/arrow
+    data: DataFrame of market data (e.g. execution_store.to_dataframe()), read from filepath when not given
+    chunksize: rows read at a time, workers: processes aggregating files in parallel
+    latency: latency_recorder.summary() appended as percentile table when given
+    marks: {Symbol: mark price} for PnL, default MARK_PRICES (e.g. fix_pricing.prices.marks() or marketdata.loadMarks(...).marksAt(until))
+    until: summarize only what was sent/received up to this time, i.e. mark to market at that point of the session
+    """
 
     ### Setting up logger
     logger = setup_logger(
@@ -21,19 +198,23 @@ def processData(filepath, sessionid, start_timestamp=datetime.datetime.utcnow().
         format_str='%(message)s'
     )
     log(logger, f"Generating Report for Session {sessionid} - {start_timestamp}")
+    if until is not None:
+        log(logger, f"As of {until}")
 
-    df = pd.read_csv(filepath)
-    if df.empty:
+    if data is None:
+        aggregate = aggregateFiles(filepath, chunksize=chunksize, workers=workers, marks=marks, until=until)
+    else:
+        aggregate = report_aggregate(marks, until).update(data)
+    if aggregate.rows == 0:
         log(logger, f"No Data Found for Session {sessionid} - {start_timestamp}", level="ERROR")
+        stop_logger(logger)
         return
-    
+
     ### Calculating Order Counts
-    df_orders = df[(df['type']=='send')]
-    df_order_counts = df_orders.groupby(['58', '55', '54']).agg({'11': 'count'})
     log(logger, f"Total Order Counts:")
     total_orders = 0
     total_cancels = 0
-    for key, value in df_order_counts.to_dict()['11'].items():
+    for key, value in sorted(aggregate.orders.items()):
         if key[0] == "NewOrderSingle":
             log(logger, f"{' ':5}NewOrder - {key[1]:4}_{ordType_map[key[2]]:5}: {round(value,0):,}")
             total_orders+=value
@@ -42,56 +223,45 @@ def processData(filepath, sessionid, start_timestamp=datetime.datetime.utcnow().
     log(logger, f"{' ':5}{'Total NewOrder':18}: {round(total_orders,0):,}")
     log(logger, f"{' ':5}{'Total CancelOrder':18}: {round(total_cancels,0):,}")
 
-
-    df_traded = df[(df['type']=='receive') & (df['39']!=8)]
-    df_traded = df_traded.fillna(0)
-    df_traded['value'] = df['31'] * df['32']
+    symbols = sorted(aggregate.symbols.items())
 
     ### (1) Calculating Trading Volume
-    trading_volume = df_traded.groupby('55').agg({'value': sum})
-    trading_volume_sum = trading_volume.sum()['value']
     log(logger, f"Total Trading Volume:")
-    for key, value in trading_volume.to_dict()['value'].items():
+    for key, (value, quantity, pnl) in symbols:
         log(logger, f"{' ':5}{key:5}: ${round(value,2):,}")
-    log(logger, f"{' ':5}Total: ${round(trading_volume_sum,2):,}")
-    
+    log(logger, f"{' ':5}Total: ${round(sum(values[0] for _, values in symbols),2):,}")
+
     ### (2) Calculating Profit and Loss (PNL)
-        ### Approach1: Sell + Sell Short - Buy
-    # def calc_pnl1(group):
-    #     values = group.groupby('54')['value'].sum()
-    #     return values[2.0] + values[3.0] - values[1.0]
-    # pnl = df_traded.groupby('55').apply(calc_pnl1)
-    # pnl_sum = pnl.sum()
-    # log(logger, f"Profit and Loss (PNL) (Sell + Sell Short - Buy):")
-    # for key, value in pnl.to_dict().items():
-    #     log(logger, f"{' ':5}{key:5}: ${round(value, 2):,}")
-    # log(logger, f"{' ':5}Total: ${round(pnl_sum,2):,}")
-
-        ### Approach2: diff(Buy/Sell_LastPx - MktPx)
-        ### Take price difference between execution price and market price (market price currently hardcoded, possibly to be taken from MarketDataRequest)
-    mktpx = {
-        'MSFT': 240,
-        'AAPL': 150,
-        'BAC': 32
-    }
-    pnl2 = df_traded.copy()
-    pnl2['mktpx'] = df_traded['55'].map(mktpx)
-    pnl2['pnlpx'] = np.where(pnl2['54']==1, pnl2['mktpx'] - pnl2['31'],
-                                 np.where(pnl2['54'].isin([2,3]), pnl2['31'] - pnl2['mktpx'], None))
-    pnl2['value2'] = pnl2['pnlpx'] * pnl2['32']
-    pnl2 = pnl2.groupby('55').agg({'value2': sum})
-    pnl_sum2 = pnl2.sum()['value2']
+        ### diff(Buy/Sell_LastPx - MktPx): price difference between execution price and market price (marks, default MARK_PRICES)
     log(logger, f"Profit and Loss (PNL) (diff(Buy/Sell_LastPx - MktPx)):")
-    for key, value in pnl2.to_dict()['value2'].items():
-        log(logger, f"{' ':5}{key:5}: ${round(value,2):,}")
-    log(logger, f"{' ':5}Total: ${round(pnl_sum2,2):,}")
+    for key, (value, quantity, pnl) in symbols:
+        log(logger, f"{' ':5}{key:5}: ${round(pnl,2):,}")
+    log(logger, f"{' ':5}Total: ${round(sum(values[2] for _, values in symbols),2):,}")
 
     ### (3) Calculating Volume Weighted Average Price (VWAP)
-    vwap = df_traded.groupby('55').agg({'value': sum, '32': sum})
-    vwap['vwap'] = vwap['value'] / vwap['32']
-    vwap['vwap'] = vwap['vwap'].fillna(0)
     log(logger, f"Volume Weighted Average Price (VWAP):")
-    for key, value in vwap.to_dict()['vwap'].items():
-        log(logger, f"{' ':5}{key:5}: ${round(value, 2):,}")
+    for key, (value, quantity, pnl) in symbols:
+        log(logger, f"{' ':5}{key:5}: ${round(value / quantity if quantity else 0, 2):,}")
+
+    if latency:
+        logLatency(logger, latency)
+
+    stop_logger(logger)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a summary report from market data files")
+    parser.add_argument("filepath", nargs="+", help="market data files or glob patterns (csv, parquet, arrow)")
+    parser.add_argument("--session", default="REPORT", help="session id shown in the report")
+    parser.add_argument("--chunksize", type=int, default=1000000, help="rows read at a time")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes aggregating files in parallel")
+    parser.add_argument("--marks", default=None, help="marks_<timestamp>.csv recorded from market data, PnL is marked to it instead of fixed prices")
+    parser.add_argument("--at", default=None, help="summarize up to this time (YYYYMMDD-HH:MM:SS.sss), marked to the marks at that time")
+    args = parser.parse_args()
+
+    ensureDirectories()
+    now = datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    marks = loadMarks(args.marks).marksAt(args.at) if args.marks else None
+    processData(args.filepath, sessionid=args.session, start_timestamp=f"report_{now}", chunksize=args.chunksize, workers=args.workers, marks=marks, until=args.at)
 
-    
\ No newline at end of file
+if __name__ == "__main__":
+    main()
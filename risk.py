@@ -0,0 +1,138 @@
+import time
+import threading
+
+### Reasons a NewOrderSingle is refused before it is sent
+MAX_POSITION = "max_position"
+MAX_OPEN_NOTIONAL = "max_open_notional"
+MAX_ORDER_RATE = "max_order_rate"
+
+class symbol_exposure:
+    """
+    Position and open (sent, not yet filled or done) exposure of one symbol, plus its order rate bucket
+    """
+    __slots__ = ("position", "open_buy", "open_sell", "open_notional", "tokens", "refilled")
+
+    def __init__(self, burst):
+        self.position = 0.0
+        self.open_buy = 0.0
+        self.open_sell = 0.0
+        self.open_notional = 0.0
+        self.tokens = burst
+        self.refilled = time.monotonic()
+
+class risk_cache:
+    """
+    Pre-trade limits per symbol, checked in O(1) before each NewOrderSingle
+    - max_position: |position| if every open order on the same side filled
+    - max_open_notional: quantity * price of open orders
+    - max_order_rate: NewOrderSingles per second, token bucket holding up to one second of orders (at least one order,
+      so rates below 1/sec still let an order through every 1/rate seconds)
+    A limit <= 0 disables that check. Updated incrementally: reserve() on send, onFill() and onDone() from ExecutionReports,
+    release() when a reserved order is not sent after all
+    """
+    def __init__(self, max_position=0, max_open_notional=0, max_order_rate=0):
+        self.max_position = max_position
+        self.max_open_notional = max_open_notional
+        self.max_order_rate = max_order_rate
+        self.burst = max(max_order_rate, 1)
+        self._lock = threading.Lock()
+        self._symbols = {}
+        ### ClOrdID -> [symbol exposure, side, open quantity, price] of open orders
+        self._open = {}
+
+    def _exposure(self, symbol):
+        exposure = self._symbols.get(symbol)
+        if exposure is None:
+            exposure = self._symbols[symbol] = symbol_exposure(self.burst)
+        return exposure
+
+    def reserve(self, clOrdID, symbol, side, quantity, price):
+        """
+        Check the limits for a new order and book its open exposure
+        Returns None when the order may be sent, otherwise the limit it breaks (nothing is booked)
+        """
+        with self._lock:
+            exposure = self._exposure(symbol)
+            if self.max_position > 0:
+                if side == "1":
+                    if exposure.position + exposure.open_buy + quantity > self.max_position:
+                        return MAX_POSITION
+                elif exposure.position - exposure.open_sell - quantity < -self.max_position:
+                    return MAX_POSITION
+            notional = quantity * price
+            if self.max_open_notional > 0 and exposure.open_notional + notional > self.max_open_notional:
+                return MAX_OPEN_NOTIONAL
+            if self.max_order_rate > 0:
+                now = time.monotonic()
+                exposure.tokens = min(exposure.tokens + (now - exposure.refilled) * self.max_order_rate, self.burst)
+                exposure.refilled = now
+                if exposure.tokens < 1:
+                    return MAX_ORDER_RATE
+                exposure.tokens -= 1
+
+            if side == "1":
+                exposure.open_buy += quantity
+            else:
+                exposure.open_sell += quantity
+            exposure.open_notional += notional
+            self._open[clOrdID] = [exposure, side, quantity, price]
+            return None
+
+    def onFill(self, clOrdID, lastShares):
+        """
+        Move lastShares of an open order into the position
+        """
+        with self._lock:
+            entry = self._open.get(clOrdID)
+            if entry is None:
+                return
+            exposure, side, quantity, price = entry
+            filled = min(lastShares, quantity)
+            entry[2] = quantity - filled
+            exposure.open_notional -= filled * price
+            if side == "1":
+                exposure.open_buy -= filled
+                exposure.position += lastShares
+            else:
+                exposure.open_sell -= filled
+                exposure.position -= lastShares
+
+    def onDone(self, clOrdID):
+        """
+        Release the unfilled quantity of an order that is filled, cancelled, rejected or was never sent
+        """
+        with self._lock:
+            entry = self._open.pop(clOrdID, None)
+            if entry is None:
+                return
+            exposure, side, quantity, price = entry
+            exposure.open_notional -= quantity * price
+            if side == "1":
+                exposure.open_buy -= quantity
+            else:
+                exposure.open_sell -= quantity
+
+    def release(self, clOrdID):
+        """
+        Undo reserve() for an order that was never sent: release its exposure and give its order rate token back
+        """
+        with self._lock:
+            entry = self._open.get(clOrdID)
+            if entry is not None and self.max_order_rate > 0:
+                entry[0].tokens = min(entry[0].tokens + 1, self.burst)
+        self.onDone(clOrdID)
+
+    def snapshot(self):
+        """
+        {symbol: {position, open_buy, open_sell, open_notional}}
+        """
+        with self._lock:
+            return {
+                symbol: {
+                    "position": exposure.position,
+                    "open_buy": exposure.open_buy,
+                    "open_sell": exposure.open_sell,
+                    "open_notional": exposure.open_notional,
+                }
+                for symbol, exposure in self._symbols.items()
+            }
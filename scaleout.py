@@ -0,0 +1,153 @@
+import os
+import argparse
+import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import client
+from helpers import log, ensureDirectories
+from latency import latency_recorder
+from persistence import expandSegments
+from report import processData
+
+SESSION_HEADER = "[SESSION]"
+DEFAULT_SYMBOLS = "MSFT,BAC,AAPL"
+
+def splitConfig(config_file):
+    """
+    Split a QuickFIX config into its [DEFAULT] block and one block per [SESSION]
+    """
+    with open(config_file) as file:
+        blocks = file.read().split(SESSION_HEADER)
+    return blocks[0], [f"{SESSION_HEADER}{block}" for block in blocks[1:]]
+
+def readDefault(default_block, key, default=None):
+    for line in default_block.splitlines():
+        name, _, value = line.partition("=")
+        if name.strip() == key:
+            return value.strip()
+    return default
+
+def shardSymbols(symbols, worker, workers):
+    """
+    Symbols owned by worker, round robin, so no symbol is traded by two workers
+    Raises ValueError when there are more workers than symbols
+    """
+    if workers > len(symbols):
+        raise ValueError(f"{workers} sessions but only {len(symbols)} SYMBOLS, every session needs a symbol of its own")
+    return symbols[worker::workers]
+
+def writeWorkerConfig(default_block, session_block, filepath, **overrides):
+    """
+    Write a single-session config, [DEFAULT] keys replaced by overrides
+    """
+    lines = [line for line in default_block.rstrip().splitlines() if line.partition("=")[0].strip() not in overrides]
+    lines += [f"{key}={value}" for key, value in overrides.items()]
+    with open(filepath, "w") as file:
+        file.write("\n".join(lines) + "\n\n" + session_block.strip() + "\n")
+    return filepath
+
+#####################################################
+def runWorker(config_file, start_timestamp):
+    """
+    Run one session in this process, return where its market data and latency went
+    """
+    fix_session = client.main(config_file=config_file, start_timestamp=start_timestamp)
+    return {
+        "session": str(fix_session.sessionID),
+        "symbols": fix_session.symbols,
+        "segments": expandSegments([f"Results/market_data_{start_timestamp}.*", f"Results/market_data_{start_timestamp}_[0-9][0-9][0-9][0-9].*"]),
+        "latency": f"Results/latency_{start_timestamp}.json",
+        "throughput": fix_session.throughput,
+        ### Final marks of the worker's own symbols, from its market data subscription
+        "marks": {symbol: mark for symbol, mark in fix_session.prices.marks().items() if symbol in fix_session.symbols},
+    }
+
+def reportThroughput(results):
+    """
+    Report orders/sec per worker and combined
+    perf_counter is system-wide (monotonic clock), so send times compare across worker processes
+    """
+    results = [result for result in results if result["throughput"]["first_send"] is not None]
+    if not results:
+        log(None, "No orders sent", level="ERROR", _print=True)
+        return
+    log(None, f"Scale-out Throughput:", _print=True)
+    for result in results:
+        stats = result["throughput"]
+        elapsed = max(stats["last_send"] - stats["first_send"], 1e-9)
+        log(None, f"{' ':5}{result['session']} ({','.join(result['symbols'])}): {stats['orders']:,} orders in {elapsed:.3f}s ({stats['orders'] / elapsed:,.1f} orders/sec)", _print=True)
+    orders = sum(result["throughput"]["orders"] for result in results)
+    elapsed = max(max(result["throughput"]["last_send"] for result in results) - min(result["throughput"]["first_send"] for result in results), 1e-9)
+    log(None, f"{' ':5}Total: {orders:,} orders in {elapsed:.3f}s ({orders / elapsed:,.1f} orders/sec)", _print=True)
+
+def main(config_file="scaleout.cfg", workers=None, simulator_config=None):
+    """
+    Coordinator: run every [SESSION] of config_file in its own process, each with a shard of SYMBOLS and a ClOrdID prefix,
+    then merge latency histograms and summarize all market data segments together
+    workers: processes to use, default one per session
+    simulator_config: also run the local simulator (simulator.py) in this process
+    """
+    now = datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    ensureDirectories()
+    default_block, session_blocks = splitConfig(config_file)
+    if not session_blocks:
+        log(None, f"No {SESSION_HEADER} found in {config_file}", level="ERROR", _print=True)
+        return
+    symbols = readDefault(default_block, "SYMBOLS", DEFAULT_SYMBOLS).split(",")
+    if len(session_blocks) > len(symbols):
+        log(None, f"{len(session_blocks)} sessions in {config_file} but only {len(symbols)} SYMBOLS, every session needs a symbol of its own", level="ERROR", _print=True)
+        return
+
+    configs = []
+    timestamps = []
+    for worker, session_block in enumerate(session_blocks):
+        configs.append(writeWorkerConfig(
+            default_block,
+            session_block,
+            f"Files/worker_{now}_{worker}.cfg",
+            SYMBOLS=",".join(shardSymbols(symbols, worker, len(session_blocks))),
+            CLORDID_PREFIX=f"W{worker}-",
+        ))
+        timestamps.append(f"{now}_w{worker}")
+
+    acceptor = None
+    if simulator_config:
+        from simulator import start_acceptor
+        acceptor, application = start_acceptor(simulator_config, start_timestamp=now)
+    try:
+        ### spawn: workers start without the coordinator's QuickFIX threads
+        with ProcessPoolExecutor(max_workers=workers or len(configs), mp_context=multiprocessing.get_context("spawn")) as executor:
+            results = list(executor.map(runWorker, configs, timestamps))
+    finally:
+        if acceptor is not None:
+            acceptor.stop()
+            application.scheduler.stop()
+
+    latency = latency_recorder()
+    for result in results:
+        if os.path.exists(result["latency"]):
+            latency.merge(latency_recorder.load(result["latency"]))
+    latency.export(f"Results/latency_{now}.json")
+    marks = {}
+    for result in results:
+        marks.update(result["marks"])
+
+    processData(
+        filepath=[segment for result in results for segment in result["segments"]],
+        sessionid=", ".join(result["session"] for result in results),
+        start_timestamp=now,
+        workers=len(results),
+        latency=latency.summary(),
+        marks=marks or None,
+    )
+    reportThroughput(results)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run every [SESSION] of a config in its own process and summarize them together")
+    parser.add_argument("config", nargs="?", default="scaleout.cfg", help="initiator config with one [SESSION] per worker")
+    parser.add_argument("--workers", type=int, default=None, help="processes to use, default one per session")
+    parser.add_argument("--simulator", default=None, help="also run the local simulator with this config, e.g. simulator.cfg")
+    args = parser.parse_args()
+    main(args.config, workers=args.workers, simulator_config=args.simulator)
@@ -0,0 +1,434 @@
+import re
+import quickfix
+import quickfix42
+import time
+import heapq
+import random
+import threading
+import datetime
+
+from helpers import fix_message_text, setup_logger, log, getSetting, ensureDirectories, copySessionID, loadSettings
+from extract import SOH
+
+### Reference prices used to fill market orders and check marketability of limit orders
+### They start here and random-walk while a session is subscribed to market data
+REFERENCE_PRICES = {
+    "MSFT": 240,
+    "AAPL": 150,
+    "BAC": 32,
+    "IBM": 150,
+}
+
+### Symbols (tag 55) of a MarketDataRequest, read from the raw message so no DataDictionary is needed for the NoRelatedSym group
+SYMBOL_PATTERN = re.compile(f"{SOH}55=([^{SOH}]*)")
+
+class scheduler(threading.Thread):
+    """
+    Single background thread that sends delayed responses in due-time order
+    """
+    def __init__(self):
+        super().__init__(daemon=True)
+        self._queue = []
+        self._sequence = 0
+        self._condition = threading.Condition()
+        self._running = True
+
+    def schedule(self, delay, callback, *args):
+        with self._condition:
+            self._sequence += 1
+            heapq.heappush(self._queue, (time.monotonic() + delay, self._sequence, callback, args))
+            self._condition.notify()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+    def run(self):
+        while True:
+            with self._condition:
+                while self._running and (not self._queue or self._queue[0][0] > time.monotonic()):
+                    timeout = (self._queue[0][0] - time.monotonic()) if self._queue else None
+                    self._condition.wait(timeout)
+                if not self._running:
+                    return
+                _, _, callback, args = heapq.heappop(self._queue)
+            callback(*args)
+
+class fix_acceptor(quickfix.Application):
+    """
+    Local FIX 4.2 counterparty answering NewOrderSingle and OrderCancelRequest
+    """
+    def __init__(self, settings=None, start_timestamp=datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')):
+        super().__init__()
+        self.logger = setup_logger(
+            name="simulator",
+            log_file=f"Log/simulator_{start_timestamp}.log",
+            format_str='%(asctime)s %(levelname)s %(message)s'
+        )
+        self.sessionID = None
+        ### Owned SessionID per session, responses go back to the session an order came from
+        self.sessions = {}
+
+        ### Probability that a marketable order is filled, that a fill is split into partial fills, and that an order is rejected
+        self.fill_ratio = getSetting(settings, "FILL_RATIO", 0.9, float)
+        self.partial_fill_ratio = getSetting(settings, "PARTIAL_FILL_RATIO", 0.3, float)
+        self.reject_rate = getSetting(settings, "REJECT_RATE", 0.01, float)
+        ### Response latency in milliseconds and max relative deviation of fill price from reference price
+        self.ack_latency = getSetting(settings, "ACK_LATENCY_MS", 0, float) / 1000
+        self.fill_latency = getSetting(settings, "FILL_LATENCY_MS", 1, float) / 1000
+        self.price_noise = getSetting(settings, "PRICE_NOISE", 0.02, float)
+        ### Market data: IncrementalRefresh every MD_INTERVAL_MS (0 = snapshots only), relative step of the price random walk and bid/offer spread
+        self.md_interval = getSetting(settings, "MD_INTERVAL_MS", 100, float) / 1000
+        self.md_volatility = getSetting(settings, "MD_VOLATILITY", 0.0005, float)
+        self.md_spread = getSetting(settings, "MD_SPREAD", 0.001, float)
+
+        self.order_index = 0
+        self.exec_index = 0
+        self._Orders = {}
+        self._lock = threading.Lock()
+        self.prices = dict(REFERENCE_PRICES)
+        ### Market data subscriptions per session: {session: (sessionID, MDReqID, symbols)}
+        self.subscriptions = {}
+        self._publishing = False
+
+        self.scheduler = scheduler()
+        self.scheduler.start()
+
+    #####################################################
+    # QuickFIX Application Methods
+
+    def onCreate(self, sessionID):
+        self.sessionID = self.sessions[sessionID.toString()] = copySessionID(sessionID)
+        log(self.logger, f"[onCreate] Simulator created with sessionID = {sessionID}")
+
+    def onLogon(self, sessionID):
+        log(self.logger, "[onLogon] Client Logged On")
+
+    def onLogout(self, sessionID):
+        log(self.logger, "[onLogout] Client Logged Out")
+        with self._lock:
+            self.subscriptions.pop(sessionID.toString(), None)
+
+    def toAdmin(self, message, sessionID):
+        return
+
+    def fromAdmin(self, message, sessionID):
+        return
+
+    def toApp(self, message, sessionID):
+        log(self.logger, "[toApp] %s", fix_message_text(message.toString()), level="DEBUG")
+
+    def fromApp(self, message, sessionID):
+        log(self.logger, "[fromApp] %s", fix_message_text(message.toString()), level="DEBUG")
+
+        msgType = quickfix.MsgType()
+        message.getHeader().getField(msgType)
+        sessionID = self.sessions.get(sessionID.toString(), self.sessionID)
+
+        if msgType.getValue() == quickfix.MsgType_NewOrderSingle:
+            self.onNewOrderSingle(message, sessionID)
+        elif msgType.getValue() == quickfix.MsgType_OrderCancelRequest:
+            self.onOrderCancelRequest(message, sessionID)
+        elif msgType.getValue() == quickfix.MsgType_MarketDataRequest:
+            self.onMarketDataRequest(message, sessionID)
+
+    #####################################################
+    def getFields(self, message, fields):
+        """
+        Read fields that are set on message into a dict keyed by tag
+        """
+        values = {}
+        for metric in fields:
+            if message.isSetField(metric):
+                message.getField(metric)
+                values[str(metric.getField())] = metric.getValue()
+        return values
+
+    def genOrderID(self):
+        self.order_index += 1
+        return f"SIM{self.order_index:08d}"
+
+    def genExecID(self):
+        self.exec_index += 1
+        return f"EXE{self.exec_index:08d}"
+
+    def respond(self, delay, callback, *args):
+        """
+        Send response after delay seconds, inline when there is no latency configured
+        """
+        if delay > 0:
+            self.scheduler.schedule(delay, callback, *args)
+        else:
+            callback(*args)
+
+    #####################################################
+    def onNewOrderSingle(self, message, sessionID):
+        """
+        Accept or reject a NewOrderSingle (tag 35=D) and schedule its fills
+        """
+        values = self.getFields(message, [
+            quickfix.ClOrdID(), quickfix.Side(), quickfix.Symbol(), quickfix.OrderQty(), quickfix.Price(), quickfix.OrdType()
+        ])
+        order = {
+            "11": values.get("11"),
+            "37": self.genOrderID(),
+            "54": values.get("54", quickfix.Side_BUY),
+            "55": values.get("55", ""),
+            "38": values.get("38", 0),
+            "44": values.get("44", 0),
+            "40": values.get("40", quickfix.OrdType_MARKET),
+            "14": 0, #CumQty
+            "6": 0, #AvgPx
+            "39": quickfix.OrdStatus_NEW,
+            "session": sessionID,
+        }
+
+        if random.random() < self.reject_rate:
+            order["39"] = quickfix.OrdStatus_REJECTED
+            self.respond(self.ack_latency, self.sendExecutionReport, order, quickfix.ExecType_REJECTED, 0, 0, "Simulated Reject")
+            return
+
+        with self._lock:
+            self._Orders[order["11"]] = order
+        self.respond(self.ack_latency, self.sendExecutionReport, order, quickfix.ExecType_NEW, 0, 0, "New")
+
+        fill_price = self.getFillPrice(order)
+        if fill_price is None or random.random() >= self.fill_ratio:
+            return
+
+        ### Split fill into two or three parts when partially filling
+        quantity = order["38"]
+        parts = random.randint(2, 3) if (random.random() < self.partial_fill_ratio and quantity > 3) else 1
+        for part in range(parts):
+            if part == parts - 1:
+                lastShares = quantity - int(quantity / parts) * part
+            else:
+                lastShares = int(quantity / parts)
+            delay = self.ack_latency + self.fill_latency * (part + 1)
+            self.respond(delay, self.fillOrder, order["11"], lastShares, fill_price)
+
+    def getFillPrice(self, order):
+        """
+        Return fill price around reference price, None if a limit order is not marketable
+        """
+        reference = self.prices.get(order["55"], order["44"] or 1)
+        price = round(reference * (1 + random.uniform(-self.price_noise, self.price_noise)), 2)
+        if order["40"] == quickfix.OrdType_LIMIT:
+            if order["54"] == quickfix.Side_BUY and order["44"] < price:
+                return None
+            if order["54"] != quickfix.Side_BUY and order["44"] > price:
+                return None
+        return price
+
+    def fillOrder(self, clOrdID, lastShares, lastPx):
+        """
+        Apply a fill to a live order and report it
+        """
+        with self._lock:
+            order = self._Orders.get(clOrdID)
+            if order is None or order["39"] in (quickfix.OrdStatus_FILLED, quickfix.OrdStatus_CANCELED):
+                return
+            order["6"] = (order["6"] * order["14"] + lastPx * lastShares) / (order["14"] + lastShares)
+            order["14"] += lastShares
+            if order["14"] >= order["38"]:
+                order["39"] = quickfix.OrdStatus_FILLED
+                execType = quickfix.ExecType_FILL
+                del self._Orders[clOrdID]
+            else:
+                order["39"] = quickfix.OrdStatus_PARTIALLY_FILLED
+                execType = quickfix.ExecType_PARTIAL_FILL
+        self.sendExecutionReport(order, execType, lastShares, lastPx, "Fill")
+
+    #####################################################
+    def onOrderCancelRequest(self, message, sessionID):
+        """
+        Cancel a live order (tag 35=F) or answer with OrderCancelReject (tag 35=9)
+        """
+        values = self.getFields(message, [quickfix.ClOrdID(), quickfix.OrigClOrdID()])
+        clOrdID = values.get("11")
+        origClOrdID = values.get("41")
+
+        with self._lock:
+            order = self._Orders.pop(origClOrdID, None)
+            if order is not None:
+                order["39"] = quickfix.OrdStatus_CANCELED
+
+        if order is None:
+            self.respond(self.ack_latency, self.sendOrderCancelReject, clOrdID, origClOrdID, "Too late to cancel", sessionID)
+            return
+
+        cancelled = dict(order)
+        cancelled.update({"11": clOrdID, "41": origClOrdID})
+        self.respond(self.ack_latency, self.sendExecutionReport, cancelled, quickfix.ExecType_CANCELED, 0, 0, "Cancelled")
+
+    #####################################################
+    def onMarketDataRequest(self, message, sessionID):
+        """
+        Answer a MarketDataRequest (tag 35=V) with a full refresh per symbol, keep publishing incremental refreshes for subscriptions
+        """
+        values = self.getFields(message, [quickfix.MDReqID(), quickfix.SubscriptionRequestType()])
+        mdReqID = values.get("262")
+        requestType = values.get("263", quickfix.SubscriptionRequestType_SNAPSHOT)
+        symbols = SYMBOL_PATTERN.findall(message.toString())
+
+        if requestType == quickfix.SubscriptionRequestType_DISABLE_PREVIOUS_SNAPSHOT_PLUS_UPDATE_REQUEST:
+            with self._lock:
+                self.subscriptions.pop(sessionID.toString(), None)
+            return
+
+        for symbol in symbols:
+            self.respond(self.ack_latency, self.sendMarketDataSnapshot, mdReqID, symbol, sessionID)
+        if requestType != quickfix.SubscriptionRequestType_SNAPSHOT_PLUS_UPDATES:
+            return
+        with self._lock:
+            self.subscriptions[sessionID.toString()] = (sessionID, mdReqID, symbols)
+            start = not self._publishing and self.md_interval > 0
+            self._publishing = self._publishing or start
+        if start:
+            self.scheduler.schedule(self.md_interval, self.publishMarketData)
+
+    def quote(self, symbol):
+        """
+        (bid, offer) around the current price of symbol
+        """
+        price = self.prices.get(symbol, 1)
+        return round(price * (1 - self.md_spread / 2), 2), round(price * (1 + self.md_spread / 2), 2)
+
+    def publishMarketData(self):
+        """
+        Move prices one random-walk step and send an IncrementalRefresh to every subscription, then schedule the next one
+        """
+        with self._lock:
+            for symbol in self.prices:
+                self.prices[symbol] = round(self.prices[symbol] * (1 + random.gauss(0, self.md_volatility)), 4)
+            subscriptions = list(self.subscriptions.values())
+            self._publishing = bool(subscriptions)
+        for sessionID, mdReqID, symbols in subscriptions:
+            self.sendMarketDataIncremental(mdReqID, symbols, sessionID)
+        if subscriptions:
+            self.scheduler.schedule(self.md_interval, self.publishMarketData)
+
+    #####################################################
+    def sendExecutionReport(self, order, execType, lastShares, lastPx, text):
+        """
+        Send ExecutionReport (tag 35=8)
+        """
+        message = quickfix.Message()
+        message.getHeader().setField(quickfix.MsgType(quickfix.MsgType_ExecutionReport))
+
+        cumQty = order["14"]
+        leavesQty = 0 if order["39"] in (quickfix.OrdStatus_FILLED, quickfix.OrdStatus_CANCELED, quickfix.OrdStatus_REJECTED) else order["38"] - cumQty
+
+        message.setField(quickfix.OrderID(order["37"])) #37
+        message.setField(quickfix.ClOrdID(order["11"])) #11
+        if "41" in order:
+            message.setField(quickfix.OrigClOrdID(order["41"])) #41
+        message.setField(quickfix.ExecID(self.genExecID())) #17
+        message.setField(quickfix.ExecTransType(quickfix.ExecTransType_NEW)) #20
+        message.setField(quickfix.ExecType(execType)) #150
+        message.setField(quickfix.OrdStatus(order["39"])) #39
+        message.setField(quickfix.Symbol(order["55"])) #55
+        message.setField(quickfix.Side(order["54"])) #54
+        message.setField(quickfix.OrdType(order["40"])) #40
+        message.setField(quickfix.OrderQty(order["38"])) #38
+        if order["40"] == quickfix.OrdType_LIMIT:
+            message.setField(quickfix.Price(order["44"])) #44
+        message.setField(quickfix.LastShares(lastShares)) #32
+        message.setField(quickfix.LastPx(lastPx)) #31
+        message.setField(quickfix.LeavesQty(leavesQty)) #151
+        message.setField(quickfix.CumQty(cumQty)) #14
+        message.setField(quickfix.AvgPx(order["6"])) #6
+        message.setField(quickfix.Text(text)) #58
+
+        self.send(message, order["session"])
+
+    def sendOrderCancelReject(self, clOrdID, origClOrdID, text, sessionID):
+        """
+        Send OrderCancelReject (tag 35=9)
+        """
+        message = quickfix.Message()
+        message.getHeader().setField(quickfix.MsgType(quickfix.MsgType_OrderCancelReject))
+
+        message.setField(quickfix.OrderID("NONE")) #37
+        message.setField(quickfix.ClOrdID(clOrdID)) #11
+        message.setField(quickfix.OrigClOrdID(origClOrdID)) #41
+        message.setField(quickfix.OrdStatus(quickfix.OrdStatus_REJECTED)) #39
+        message.setField(quickfix.CxlRejResponseTo(quickfix.CxlRejResponseTo_ORDER_CANCEL_REQUEST)) #434
+        message.setField(quickfix.CxlRejReason(quickfix.CxlRejReason_TOO_LATE_TO_CANCEL)) #102
+        message.setField(quickfix.Text(text)) #58
+
+        self.send(message, sessionID)
+
+    def sendMarketDataSnapshot(self, mdReqID, symbol, sessionID):
+        """
+        Send MarketDataSnapshotFullRefresh (tag 35=W): bid, offer and last price of symbol
+        """
+        message = quickfix42.MarketDataSnapshotFullRefresh()
+        message.setField(quickfix.MDReqID(mdReqID)) #262
+        message.setField(quickfix.Symbol(symbol)) #55
+        bid, offer = self.quote(symbol)
+        for entryType, price in [(quickfix.MDEntryType_BID, bid), (quickfix.MDEntryType_OFFER, offer), (quickfix.MDEntryType_TRADE, self.prices.get(symbol, 1))]:
+            group = quickfix42.MarketDataSnapshotFullRefresh.NoMDEntries()
+            group.setField(quickfix.MDEntryType(entryType)) #269
+            group.setField(quickfix.MDEntryPx(price)) #270
+            group.setField(quickfix.MDEntrySize(random.randint(1, 10) * 100)) #271
+            message.addGroup(group)
+        self.send(message, sessionID)
+
+    def sendMarketDataIncremental(self, mdReqID, symbols, sessionID):
+        """
+        Send MarketDataIncrementalRefresh (tag 35=X): changed bid and offer of each symbol
+        """
+        message = quickfix42.MarketDataIncrementalRefresh()
+        message.setField(quickfix.MDReqID(mdReqID)) #262
+        for symbol in symbols:
+            bid, offer = self.quote(symbol)
+            for entryType, price in [(quickfix.MDEntryType_BID, bid), (quickfix.MDEntryType_OFFER, offer)]:
+                group = quickfix42.MarketDataIncrementalRefresh.NoMDEntries()
+                group.setField(quickfix.MDUpdateAction(quickfix.MDUpdateAction_CHANGE)) #279
+                group.setField(quickfix.MDEntryType(entryType)) #269
+                group.setField(quickfix.Symbol(symbol)) #55
+                group.setField(quickfix.MDEntryPx(price)) #270
+                group.setField(quickfix.MDEntrySize(random.randint(1, 10) * 100)) #271
+                message.addGroup(group)
+        self.send(message, sessionID)
+
+    def send(self, message, sessionID):
+        try:
+            quickfix.Session.sendToTarget(message, sessionID)
+        except quickfix.SessionNotFound as ex:
+            log(self.logger, ex, level="ERROR")
+
+#####################################################
+def start_acceptor(config_file="simulator.cfg", start_timestamp=datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')):
+    """
+    Start the simulator SocketAcceptor, returns (acceptor, application)
+    """
+    settings = loadSettings(config_file)
+    application = fix_acceptor(settings, start_timestamp=start_timestamp)
+    acceptor = quickfix.SocketAcceptor(
+        application,
+        quickfix.MemoryStoreFactory(),
+        settings,
+        quickfix.FileLogFactory(settings),
+    )
+    acceptor.start()
+    return acceptor, application
+
+def main():
+    now = datetime.datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    ensureDirectories()
+    acceptor, application = start_acceptor(start_timestamp=now)
+    log(application.logger, "Simulator listening, press Ctrl+C to stop", _print=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        acceptor.stop()
+        application.scheduler.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import threading
+from collections import deque
+
+from helpers import log
+
+class processing_stage(threading.Thread):
+    """
+    Bounded queue between QuickFIX callbacks (single producer) and one consumer thread running handler(record)
+    - overflow "block": push waits for room, holding back the socket thread; "drop": push discards the record and counts it
+    - capacity <= 0: no queue, push runs handler inline on the caller's thread
+    """
+    def __init__(self, handler, capacity=65536, overflow="block", logger=None):
+        super().__init__(daemon=True)
+        if overflow not in ("block", "drop"):
+            raise ValueError(f"Unknown overflow policy {overflow}")
+        self.handler = handler
+        self.capacity = capacity
+        self.overflow = overflow
+        self.logger = logger
+
+        self._queue = deque()
+        self._ready = threading.Event()
+        self._room = threading.Condition()
+        self._waiting = False
+        self._closed = False
+
+        ### Counters, written by one thread each
+        self.pushed = 0
+        self.processed = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.errors = 0
+        self.max_depth = 0
+
+    def depth(self):
+        return len(self._queue)
+
+    def stats(self):
+        return {
+            "depth": len(self._queue),
+            "max_depth": self.max_depth,
+            "pushed": self.pushed,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "blocked": self.blocked,
+            "errors": self.errors,
+        }
+
+    def push(self, record):
+        """
+        Queue a record for the consumer, returns False when it was dropped
+        """
+        if self.capacity <= 0:
+            self.pushed += 1
+            self.process(record)
+            return True
+        if len(self._queue) >= self.capacity:
+            if self.overflow == "drop":
+                self.dropped += 1
+                return False
+            self.blocked += 1
+            with self._room:
+                self._waiting = True
+                self._room.wait_for(lambda: len(self._queue) < self.capacity or self._closed)
+                self._waiting = False
+        self._queue.append(record)
+        self.pushed += 1
+        depth = len(self._queue)
+        if depth > self.max_depth:
+            self.max_depth = depth
+        if not self._ready.is_set():
+            self._ready.set()
+        return True
+
+    def process(self, record):
+        try:
+            self.handler(record)
+        except Exception as ex:
+            self.errors += 1
+            log(self.logger, "[processing_stage] %s processing %s", repr(ex), record, level="ERROR")
+        self.processed += 1
+
+    def run(self):
+        queue = self._queue
+        while True:
+            self._ready.wait()
+            self._ready.clear()
+            while queue:
+                self.process(queue.popleft())
+                if self._waiting:
+                    with self._room:
+                        self._room.notify()
+            if self._closed and not queue:
+                return
+
+    def close(self, timeout=None):
+        """
+        Process what is queued, then stop the consumer
+        """
+        self._closed = True
+        self._ready.set()
+        if self.is_alive():
+            self.join(timeout)
@@ -0,0 +1,52 @@
+import time
+
+class startup_profile:
+    """
+    Wall time of startup phases (imports, settings, session setup), each measured from the previous mark, and of events such as logon
+    Enabled with STARTUP_PROFILE=Y; marks are always taken, they cost one perf_counter call each
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self._last = self.start
+        self.phases = []
+        self.events = []
+
+    def mark(self, phase):
+        """
+        End phase now
+        """
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def event(self, name, at=None):
+        """
+        Record a point in time (e.g. logon) measured from the start, outside the sequence of phases
+        """
+        self.events.append((name, (time.perf_counter() if at is None else at) - self.start))
+
+    def lines(self):
+        """
+        Report lines, one per phase and the total
+        """
+        lines = [f"Startup Profile (ms):"]
+        for phase, seconds in self.phases:
+            lines.append(f"{' ':5}{phase:24}: {seconds * 1000:10,.1f}")
+        lines.append(f"{' ':5}{'Total':24}: {(self._last - self.start) * 1000:10,.1f}")
+        for name, seconds in self.events:
+            lines.append(f"{' ':5}{name:24}: {seconds * 1000:10,.1f} after start")
+        return lines
+
+### Started on first import: import startup first, so the import time of every module after it is measured
+profile = startup_profile()
+_claimed = False
+
+def sessionProfile():
+    """
+    The import-time profile for the first session of a process, a fresh one for every later session
+    """
+    global _claimed
+    if _claimed:
+        return startup_profile()
+    _claimed = True
+    return profile
@@ -0,0 +1,216 @@
+import threading
+import numpy as np
+
+### Column layout of market data, in CSV column order
+### - category: interned codes (symbol, side, msgType, status...)
+### - float: numeric tags, NaN when missing
+### - string: free-form ids and timestamps, None when missing
+COLUMNS = {
+    "type": "category",
+    "11": "string", #ClOrdID
+    "54": "category", #Side
+    "55": "category", #Symbol
+    "38": "float", #OrderQty
+    "44": "float", #Price
+    "40": "category", #OrdType
+    "58": "category", #Text
+    "60": "string", #TransactTime
+    "37": "string", #OrderID
+    "35": "category", #MsgType
+    "52": "string", #SendingTime
+    "34": "float", #MsgSeqNum
+    "39": "category", #OrdStatus
+    "150": "category", #ExecType
+    "41": "string", #OrigClOrdID
+    "31": "float", #LastPx
+    "32": "float", #LastShares
+    "45": "float", #RefSeqNum
+    "371": "float", #RefTagID
+    "372": "category", #RefMsgType
+    "373": "float", #SessionRejectReason
+}
+
+DTYPES = {
+    "category": np.int8,
+    "float": np.float64,
+    "string": object,
+}
+
+MISSING = {
+    "category": -1,
+    "float": np.nan,
+    "string": None,
+}
+
+class execution_store:
+    """
+    Append-only, array-backed store of sent and received messages
+    Each column is a preallocated numpy array doubled when full; categorical columns hold interned codes
+    """
+    def __init__(self, capacity=1024):
+        self._lock = threading.Lock()
+        self._initial_capacity = capacity
+        self._capacity = capacity
+        self._length = 0
+        self._columns = {tag: self._allocate(kind, capacity) for tag, kind in COLUMNS.items()}
+        ### Category values and their codes per categorical column
+        self._categories = {tag: [] for tag, kind in COLUMNS.items() if kind == "category"}
+        self._codes = {tag: {} for tag in self._categories}
+        ### Set once batch_rows rows are buffered, see watch()
+        self._batch_rows = None
+        self._batch_ready = None
+
+    def __len__(self):
+        return self._length
+
+    def _allocate(self, kind, capacity):
+        column = np.empty(capacity, dtype=DTYPES[kind])
+        column.fill(MISSING[kind])
+        return column
+
+    def _grow(self):
+        """
+        Double capacity of every column
+        """
+        capacity = self._capacity * 2
+        for tag, column in self._columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self._length] = column[:self._length]
+            grown[self._length:] = MISSING[COLUMNS[tag]]
+            self._columns[tag] = grown
+        self._capacity = capacity
+
+    def _intern(self, tag, value):
+        """
+        Return code of value in categorical column tag, adding it when new
+        """
+        codes = self._codes[tag]
+        code = codes.get(value)
+        if code is None:
+            code = len(codes)
+            codes[value] = code
+            self._categories[tag].append(value)
+            ### Keep code width equal to what pandas picks for this many categories, so DataFrames share memory
+            if code == np.iinfo(self._columns[tag].dtype).max:
+                self._columns[tag] = self._columns[tag].astype(np.int16 if code < np.iinfo(np.int16).max else np.int32)
+        return code
+
+    def append(self, record):
+        """
+        Append one message given as {tag: value}; unknown tags are ignored
+        """
+        with self._lock:
+            if self._length == self._capacity:
+                self._grow()
+            row = self._length
+            for tag, value in record.items():
+                kind = COLUMNS.get(tag)
+                if kind is None or value is None:
+                    continue
+                if kind == "category":
+                    self._columns[tag][row] = self._intern(tag, str(value))
+                elif kind == "float":
+                    self._columns[tag][row] = value
+                else:
+                    self._columns[tag][row] = str(value)
+            self._length += 1
+            if self._batch_rows is not None and self._length >= self._batch_rows:
+                self._batch_ready.set()
+
+    def prepare(self, record):
+        """
+        Intern the constant fields of a record once, for appendPrepared
+        Returns ((tag, code or value), ...)
+        """
+        with self._lock:
+            prepared = []
+            for tag, value in record.items():
+                kind = COLUMNS.get(tag)
+                if kind is None or value is None:
+                    continue
+                prepared.append((tag, self._intern(tag, str(value)) if kind == "category" else value))
+            return tuple(prepared)
+
+    def appendPrepared(self, prepared, tags, values):
+        """
+        Append one message from prepare()d constant fields plus values of float/string tags, without building a dict
+        """
+        with self._lock:
+            if self._length == self._capacity:
+                self._grow()
+            row = self._length
+            columns = self._columns
+            for tag, value in prepared:
+                columns[tag][row] = value
+            for tag, value in zip(tags, values):
+                if value is not None:
+                    columns[tag][row] = value
+            self._length += 1
+            if self._batch_rows is not None and self._length >= self._batch_rows:
+                self._batch_ready.set()
+
+    def watch(self, batch_rows, event):
+        """
+        Set event whenever at least batch_rows rows are buffered
+        """
+        self._batch_rows = batch_rows
+        self._batch_ready = event
+
+    def _frame(self, columns, length):
+        ### pandas is only needed once rows are handed over, not on the send/receive path
+        import pandas as pd
+        data = {}
+        for tag, kind in COLUMNS.items():
+            column = columns[tag][:length]
+            if kind == "category":
+                column = pd.Categorical.from_codes(column, categories=list(self._categories[tag]))
+            data[tag] = column
+        return pd.DataFrame(data, copy=False)
+
+    def to_dataframe(self):
+        """
+        Return DataFrame view over the stored rows without copying the column buffers
+        """
+        with self._lock:
+            return self._frame(self._columns, self._length)
+
+    def _rows(self, columns, length, categories):
+        values = []
+        for tag, kind in COLUMNS.items():
+            column = columns[tag][:length].tolist()
+            if kind == "category":
+                column = [categories[tag][code] if code >= 0 else None for code in column]
+            elif kind == "float":
+                column = [None if value != value else value for value in column]
+            values.append(column)
+        return list(zip(*values))
+
+    def _take(self):
+        ### Swap in empty buffers and return the filled ones, caller holds the lock
+        columns, length = self._columns, self._length
+        self._capacity = self._initial_capacity
+        self._columns = {tag: self._allocate(kind, self._capacity) for tag, kind in COLUMNS.items()}
+        ### Keep widened code dtypes so codes of new categories still fit
+        for tag in self._categories:
+            self._columns[tag] = self._columns[tag].astype(columns[tag].dtype, copy=False)
+        self._length = 0
+        if self._batch_ready is not None:
+            self._batch_ready.clear()
+        return columns, length
+
+    def drain(self):
+        """
+        Hand over buffered rows as a DataFrame and start again with empty buffers
+        Category codes stay stable across drains
+        """
+        with self._lock:
+            return self._frame(*self._take())
+
+    def drainRows(self):
+        """
+        drain() without pandas: buffered rows as tuples in COLUMNS order, categories decoded, None when missing
+        """
+        with self._lock:
+            columns, length = self._take()
+            categories = {tag: list(values) for tag, values in self._categories.items()}
+        return self._rows(columns, length, categories)
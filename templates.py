@@ -0,0 +1,93 @@
+import time
+import quickfix
+
+class timestamp_cache:
+    """
+    UTC timestamp in FIX format (YYYYMMDD-HH:MM:SS.sss)
+    The seconds part is formatted once per second and the full string rebuilt only when the millisecond changes
+    """
+    __slots__ = ("_second", "_prefix", "_millisecond", "_value")
+
+    def __init__(self):
+        self._second = None
+        self._prefix = None
+        self._millisecond = None
+        self._value = None
+
+    def now(self):
+        millisecond = time.time_ns() // 1000000
+        if millisecond != self._millisecond:
+            second, fraction = divmod(millisecond, 1000)
+            if second != self._second:
+                self._second = second
+                self._prefix = time.strftime("%Y%m%d-%H:%M:%S", time.gmtime(second))
+            self._millisecond = millisecond
+            self._value = f"{self._prefix}.{fraction:03d}"
+        return self._value
+
+def formatNumber(value):
+    """
+    Format a qty/price as quickfix does for double fields (no trailing zeros)
+    """
+    return f"{value:.15g}"
+
+class order_template:
+    """
+    Pre-built message with the constant fields of an order set, and its constant store fields interned
+    Only ClOrdID, OrigClOrdID, OrderID, qty, price and TransactTime are patched per send
+    """
+    __slots__ = ("message", "record")
+
+    def __init__(self, message, record):
+        self.message = message
+        self.record = record
+
+class message_templates:
+    """
+    Cache of NewOrderSingle templates per (symbol, side, ordtype, handl_inst) and OrderCancelRequest templates per (symbol, side)
+    Template messages are reused, so sends through one cache must come from one thread at a time
+    """
+    def __init__(self, store):
+        self.store = store
+        self._new_orders = {}
+        self._cancels = {}
+
+    def newOrderSingle(self, symbol, side, ordtype, handl_inst):
+        key = (symbol, side, ordtype, handl_inst)
+        template = self._new_orders.get(key)
+        if template is None:
+            message = quickfix.Message()
+            message.getHeader().setField(quickfix.MsgType(quickfix.MsgType_NewOrderSingle))
+            message.setField(quickfix.Side(side)) #54
+            message.setField(quickfix.Symbol(symbol)) #55
+            message.setField(quickfix.OrdType(ordtype)) #40
+            message.setField(quickfix.HandlInst(handl_inst)) #21
+            message.setField(quickfix.TimeInForce('0')) #59
+            message.setField(quickfix.Text("NewOrderSingle")) #58
+            record = self.store.prepare({"type": "send", "54": side, "55": symbol, "40": ordtype, "58": "NewOrderSingle"})
+            template = self._new_orders[key] = order_template(message, record)
+        return template
+
+    def orderCancelRequest(self, symbol, side):
+        key = (symbol, side)
+        template = self._cancels.get(key)
+        if template is None:
+            message = quickfix.Message()
+            message.getHeader().setField(quickfix.MsgType(quickfix.MsgType_OrderCancelRequest))
+            message.setField(quickfix.Side(side)) #54
+            message.setField(quickfix.Symbol(symbol)) #55
+            message.setField(quickfix.Text("OrderCancelRequest")) #58
+            record = self.store.prepare({"type": "send", "54": side, "55": symbol, "58": "OrderCancelRequest"})
+            template = self._cancels[key] = order_template(message, record)
+        return template
+
+    def prewarm(self, symbols, sides, ordtypes, handl_insts):
+        """
+        Build the templates of every combination up front, e.g. while waiting for logon
+        """
+        for symbol in symbols:
+            for side in sides:
+                self.orderCancelRequest(symbol, side)
+                for ordtype in ordtypes:
+                    for handl_inst in handl_insts:
+                        self.newOrderSingle(symbol, side, ordtype, handl_inst)